@@ -1,4 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+from app.core.executors import pool_stats
+from app.core.startup import startup
+from app.infrastructure.persistence.payload_store import payload_stats
+from app.application.services.search_service import cache_stats
+from app.infrastructure.vectorstore.sharded_index import vector_index
 
 router = APIRouter(tags=["health"])
 
@@ -6,3 +12,19 @@ router = APIRouter(tags=["health"])
 @router.get("/health")
 def health() -> dict:
     return {"status": "ok"}
+
+
+@router.get("/ready")
+def ready(response: Response) -> dict:
+    # Readiness, unlike /health: 503 until the index and model are loaded and warmed up.
+    status = startup.status()
+    if not status["ready"]:
+        response.status_code = 503
+    elif not vector_index().serves_current_model():
+        status["degraded"] = "index awaits a rebuild for the current embedding model; searches are lexical"
+    return status
+
+
+@router.get("/stats")
+def stats() -> dict:
+    return {"caches": cache_stats(), "pools": pool_stats(), "payloads": payload_stats()}
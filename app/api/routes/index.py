@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+
+from app.infrastructure.vectorstore.sharded_index import ShardedIndex, sharding_enabled, vector_index
+
+router = APIRouter(tags=["index"])
+
+
+@router.get("/index/rebuild")
+def rebuild_status() -> dict:
+    return vector_index().rebuild_status()
+
+
+@router.post("/index/rebuild", status_code=202)
+def start_rebuild() -> dict:
+    # Starts (or resumes from its checkpoint) a full re-embedding; an active one is reported, not restarted.
+    try:
+        return vector_index().start_rebuild()
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@router.get("/index/shards")
+def shard_status() -> dict:
+    if not sharding_enabled():
+        raise HTTPException(status_code=400, detail="The index is not sharded (INDEX_SHARDS=1)")
+    try:
+        return ShardedIndex.shard_status()
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import List
 
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+
+from app.core.executors import PoolSaturatedError
 from app.api.schemas import IngestTextRequest
 from app.application.services.ingestion_service import ingest_text_document, ingest_file_document
+from app.application.services.bulk_ingestion_service import ingest_bulk_files, ingest_ndjson_stream
 
 router = APIRouter(tags=["ingest"])
 
 
 @router.post("/ingest/text")
-def ingest_text(req: IngestTextRequest) -> dict:
+async def ingest_text(req: IngestTextRequest) -> dict:
     try:
-        result = ingest_text_document(text=req.text, uri=req.uri)
+        result = await ingest_text_document(text=req.text, uri=req.uri)
         return result
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -20,7 +26,26 @@ async def ingest_file(file: UploadFile = File(...)) -> dict:
     try:
         result = await ingest_file_document(file)
         return result
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
+
+
+@router.post("/ingest/bulk")
+async def ingest_bulk(files: List[UploadFile] = File(...)) -> dict:
+    try:
+        return await ingest_bulk_files(files)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@router.post("/ingest/stream")
+async def ingest_stream(request: Request) -> dict:
+    # Body is NDJSON: one {"text": ..., "uri": ...} object per line.
+    try:
+        return await ingest_ndjson_stream(request.stream())
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
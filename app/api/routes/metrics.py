@@ -0,0 +1,40 @@
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from app.core.metrics import render
+from app.core.profiler import profiler
+
+router = APIRouter(tags=["metrics"])
+
+
+class ProfilerRequest(BaseModel):
+    enabled: Optional[bool] = None
+    interval_ms: Optional[float] = None
+    reset: bool = False
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/debug/profiler")
+def profiler_status(format: str = "json", limit: int = 0):
+    # `format=folded` returns the collapsed stacks for flamegraph.pl / speedscope.
+    if format == "folded":
+        return PlainTextResponse(profiler.folded(limit))
+    return profiler.status()
+
+
+@router.post("/debug/profiler")
+def configure_profiler(req: ProfilerRequest) -> dict:
+    if req.reset:
+        profiler.reset()
+    if req.enabled is False:
+        profiler.stop()
+    elif req.enabled or (req.interval_ms is not None and profiler.running):
+        profiler.start(req.interval_ms if req.interval_ms is not None else profiler.status()["interval_ms"])
+    return profiler.status()
@@ -1,27 +1,64 @@
+import json
+from typing import AsyncIterator, Dict, Tuple, Any
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
 from app.core.config import settings
+from app.core.executors import PoolSaturatedError
 from app.api.schemas import QARequest, CompletenessRequest
-from app.application.services.qa_service import answer_question_and_citations, completeness_check
+from app.application.services.qa_service import (
+    answer_question_and_citations,
+    completeness_check,
+    prepare_answer,
+    stream_answer,
+)
 
 router = APIRouter(tags=["qa"])
 
 
+async def _server_sent_events(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> AsyncIterator[str]:
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/qa")
-def qa(req: QARequest):
+async def qa(req: QARequest):
     try:
-        payload = answer_question_and_citations(
-            question=req.question, top_k=req.k or settings.TOP_K_DEFAULT, use_openai=req.use_openai
+        if req.stream:
+            # Retrieval runs before the response starts, so its errors still get a status code.
+            prepared = await prepare_answer(
+                question=req.question,
+                top_k=req.k or settings.TOP_K_DEFAULT,
+                use_openai=req.use_openai,
+                mode=req.mode,
+                filters=req.filters.model_dump() if req.filters else None,
+            )
+            return StreamingResponse(
+                _server_sent_events(stream_answer(prepared)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+        payload = await answer_question_and_citations(
+            question=req.question,
+            top_k=req.k or settings.TOP_K_DEFAULT,
+            use_openai=req.use_openai,
+            mode=req.mode,
+            filters=req.filters.model_dump() if req.filters else None,
         )
         return payload
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
 
 @router.post("/completeness")
-def completeness(req: CompletenessRequest) -> dict:
+async def completeness(req: CompletenessRequest) -> dict:
     try:
-        result = completeness_check(query=req.query, top_k=req.k or settings.TOP_K_DEFAULT)
+        result = await completeness_check(query=req.query, top_k=req.k or settings.TOP_K_DEFAULT)
         return result
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
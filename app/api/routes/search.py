@@ -1,16 +1,45 @@
 from typing import List
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 
 from app.core.config import settings
-from app.api.schemas import SearchRequest, SearchResult
-from app.application.services.search_service import search_documents
+from app.core.executors import PoolSaturatedError
+from app.api.schemas import BatchSearchRequest, SearchRequest, SearchResult
+from app.application.services.search_service import search_documents, search_documents_batch
 
 router = APIRouter(tags=["search"])
 
 
 @router.post("/search", response_model=List[SearchResult])
-def search(req: SearchRequest):
+async def search(req: SearchRequest, response: Response):
     try:
-        return search_documents(query=req.query, top_k=req.k or settings.TOP_K_DEFAULT)
+        retrieval = await search_documents(
+            query=req.query,
+            top_k=req.k or settings.TOP_K_DEFAULT,
+            mode=req.mode,
+            filters=req.filters.model_dump() if req.filters else None,
+        )
+        response.headers["Server-Timing"] = retrieval.server_timing()
+        return retrieval.results
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+@router.post("/search/batch", response_model=List[List[SearchResult]])
+async def search_batch(req: BatchSearchRequest, response: Response):
+    try:
+        retrieval = await search_documents_batch(
+            queries=req.queries,
+            top_k=req.k or settings.TOP_K_DEFAULT,
+            mode=req.mode,
+            filters=req.filters.model_dump() if req.filters else None,
+        )
+        response.headers["Server-Timing"] = retrieval.server_timing()
+        return retrieval.results
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except PoolSaturatedError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
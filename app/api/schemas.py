@@ -1,5 +1,8 @@
+from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+
+SearchMode = Literal["vector", "lexical", "hybrid"]
 
 
 class IngestTextRequest(BaseModel):
@@ -7,15 +10,37 @@ class IngestTextRequest(BaseModel):
     uri: Optional[str] = None
 
 
+class SearchFilters(BaseModel):
+    # All given fields must match; created_* bounds are [after, before).
+    source_type: Optional[str] = None
+    uri_prefix: Optional[str] = None
+    document_ids: Optional[List[int]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+
 class SearchRequest(BaseModel):
     query: str
     k: int = 5
+    mode: Optional[SearchMode] = None
+    filters: Optional[SearchFilters] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
+    mode: Optional[SearchMode] = None
+    filters: Optional[SearchFilters] = None
 
 
 class QARequest(BaseModel):
     question: str
     k: int = 5
     use_openai: bool = False
+    mode: Optional[SearchMode] = None
+    filters: Optional[SearchFilters] = None
+    # Server-sent events: citations, then answer tokens as they arrive, then done.
+    stream: bool = False
 
 
 class CompletenessRequest(BaseModel):
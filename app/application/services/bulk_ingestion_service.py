@@ -0,0 +1,356 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.executors import get_process_pool
+from app.core.metrics import BATCH_SIZE, stage
+from app.infrastructure.persistence.models import Document
+from app.infrastructure.persistence.payload_store import forget_chunks, mirror_chunks
+from app.infrastructure.text.chunking import TextChunk, get_chunker
+from app.infrastructure.parsers.pdf_reader import extract_text_from_bytes
+from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+from app.infrastructure.vectorstore.sharded_index import vector_index
+from app.application.services.ingestion_service import (
+    SUPPORTED_EXTENSIONS,
+    _find_by_uri,
+    _maybe_skip_existing,
+    _persist_chunks,
+    _persist_document,
+    _update_document,
+)
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class _Item:
+    position: int
+    uri: Optional[str]
+    source_type: str
+    text: Optional[str] = None
+    data: Optional[bytes] = None
+    ext: str = ".txt"
+    sha256: Optional[str] = None
+
+
+@dataclass
+class _DocWork:
+    position: int
+    uri: Optional[str]
+    source_type: str
+    sha256: str
+    parts: List[TextChunk]
+    vectors: Optional[np.ndarray] = None
+
+
+# parse (process pool) -> chunk -> embed (cross-document batches) -> persist (batched
+# transactions). Stages are connected by bounded queues, so a slow stage blocks
+# `submit` instead of buffering the whole backlog in memory.
+class BulkIngestionPipeline:
+    def __init__(self) -> None:
+        size = max(1, settings.BULK_QUEUE_SIZE)
+        self._parse_q: "queue.Queue[Any]" = queue.Queue(maxsize=size)
+        self._chunk_q: "queue.Queue[Any]" = queue.Queue(maxsize=size)
+        self._embed_q: "queue.Queue[Any]" = queue.Queue(maxsize=size)
+        self._persist_q: "queue.Queue[Any]" = queue.Queue(maxsize=size)
+        self._statuses: Dict[int, Dict[str, Any]] = {}
+        self._status_lock = threading.Lock()
+        self._count = 0
+        num_parsers = max(1, settings.PARSE_WORKERS or os.cpu_count() or 1)
+        self._parsers = [
+            threading.Thread(target=self._parse_loop, name=f"bulk-parse-{i}", daemon=True) for i in range(num_parsers)
+        ]
+        self._chunker = threading.Thread(target=self._chunk_loop, name="bulk-chunk", daemon=True)
+        self._embedder = threading.Thread(target=self._embed_loop, name="bulk-embed", daemon=True)
+        self._persister = threading.Thread(target=self._persist_loop, name="bulk-persist", daemon=True)
+
+    def start(self) -> "BulkIngestionPipeline":
+        for thread in [*self._parsers, self._chunker, self._embedder, self._persister]:
+            thread.start()
+        return self
+
+    def _next_position(self) -> int:
+        with self._status_lock:
+            position = self._count
+            self._count += 1
+            return position
+
+    def submit(
+        self, *, uri: Optional[str], source_type: str, text: Optional[str] = None, data: Optional[bytes] = None, ext: str = ".txt"
+    ) -> int:
+        position = self._next_position()
+        self._parse_q.put(_Item(position=position, uri=uri, source_type=source_type, text=text, data=data, ext=ext))
+        return position
+
+    def reject(self, *, uri: Optional[str], error: str) -> int:
+        position = self._next_position()
+        self._record(position, uri, "failed", error=error)
+        return position
+
+    def finish(self) -> List[Dict[str, Any]]:
+        for _ in self._parsers:
+            self._parse_q.put(_DONE)
+        for thread in self._parsers:
+            thread.join()
+        self._chunk_q.put(_DONE)
+        for thread in (self._chunker, self._embedder, self._persister):
+            thread.join()
+        # Single durable index flush for the whole batch.
+        vector_index().compact()
+        with self._status_lock:
+            return [self._statuses[i] for i in range(self._count)]
+
+    def _record(self, position: int, uri: Optional[str], status: str, **fields: Any) -> None:
+        with self._status_lock:
+            self._statuses[position] = {"uri": uri, "status": status, **fields}
+
+    def _parse_loop(self) -> None:
+        while True:
+            item = self._parse_q.get()
+            if item is _DONE:
+                return
+            try:
+                if item.data is None:
+                    text = item.text or ""
+                elif item.ext == ".pdf":
+                    # Same key as /ingest/file: PDFs are deduplicated by file bytes, so an
+                    # unchanged upload is skipped before any page is parsed.
+                    item.sha256 = hashlib.sha256(item.data).hexdigest()
+                    if self._skip_existing(item, item.sha256):
+                        continue
+                    text = get_process_pool().submit(extract_text_from_bytes, item.data).result()
+                else:
+                    text = item.data.decode("utf-8", errors="ignore")
+                item.data = None
+                self._chunk_q.put((item, text))
+            except Exception as exc:
+                self._record(item.position, item.uri, "failed", error=str(exc))
+
+    def _skip_existing(self, item: _Item, content_hash: str) -> bool:
+        with SessionLocal() as session:
+            existing = session.query(Document).filter(Document.sha256 == content_hash).first()
+        if existing is None:
+            return False
+        self._record(item.position, item.uri, "skipped", document_id=int(existing.id), num_chunks=int(existing.num_chunks))
+        return True
+
+    def _chunk_loop(self) -> None:
+        chunker = get_chunker()
+        while True:
+            got = self._chunk_q.get()
+            if got is _DONE:
+                self._embed_q.put(_DONE)
+                return
+            item, text = got
+            try:
+                hasher = hashlib.sha256()
+                parts = list(chunker.chunks([text], hasher))
+                if not parts:
+                    self._record(item.position, item.uri, "empty", num_chunks=0)
+                    continue
+                content_hash = item.sha256 or hasher.hexdigest()
+                if self._skip_existing(item, content_hash):
+                    continue
+                self._embed_q.put(_DocWork(item.position, item.uri, item.source_type, content_hash, parts))
+            except Exception as exc:
+                self._record(item.position, item.uri, "failed", error=str(exc))
+
+    def _embed_loop(self) -> None:
+        batch_size = max(1, settings.BULK_EMBED_BATCH_SIZE)
+        done = False
+        while not done:
+            pending: List[_DocWork] = []
+            pending_chunks = 0
+            work = self._embed_q.get()
+            while True:
+                if work is _DONE:
+                    done = True
+                    break
+                pending.append(work)
+                pending_chunks += len(work.parts)
+                if pending_chunks >= batch_size:
+                    break
+                try:
+                    work = self._embed_q.get_nowait()
+                except queue.Empty:
+                    break
+            if pending:
+                self._embed_batch(pending)
+        self._persist_q.put(_DONE)
+
+    def _embed_batch(self, pending: List[_DocWork]) -> None:
+        texts = [part.text for work in pending for part in work.parts]
+        BATCH_SIZE.observe(len(texts), operation="bulk_embed")
+        try:
+            with stage("bulk", "embed"):
+                vectors = embed_texts_cached(texts)
+        except Exception as exc:
+            for work in pending:
+                self._record(work.position, work.uri, "failed", error=str(exc))
+            return
+        offset = 0
+        for work in pending:
+            work.vectors = vectors[offset:offset + len(work.parts)]
+            offset += len(work.parts)
+            self._persist_q.put(work)
+
+    def _persist_loop(self) -> None:
+        max_docs = max(1, settings.BULK_PERSIST_BATCH_DOCS)
+        done = False
+        while not done:
+            group: List[_DocWork] = []
+            work = self._persist_q.get()
+            while True:
+                if work is _DONE:
+                    done = True
+                    break
+                group.append(work)
+                if len(group) >= max_docs:
+                    break
+                try:
+                    work = self._persist_q.get_nowait()
+                except queue.Empty:
+                    break
+            if group:
+                BATCH_SIZE.observe(len(group), operation="bulk_persist_docs")
+                try:
+                    with stage("bulk", "persist"):
+                        self._persist_group(group)
+                except Exception as exc:
+                    # E.g. a rollback on a dropped connection. The thread has to keep draining,
+                    # or the embed stage blocks on a full queue and finish() never returns.
+                    logger.exception("Bulk persist failed")
+                    with self._status_lock:
+                        unrecorded = [work for work in group if work.position not in self._statuses]
+                    for work in unrecorded:
+                        self._record(work.position, work.uri, "failed", error=str(exc))
+
+    def _persist_group(self, group: List[_DocWork]) -> None:
+        committed: List[Tuple[_DocWork, int, List[int]]] = []
+        try:
+            self._commit_group(group, committed)
+        finally:
+            # Whatever was committed before a failure is indexed all the same.
+            if committed:
+                self._index_group(committed)
+
+    def _commit_group(self, group: List[_DocWork], committed: List[Tuple[_DocWork, int, List[int]]]) -> None:
+        with SessionLocal() as session:
+            for work in group:
+                try:
+                    # Re-checked here: an identical document may have been persisted earlier in this batch.
+                    existing = _maybe_skip_existing(session, work.sha256)
+                    if existing is not None:
+                        self._record(
+                            work.position, work.uri, "skipped", document_id=int(existing.id), num_chunks=int(existing.num_chunks)
+                        )
+                        continue
+                    previous = _find_by_uri(session, work.uri)
+                    if previous is not None:
+                        result = _update_document(session, previous, work.parts, work.sha256, work.vectors)
+                        self._record(work.position, work.uri, **result)
+                        continue
+                    doc = _persist_document(
+                        session, uri=work.uri, source_type=work.source_type, sha256=work.sha256, num_chunks=len(work.parts)
+                    )
+                    doc_ids = _persist_chunks(session, doc.id, work.parts)
+                    session.commit()
+                    mirror_chunks(int(doc.id), work.uri, doc_ids, range(len(work.parts)), [p.text for p in work.parts])
+                    committed.append((work, int(doc.id), doc_ids))
+                    self._record(work.position, work.uri, "ingested", document_id=int(doc.id), num_chunks=len(work.parts))
+                except Exception as exc:
+                    self._record(work.position, work.uri, "failed", error=str(exc))
+                    session.rollback()
+
+    def _index_group(self, committed: List[Tuple[_DocWork, int, List[int]]]) -> None:
+        ids = [cid for _, _, doc_ids in committed for cid in doc_ids]
+        try:
+            vectors = np.vstack([work.vectors for work, _, _ in committed if work.vectors is not None])
+            with stage("bulk", "index"):
+                vector_index().add(vectors, ids)
+        except Exception as exc:
+            for work, _, _ in committed:
+                self._record(work.position, work.uri, "failed", error=f"indexing failed: {exc}")
+            self._discard([doc_id for _, doc_id, _ in committed], ids)
+
+    @staticmethod
+    def _discard(doc_ids: List[int], chunk_ids: List[int]) -> None:
+        # Documents whose vectors never reached the index are deleted again: left in place,
+        # their sha256 would make a retry report them skipped.
+        try:
+            forget_chunks(chunk_ids)
+            with SessionLocal() as session:
+                for doc in session.query(Document).filter(Document.id.in_(doc_ids)).all():
+                    session.delete(doc)
+                session.commit()
+        except Exception:
+            logger.exception("Could not remove %d unindexed documents", len(doc_ids))
+
+
+def _summarize(documents: List[Dict[str, Any]]) -> dict:
+    counts = Counter(d["status"] for d in documents)
+    return {
+        "documents": documents,
+        "total": len(documents),
+        **{status: counts.get(status, 0) for status in ("ingested", "updated", "skipped", "empty", "failed")},
+    }
+
+
+async def ingest_bulk_files(files: List[UploadFile]) -> dict:
+    pipeline = BulkIngestionPipeline().start()
+    try:
+        for file in files:
+            filename = file.filename or "uploaded"
+            ext = os.path.splitext(filename.lower())[1]
+            if ext not in SUPPORTED_EXTENSIONS:
+                pipeline.reject(uri=filename, error="Only .txt and .pdf are supported for this prototype")
+                continue
+            data = await file.read()
+            await run_in_threadpool(pipeline.submit, uri=filename, source_type="file", data=data, ext=ext)
+    finally:
+        documents = await run_in_threadpool(pipeline.finish)
+    return _summarize(documents)
+
+
+async def ingest_ndjson_stream(stream: AsyncIterator[bytes]) -> dict:
+    pipeline = BulkIngestionPipeline().start()
+
+    async def _submit_line(line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            record = json.loads(line)
+            text = record["text"]
+            uri = record.get("uri")
+            if not isinstance(text, str):
+                raise ValueError("'text' must be a string")
+        except Exception as exc:
+            pipeline.reject(uri=None, error=f"invalid record: {exc}")
+            return
+        await run_in_threadpool(pipeline.submit, uri=uri, source_type="api", text=text)
+
+    try:
+        buffer = b""
+        async for piece in stream:
+            buffer += piece
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                await _submit_line(line)
+        await _submit_line(buffer)
+    finally:
+        documents = await run_in_threadpool(pipeline.finish)
+    return _summarize(documents)
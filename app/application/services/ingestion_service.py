@@ -1,18 +1,32 @@
+import difflib
 import hashlib
 import os
-import tempfile
-from typing import List, Tuple, Optional
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple, Optional
 
+import numpy as np
 from fastapi import UploadFile
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session  
 
 from app.core.config import settings
 from app.core.db import SessionLocal
+from app.core.executors import get_pool, get_process_pool
+from app.core.metrics import stage
+from app.infrastructure.persistence.bulk import insert_chunks
 from app.infrastructure.persistence.models import Document, Chunk
-from app.infrastructure.text.text_utils import chunk_text, estimate_tokens, clean_text
-from app.infrastructure.parsers.pdf_reader import extract_text_pages
-from app.infrastructure.embeddings.sentence_transformer_provider import embed_texts
-from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.infrastructure.persistence.payload_store import forget_chunks, mirror_chunks
+from app.infrastructure.text.chunking import TextChunk, get_chunker
+from app.infrastructure.parsers.pdf_reader import SharedPdf
+from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+from app.infrastructure.vectorstore.sharded_index import vector_index
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+_inflight_lock = threading.Lock()
+_inflight: Dict[str, Tuple[threading.Lock, int]] = {}
 
 
 def _sha256_bytes(data: bytes) -> str:
@@ -28,84 +42,224 @@ def _sha256_text(text: str) -> str:
 def _persist_document(session: Session, *, uri: Optional[str], source_type: str, sha256: str, num_chunks: int) -> Document:
     doc = Document(uri=uri, source_type=source_type, sha256=sha256, num_chunks=num_chunks)
     session.add(doc)
-    session.commit()
-    session.refresh(doc)
+    # Flushed for its id only; the caller commits the document together with its chunks.
+    session.flush()
     return doc
 
 
-def _persist_chunks(session: Session, document_id: int, chunks: List[str]) -> List[Chunk]:
-    chunk_rows: List[Chunk] = []
-    for idx, content in enumerate(chunks):
-        row = Chunk(document_id=document_id, chunk_index=idx, content=content, token_count=estimate_tokens(content))
-        session.add(row)
-        chunk_rows.append(row)
+def _persist_chunks(
+    session: Session, document_id: int, chunks: List[TextChunk], indexes: Optional[List[int]] = None
+) -> List[int]:
+    if not chunks:
+        return []
+    positions = indexes if indexes is not None else range(len(chunks))
+    rows = [
+        {"document_id": document_id, "chunk_index": idx, "content": chunk.text, "token_count": chunk.token_count}
+        for idx, chunk in zip(positions, chunks)
+    ]
+    return insert_chunks(session, rows)
+
+
+def _index_chunks(
+    doc: Document, ids: List[int], chunks: List[TextChunk], indexes: Optional[List[int]] = None, vectors: Optional[np.ndarray] = None
+) -> None:
+    positions = indexes if indexes is not None else range(len(chunks))
+    mirror_chunks(int(doc.id), doc.uri, ids, positions, [c.text for c in chunks])
+    if vectors is None:
+        with stage("ingest", "embed"):
+            vectors = embed_texts_cached([c.text for c in chunks])
+    with stage("ingest", "index"):
+        vector_index().add(vectors, ids)
+
+
+def _maybe_skip_existing(session: Session, sha256: str) -> Optional[Document]:
+    return session.query(Document).filter(Document.sha256 == sha256).first()
+
+
+def _find_by_uri(session: Session, uri: Optional[str]) -> Optional[Document]:
+    if not uri:
+        return None
+    return session.query(Document).filter(Document.uri == uri).first()
+
+
+def _update_document(
+    session: Session, doc: Document, parts: List[TextChunk], sha256: str, vectors: Optional[np.ndarray] = None
+) -> dict:
+    # Align old and new chunk sequences by content hash: matched chunks keep their row,
+    # id and vector (only their position is updated); the rest is deleted or inserted.
+    old_rows = sorted(doc.chunks, key=lambda c: c.chunk_index)
+    old_hashes = [_sha256_text(c.content) for c in old_rows]
+    new_hashes = [_sha256_text(p.text) for p in parts]
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    removed: List[Chunk] = []
+    moved_rows: List[Chunk] = []
+    inserted: List[int] = []
+    unchanged = moved = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for row, new_index in zip(old_rows[i1:i2], range(j1, j2)):
+                if row.chunk_index != new_index:
+                    row.chunk_index = new_index
+                    moved_rows.append(row)
+                    moved += 1
+                else:
+                    unchanged += 1
+            continue
+        removed.extend(old_rows[i1:i2])
+        inserted.extend(range(j1, j2))
+    removed_ids = [int(c.id) for c in removed]
+    # Captured before the commit expires the rows.
+    moved_ids = [int(r.id) for r in moved_rows]
+    moved_indexes = [int(r.chunk_index) for r in moved_rows]
+    moved_texts = [r.content for r in moved_rows]
+    for row in removed:
+        doc.chunks.remove(row)
+    doc.sha256 = sha256
+    doc.num_chunks = len(parts)
+    session.flush()
+    new_ids = _persist_chunks(session, doc.id, [parts[j] for j in inserted], inserted)
     session.commit()
-    for row in chunk_rows:
-        session.refresh(row)
-    return chunk_rows
-
-
-def _index_chunks(chunks: List[Chunk]) -> None:
-    texts = [c.content for c in chunks]
-    vectors = embed_texts(texts)
-    ids = [int(c.id) for c in chunks]
-    VectorIndex.add(vectors, ids)
-
-
-def _maybe_skip_existing(session: Session, sha256: str, uri: Optional[str]) -> Optional[Document]:
-    existing = session.query(Document).filter(Document.sha256 == sha256).first()
-    if existing is not None:
-        return existing
-    if uri:
-        existing_uri = session.query(Document).filter(Document.uri == uri).first()
-        if existing_uri is not None:
-            old_chunk_ids = [c.id for c in existing_uri.chunks]
-            VectorIndex.remove_ids(old_chunk_ids)
-            session.delete(existing_uri)
-            session.commit()
-    return None
+    vector_index().remove_ids(removed_ids)
+    forget_chunks(removed_ids)
+    mirror_chunks(int(doc.id), doc.uri, moved_ids, moved_indexes, moved_texts)
+    if moved_ids:
+        # A search between the removal above and the mirror may have cached moved chunks
+        # under their old chunk_index (and with no removal, nothing else moves the generation).
+        vector_index().touch()
+    if new_ids:
+        _index_chunks(
+            doc, new_ids, [parts[j] for j in inserted], inserted, vectors[inserted] if vectors is not None else None
+        )
+    return {
+        "status": "updated",
+        "document_id": int(doc.id),
+        "num_chunks": len(parts),
+        "changes": {"unchanged": unchanged, "moved": moved, "inserted": len(inserted), "removed": len(removed_ids)},
+    }
 
 
 def _ingest_text_core(text: str, uri: Optional[str], source_type: str) -> dict:
-    cleaned = clean_text(text)
-    if not cleaned:
+    hasher = hashlib.sha256()
+    with stage("ingest", "chunk"):
+        parts = list(get_chunker().chunks([text], hasher))
+    if not parts:
         return {"status": "empty", "num_chunks": 0}
-    parts = chunk_text(cleaned, settings.CHUNK_SIZE_CHARS, settings.CHUNK_OVERLAP_CHARS)
-    content_hash = _sha256_text(cleaned)
+    content_hash = hasher.hexdigest()
     with SessionLocal() as session:
-        existing = _maybe_skip_existing(session, content_hash, uri)
+        existing = _maybe_skip_existing(session, content_hash)
         if existing is not None:
             return {"status": "skipped", "document_id": int(existing.id), "num_chunks": int(existing.num_chunks)}
-        doc = _persist_document(session, uri=uri, source_type=source_type, sha256=content_hash, num_chunks=len(parts))
-        chunk_rows = _persist_chunks(session, doc.id, parts)
-        _index_chunks(chunk_rows)
+        previous = _find_by_uri(session, uri)
+        if previous is not None:
+            return _update_document(session, previous, parts, content_hash)
+        with stage("ingest", "persist"):
+            doc = _persist_document(session, uri=uri, source_type=source_type, sha256=content_hash, num_chunks=len(parts))
+            chunk_ids = _persist_chunks(session, doc.id, parts)
+            session.commit()
+        _index_chunks(doc, chunk_ids, parts)
         return {"status": "ingested", "document_id": int(doc.id), "num_chunks": len(parts)}
 
 
-def ingest_text_document(*, text: str, uri: Optional[str] = None) -> dict:
-    return _ingest_text_core(text=text, uri=uri, source_type="api")
+def _batched(items: Iterable[TextChunk], size: int) -> Iterator[List[TextChunk]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def _exclusive(key: str) -> Iterator[None]:
+    # Serializes work on one key within the process (the same upload arriving twice).
+    with _inflight_lock:
+        lock, users = _inflight.get(key, (threading.Lock(), 0))
+        _inflight[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _inflight_lock:
+            lock, users = _inflight[key]
+            if users == 1:
+                del _inflight[key]
+            else:
+                _inflight[key] = (lock, users - 1)
+
+
+def _persist_streamed(session: Session, *, uri: Optional[str], source_type: str, sha256: str, chunks: Iterable[TextChunk]) -> dict:
+    # Chunks are persisted, embedded and indexed batch by batch as they arrive, so only one
+    # batch of text is held at a time. A failure part-way removes everything written so far.
+    # The content hash is only stored with the last commit: a document cut short by a crash
+    # never makes a re-upload look unchanged, it is found by uri and completed instead.
+    doc: Optional[Document] = None
+    indexed: List[int] = []
+    total = 0
+    try:
+        for batch in _batched(chunks, max(1, settings.BULK_EMBED_BATCH_SIZE)):
+            if doc is None:
+                doc = _persist_document(session, uri=uri, source_type=source_type, sha256="", num_chunks=0)
+            positions = list(range(total, total + len(batch)))
+            with stage("ingest", "persist"):
+                ids = _persist_chunks(session, doc.id, batch, positions)
+                session.commit()
+            _index_chunks(doc, ids, batch, positions)
+            indexed.extend(ids)
+            total += len(batch)
+        if doc is None:
+            return {"status": "empty", "num_chunks": 0}
+        doc.sha256 = sha256
+        doc.num_chunks = total
+        session.commit()
+        return {"status": "ingested", "document_id": int(doc.id), "num_chunks": total}
+    except Exception:
+        session.rollback()
+        if indexed:
+            vector_index().remove_ids(indexed)
+            forget_chunks(indexed)
+        # A document whose first commit never happened is gone with the rollback.
+        if doc is not None and inspect(doc).persistent:
+            session.delete(doc)
+            session.commit()
+        raise
+
+
+def _ingest_pdf_stream(stream: BinaryIO, uri: str) -> dict:
+    # PDFs are deduplicated by file bytes, hashed while the upload is copied into shared memory,
+    # so an unchanged upload is skipped before any page is parsed.
+    hasher = hashlib.sha256()
+    with SharedPdf.from_stream(stream, hasher) as pdf:
+        sha256 = hasher.hexdigest()
+        pool = get_process_pool()
+        max_pending = settings.PDF_MAX_PENDING_TASKS or 2 * pool.max_workers
+        pages = pdf.iter_pages(pool, settings.PDF_PAGES_PER_TASK, max_pending)
+        chunks = get_chunker().chunks(pages)
+        # A second copy of an upload still being written waits for it and is then skipped.
+        with _exclusive(sha256), SessionLocal() as session:
+            existing = _maybe_skip_existing(session, sha256)
+            if existing is not None:
+                return {"status": "skipped", "document_id": int(existing.id), "num_chunks": int(existing.num_chunks)}
+            previous = _find_by_uri(session, uri)
+            if previous is None:
+                return _persist_streamed(session, uri=uri, source_type="file", sha256=sha256, chunks=chunks)
+            parts = list(chunks)
+            if not parts:
+                return {"status": "empty", "num_chunks": 0}
+            return _update_document(session, previous, parts, sha256)
+
+
+async def ingest_text_document(*, text: str, uri: Optional[str] = None) -> dict:
+    return await get_pool("ingest").run(_ingest_text_core, text, uri, "api")
 
 
 async def ingest_file_document(file: UploadFile) -> dict:
     filename = file.filename or "uploaded"
     ext = os.path.splitext(filename.lower())[1]
-    if ext not in [".txt", ".pdf"]:
+    if ext not in SUPPORTED_EXTENSIONS:
         raise ValueError("Only .txt and .pdf are supported for this prototype")
+    if ext == ".pdf":
+        # Read straight from the spooled upload; the body is never buffered as one bytes object.
+        return await get_pool("ingest").run(_ingest_pdf_stream, file.file, filename)
     data = await file.read()
-    if ext == ".txt":
-        text = data.decode("utf-8", errors="ignore")
-        return _ingest_text_core(text=text, uri=filename, source_type="file")
-    else:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            tmp.write(data)
-            tmp.flush()
-            temp_path = tmp.name
-        try:
-            pages = list(extract_text_pages(temp_path))
-            combined = "\n\n".join(pages)
-            return _ingest_text_core(text=combined, uri=filename, source_type="file")
-        finally:
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
+    text = data.decode("utf-8", errors="ignore")
+    return await get_pool("ingest").run(_ingest_text_core, text, filename, "file")
@@ -1,16 +1,53 @@
-from typing import Dict, Any, List
+import importlib.util
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple
 import os
+import time
 
 import numpy as np  
 
 from app.core.config import settings
-from app.infrastructure.embeddings.sentence_transformer_provider import embed_query
-from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.core.executors import get_pool
+from app.core.metrics import record_stage
+from app.application.services.search_service import document_filter, retrieve_with_timings
+from app.infrastructure.cache.answer_cache import answer_cache
+from app.infrastructure.text.text_utils import estimate_tokens
 
-try:
-    from openai import OpenAI  
-except Exception:
-    OpenAI = None  
+# The OpenAI client (and httpx) are imported on first use; they add noticeably to startup.
+_openai_installed = importlib.util.find_spec("openai") is not None
+
+logger = logging.getLogger(__name__)
+
+_llm_client: Any = None
+
+
+def _get_llm_client() -> Any:
+    # One client per process so HTTP connections to the API are pooled and reused.
+    global _llm_client
+    if _llm_client is None:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        _llm_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            timeout=settings.OPENAI_TIMEOUT_SECONDS,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                )
+            ),
+        )
+    return _llm_client
+
+
+async def close_llm_client() -> None:
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
 
 
 def _format_citations(chunks: List[dict]) -> str:
@@ -24,35 +61,215 @@ def _format_citations(chunks: List[dict]) -> str:
     return "\n".join(lines)
 
 
-def answer_question_and_citations(*, question: str, top_k: int, use_openai: bool = False) -> Dict[str, Any]:
-    q_vec = embed_query(question)
-    chunks = VectorIndex.search(q_vec, top_k)
-    if use_openai and settings.OPENAI_API_KEY and OpenAI is not None:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        context = _format_citations(chunks)
-        prompt = (
-            "You are a helpful assistant. Answer the user's question using ONLY the context provided.\n"
-            "If the answer cannot be found in the context, say you don't know.\n\n"
-            f"Context:\n{context}\n\nQuestion: {question}\nAnswer:"
+def _format_context(chunks: List[dict]) -> str:
+    # Packed chunks go in whole; the budget, not a per-snippet cut, bounds the prompt.
+    lines = []
+    for i, c in enumerate(chunks, start=1):
+        uri = c.get("uri") or f"doc-{c.get('document_id')}"
+        lines.append(f"[{i}] ({uri}) {c.get('content', '').strip()}")
+    return "\n".join(lines)
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def pack_context(chunks: List[dict], max_tokens: int, dedup_threshold: float) -> List[dict]:
+    # Rank order is kept. Near-duplicates (overlapping windows, re-ingested copies) are
+    # dropped; the first chunk that no longer fits is cut to the remaining budget, and
+    # packing stops there.
+    packed: List[dict] = []
+    seen: List[Set[Tuple[str, ...]]] = []
+    remaining = max_tokens
+    for chunk in chunks:
+        content = chunk.get("content", "").strip()
+        shingles = _shingles(content)
+        if dedup_threshold < 1.0 and any(
+            len(shingles & other) / max(1, len(shingles | other)) >= dedup_threshold for other in seen
+        ):
+            continue
+        tokens = estimate_tokens(content)
+        if tokens > remaining:
+            if remaining >= 32 or not packed:
+                packed.append({**chunk, "content": " ".join(content.split()[:max(1, remaining)]) + " ..."})
+            break
+        packed.append(chunk)
+        seen.append(shingles)
+        remaining -= tokens
+    return packed
+
+
+def _prompt(question: str, chunks: List[dict]) -> str:
+    return (
+        "You are a helpful assistant. Answer the user's question using ONLY the context provided.\n"
+        "If the answer cannot be found in the context, say you don't know.\n\n"
+        f"Context:\n{_format_context(chunks)}\n\nQuestion: {question}\nAnswer:"
+    )
+
+
+def _llm_enabled(use_openai: bool) -> bool:
+    return use_openai and bool(settings.OPENAI_API_KEY) and _openai_installed
+
+
+@dataclass
+class PreparedAnswer:
+    question: str
+    use_llm: bool
+    mode: str
+    citations: List[Dict[str, Any]]
+    timings: Dict[str, float]
+    cache_key: Optional[str] = None
+    cached: Optional[str] = None
+
+
+async def prepare_answer(
+    *,
+    question: str,
+    top_k: int,
+    use_openai: bool = False,
+    mode: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> PreparedAnswer:
+    # Retrieval, packing and the answer cache lookup: everything before the LLM call, so a
+    # streaming response can send the citations right away.
+    retrieval = await get_pool("search").run(retrieve_with_timings, question, top_k, mode, document_filter(filters))
+    timings = dict(retrieval.timings)
+    use_llm = _llm_enabled(use_openai)
+    if not use_llm:
+        return PreparedAnswer(question, False, retrieval.mode, retrieval.results, timings)
+    started = time.perf_counter()
+    chunks = pack_context(retrieval.results, settings.QA_CONTEXT_MAX_TOKENS, settings.QA_DEDUP_THRESHOLD)
+    prepared = PreparedAnswer(question, True, retrieval.mode, chunks, timings)
+    if answer_cache.enabled:
+        prepared.cache_key = answer_cache.key(question, chunks, settings.OPENAI_MODEL)
+        prepared.cached = await get_pool("search").run(answer_cache.get, prepared.cache_key)
+    elapsed = time.perf_counter() - started
+    timings["pack"] = elapsed * 1000.0
+    record_stage("qa", "pack", elapsed)
+    return prepared
+
+
+async def _remember(prepared: PreparedAnswer, answer: str) -> None:
+    if prepared.cache_key is not None and answer:
+        try:
+            await get_pool("search").run(answer_cache.put, prepared.cache_key, settings.OPENAI_MODEL, answer)
+        except Exception as exc:
+            logger.warning("Could not cache the answer: %s", exc)
+
+
+async def stream_answer(prepared: PreparedAnswer) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    # (event, data) pairs: citations first, then answer tokens as the model produces them,
+    # then done. A cached or retrieval-only answer arrives as a single token event.
+    yield "citations", {"citations": prepared.citations, "mode": prepared.mode, "timings": dict(prepared.timings)}
+    timings: Dict[str, float] = {}
+    if not prepared.use_llm:
+        yield "token", {"text": "Retrieval-only mode. Provide your own synthesis using these snippets:\n\n" + _format_citations(prepared.citations)}
+        yield "done", {"cached": False, "timings": timings}
+        return
+    if prepared.cached is not None:
+        yield "token", {"text": prepared.cached}
+        yield "done", {"cached": True, "timings": timings}
+        return
+    client = _get_llm_client()
+    started = time.perf_counter()
+    parts: List[str] = []
+    try:
+        stream = await client.chat.completions.create(
+            model=settings.OPENAI_MODEL,
+            messages=[{"role": "user", "content": _prompt(prepared.question, prepared.citations)}],
+            temperature=0.0,
+            stream=True,
         )
+        # Closing the stream early (a client that went away) releases the upstream connection.
+        async with stream:
+            async for event in stream:
+                text = event.choices[0].delta.content if event.choices else None
+                if not text:
+                    continue
+                if not parts:
+                    first = time.perf_counter() - started
+                    timings["first_token"] = first * 1000.0
+                    record_stage("qa", "first_token", first)
+                parts.append(text)
+                yield "token", {"text": text}
+    except Exception as e:
+        if parts:
+            # Tokens already went out; the client is told the answer is incomplete.
+            yield "error", {"detail": f"LLM error: {e}"}
+        else:
+            yield "token", {"text": f"Retrieval-only fallback due to LLM error: {e}\n\n" + _format_citations(prepared.citations)}
+        yield "done", {"cached": False, "timings": timings}
+        return
+    finally:
+        elapsed = time.perf_counter() - started
+        timings["llm"] = elapsed * 1000.0
+        record_stage("qa", "llm", elapsed)
+    await _remember(prepared, "".join(parts))
+    yield "done", {"cached": False, "timings": timings}
+
+
+async def answer_question_and_citations(
+    *,
+    question: str,
+    top_k: int,
+    use_openai: bool = False,
+    mode: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    prepared = await prepare_answer(question=question, top_k=top_k, use_openai=use_openai, mode=mode, filters=filters)
+    chunks = prepared.citations
+    timings = prepared.timings
+    if not prepared.use_llm:
+        answer = "Retrieval-only mode. Provide your own synthesis using these snippets:\n\n" + _format_citations(chunks)
+    elif prepared.cached is not None:
+        answer = prepared.cached
+    else:
+        client = _get_llm_client()
+        started = time.perf_counter()
         try:
-            completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
+            completion = await client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=[{"role": "user", "content": _prompt(question, chunks)}],
                 temperature=0.0,
             )
             answer = completion.choices[0].message.content or ""
+            await _remember(prepared, answer)
         except Exception as e:
             answer = f"Retrieval-only fallback due to LLM error: {e}\n\n" + _format_citations(chunks)
-    else:
-        answer = "Retrieval-only mode. Provide your own synthesis using these snippets:\n\n" + _format_citations(chunks)
-    return {"answer": answer, "citations": chunks}
+        finally:
+            elapsed = time.perf_counter() - started
+            timings["llm"] = elapsed * 1000.0
+            record_stage("qa", "llm", elapsed)
+    return {"answer": answer, "citations": chunks, "mode": prepared.mode, "timings": timings, "cached": prepared.cached is not None}
 
 
-def completeness_check(*, query: str, top_k: int) -> Dict[str, Any]:
-    q_vec = embed_query(query)
-    chunks = VectorIndex.search(q_vec, top_k)
+async def completeness_check(*, query: str, top_k: int) -> Dict[str, Any]:
+    # Coverage is a cosine-similarity heuristic, so it always uses dense scores.
+    retrieval = await get_pool("search").run(retrieve_with_timings, query, top_k, "vector")
+    chunks = retrieval.results
+    if retrieval.mode != "vector":
+        # The index does not serve the current model yet (a rebuild is pending) and search fell
+        # back to BM25, whose scores say nothing against a cosine threshold.
+        return {
+            "is_complete": None,
+            "coverage": None,
+            "available": False,
+            "detail": "Completeness is unavailable until the index rebuild for the current embedding model finishes",
+            "mode": retrieval.mode,
+            "k": top_k,
+            "results": chunks,
+        }
     scores = [c.get("score", 0.0) for c in chunks]
     coverage = float(sum(scores) / max(1, len(scores))) if scores else 0.0
     is_complete = coverage >= 0.4
-    return {"is_complete": is_complete, "coverage": coverage, "k": top_k, "results": chunks}
+    return {
+        "is_complete": is_complete,
+        "coverage": coverage,
+        "available": True,
+        "mode": retrieval.mode,
+        "k": top_k,
+        "results": chunks,
+    }
@@ -1,11 +1,319 @@
-from typing import List, Dict, Any
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
 
 from app.core.config import settings
-from app.infrastructure.embeddings.sentence_transformer_provider import embed_query
-from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.core.db import SessionLocal
+from app.core.executors import get_pool
+from app.core.metrics import BATCH_SIZE, Family, record_stage, register_collector
+from app.infrastructure.cache.answer_cache import answer_cache
+from app.infrastructure.cache.ttl_lru import TTLLRUCache
+from app.infrastructure.embeddings.provider import embed_query, embed_texts
+from app.infrastructure.persistence.filters import DocumentFilter, resolve_chunk_ids
+from app.infrastructure.persistence.fts import lexical_search
+from app.infrastructure.persistence.models import Chunk
+from app.infrastructure.text.text_utils import clean_text
+from app.infrastructure.vectorstore.sharded_index import vector_index
+from app.infrastructure.vectorstore.snapshot import AllowedIds
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+_query_cache = TTLLRUCache("query_embedding", settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL_SECONDS)
+_result_cache = TTLLRUCache("search_results", settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL_SECONDS)
+# Resolved filters as FAISS bitmaps, keyed by (index generation, filter).
+_filter_cache = TTLLRUCache("filters", settings.FILTER_CACHE_SIZE, settings.FILTER_CACHE_TTL_SECONDS)
+_result_generation = -1
+
+
+@dataclass
+class Retrieval:
+    results: List[Dict[str, Any]]
+    mode: str
+    # Milliseconds per stage, in execution order.
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in self.timings.items())
+
+
+@dataclass
+class BatchRetrieval(Retrieval):
+    # One result list per query, in request order; timings cover the whole batch.
+    results: List[List[Dict[str, Any]]]
+
+
+class _Stopwatch:
+    def __init__(self, timings: Dict[str, float], stage: str) -> None:
+        self._timings = timings
+        self._stage = stage
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self._started
+        self._timings[self._stage] = elapsed * 1000.0
+        record_stage("search", self._stage, elapsed)
+
+
+def embed_query_cached(query: str) -> np.ndarray:
+    key = clean_text(query)
+    vec = _query_cache.get(key)
+    if vec is None:
+        vec = embed_query(key)
+        _query_cache.put(key, vec)
+    return vec
+
+
+def embed_queries_cached(queries: List[str]) -> np.ndarray:
+    # Cache misses (each distinct query once) are embedded in a single model call.
+    keys = [clean_text(q) for q in queries]
+    vectors = {key: _query_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, vec in vectors.items() if vec is None]
+    if missing:
+        fresh = embed_texts(missing)
+        for i, key in enumerate(missing):
+            vec = np.array(fresh[i:i + 1])
+            _query_cache.put(key, vec)
+            vectors[key] = vec
+    return np.vstack([vectors[key] for key in keys])
+
+
+def reciprocal_rank_fusion(
+    rankings: List[Tuple[List[int], float]], top_k: int, rrf_k: int
+) -> Tuple[List[int], List[float]]:
+    fused: Dict[int, float] = {}
+    for ids, weight in rankings:
+        for rank, cid in enumerate(ids, start=1):
+            fused[cid] = fused.get(cid, 0.0) + weight / (rrf_k + rank)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [cid for cid, _ in ordered], [score for _, score in ordered]
+
+
+def _normalize_mode(mode: Optional[str]) -> str:
+    value = (mode or settings.SEARCH_MODE).strip().lower()
+    if value not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search mode '{mode}', expected one of {', '.join(SEARCH_MODES)}")
+    # Until a rebuild for a new embedding model swaps in, the index holds the old model's
+    # vectors, which queries embedded by the new one cannot be compared with.
+    if value != "lexical" and not vector_index().serves_current_model():
+        return "lexical"
+    return value
+
+
+def _current_generation() -> int:
+    global _result_generation
+    # The generation is read before searching, so results computed against an index
+    # that changes mid-search are filed under the old generation and never served.
+    generation = vector_index().generation()
+    if generation != _result_generation:
+        _result_cache.clear()
+        _filter_cache.clear()
+        _result_generation = generation
+    return generation
+
+
+def _result_key(
+    generation: int, mode: str, query: str, query_vec: Optional[np.ndarray], top_k: int, filters: Optional[DocumentFilter]
+) -> Tuple:
+    if query_vec is None:
+        return (generation, mode, clean_text(query), top_k, filters)
+    return (generation, mode, hashlib.sha1(np.ascontiguousarray(query_vec).tobytes()).hexdigest(), top_k, filters)
+
+
+def _allowed_ids(generation: int, filters: Optional[DocumentFilter]) -> Optional[AllowedIds]:
+    # Chunk ids only change with the index generation, so a resolved filter is reused until then.
+    if filters is None:
+        return None
+    key = (generation, filters)
+    allowed = _filter_cache.get(key)
+    if allowed is None:
+        allowed = AllowedIds(resolve_chunk_ids(filters))
+        _filter_cache.put(key, allowed)
+    return allowed
+
+
+def retrieve_with_timings(
+    query: str, top_k: int, mode: Optional[str] = None, filters: Optional[DocumentFilter] = None
+) -> Retrieval:
+    mode = _normalize_mode(mode)
+    timings: Dict[str, float] = {}
+    generation = _current_generation()
+    query_vec: Optional[np.ndarray] = None
+    if mode != "lexical":
+        with _Stopwatch(timings, "embed"):
+            query_vec = embed_query_cached(query)
+    key = _result_key(generation, mode, query, query_vec, top_k, filters)
+    with _Stopwatch(timings, "cache"):
+        cached = _result_cache.get(key)
+    if cached is not None:
+        return Retrieval(results=[dict(r) for r in cached], mode=mode, timings=timings)
+
+    allowed: Optional[AllowedIds] = None
+    if filters is not None and mode != "lexical":
+        with _Stopwatch(timings, "filter"):
+            allowed = _allowed_ids(generation, filters)
+
+    if mode == "vector":
+        assert query_vec is not None
+        with _Stopwatch(timings, "vector"):
+            ids, scores = vector_index().search_ids(query_vec, top_k, allowed)
+    elif mode == "lexical":
+        with _Stopwatch(timings, "lexical"):
+            ids, scores = lexical_search(query, top_k, filters)
+    else:
+        assert query_vec is not None
+        candidates = max(top_k, top_k * settings.HYBRID_CANDIDATE_MULTIPLIER)
+        with _Stopwatch(timings, "vector"):
+            vector_ids, _ = vector_index().search_ids(query_vec, candidates, allowed)
+        with _Stopwatch(timings, "lexical"):
+            lexical_ids, _ = lexical_search(query, candidates, filters)
+        with _Stopwatch(timings, "fusion"):
+            ids, scores = reciprocal_rank_fusion(
+                [(vector_ids, settings.HYBRID_VECTOR_WEIGHT), (lexical_ids, settings.HYBRID_LEXICAL_WEIGHT)],
+                top_k,
+                settings.HYBRID_RRF_K,
+            )
+    with _Stopwatch(timings, "hydrate"):
+        results = vector_index().hydrate(ids, scores)
+    _result_cache.put(key, results)
+    return Retrieval(results=[dict(r) for r in results], mode=mode, timings=timings)
+
+
+def retrieve_batch_with_timings(
+    queries: List[str], top_k: int, mode: Optional[str] = None, filters: Optional[DocumentFilter] = None
+) -> BatchRetrieval:
+    # The batch shares one embedding call, one FAISS search over the stacked query matrix
+    # and one hydration; cached and repeated queries are answered without recomputing.
+    mode = _normalize_mode(mode)
+    if len(queries) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch, got {len(queries)}")
+    timings: Dict[str, float] = {}
+    if not queries:
+        return BatchRetrieval(results=[], mode=mode, timings=timings)
+    BATCH_SIZE.observe(len(queries), operation="search_batch")
+    generation = _current_generation()
+    query_vecs: Optional[np.ndarray] = None
+    if mode != "lexical":
+        with _Stopwatch(timings, "embed"):
+            query_vecs = embed_queries_cached(queries)
+    keys = [
+        _result_key(generation, mode, q, query_vecs[i] if query_vecs is not None else None, top_k, filters)
+        for i, q in enumerate(queries)
+    ]
+    with _Stopwatch(timings, "cache"):
+        found: Dict[Tuple, List[Dict[str, Any]]] = {}
+        for key in dict.fromkeys(keys):
+            cached = _result_cache.get(key)
+            if cached is not None:
+                found[key] = cached
+    # First position of every distinct key still to compute.
+    todo: List[int] = []
+    pending = set()
+    for i, key in enumerate(keys):
+        if key not in found and key not in pending:
+            pending.add(key)
+            todo.append(i)
+    if todo:
+        rankings: List[Tuple[List[int], List[float]]]
+        allowed: Optional[AllowedIds] = None
+        if filters is not None and mode != "lexical":
+            with _Stopwatch(timings, "filter"):
+                allowed = _allowed_ids(generation, filters)
+        if mode == "lexical":
+            with _Stopwatch(timings, "lexical"):
+                rankings = [lexical_search(queries[i], top_k, filters) for i in todo]
+        elif mode == "vector":
+            assert query_vecs is not None
+            with _Stopwatch(timings, "vector"):
+                rankings = vector_index().search_ids_batch(query_vecs[todo], top_k, allowed)
+        else:
+            assert query_vecs is not None
+            candidates = max(top_k, top_k * settings.HYBRID_CANDIDATE_MULTIPLIER)
+            with _Stopwatch(timings, "vector"):
+                vector_rankings = vector_index().search_ids_batch(query_vecs[todo], candidates, allowed)
+            with _Stopwatch(timings, "lexical"):
+                lexical_rankings = [lexical_search(queries[i], candidates, filters) for i in todo]
+            with _Stopwatch(timings, "fusion"):
+                rankings = [
+                    reciprocal_rank_fusion(
+                        [(vector_ids, settings.HYBRID_VECTOR_WEIGHT), (lexical_ids, settings.HYBRID_LEXICAL_WEIGHT)],
+                        top_k,
+                        settings.HYBRID_RRF_K,
+                    )
+                    for (vector_ids, _), (lexical_ids, _) in zip(vector_rankings, lexical_rankings)
+                ]
+        with _Stopwatch(timings, "hydrate"):
+            hydrated = vector_index().hydrate_many(rankings)
+        for i, results in zip(todo, hydrated):
+            _result_cache.put(keys[i], results)
+            found[keys[i]] = results
+    return BatchRetrieval(results=[[dict(r) for r in found[key]] for key in keys], mode=mode, timings=timings)
+
+
+def retrieve(
+    query: str, top_k: int, mode: Optional[str] = None, filters: Optional[DocumentFilter] = None
+) -> List[Dict[str, Any]]:
+    return retrieve_with_timings(query, top_k, mode, filters).results
+
+
+def warm_up_queries() -> int:
+    # Configured queries, or the opening words of chunks spread over the corpus, go through
+    # search once, so the first requests find the model, index pages and caches warm.
+    queries = [q.strip() for q in settings.WARMUP_QUERIES.split("|") if q.strip()]
+    if not queries and settings.WARMUP_SAMPLE_QUERIES > 0:
+        with SessionLocal() as session:
+            last_id = session.query(func.max(Chunk.id)).scalar() or 0
+            step = max(1, last_id // settings.WARMUP_SAMPLE_QUERIES)
+            sample = list(range(1, last_id + 1, step))[: settings.WARMUP_SAMPLE_QUERIES]
+            rows = session.query(Chunk.content).filter(Chunk.id.in_(sample)).all() if sample else []
+        queries = [" ".join(row.content.split()[:8]) for row in rows if row.content.strip()]
+    queries = queries[: settings.SEARCH_BATCH_MAX_QUERIES]
+    if queries:
+        retrieve_batch_with_timings(queries, settings.TOP_K_DEFAULT)
+    return len(queries)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return {cache.name: cache.stats() for cache in (_query_cache, _result_cache, _filter_cache, answer_cache)}
+
+
+def _cache_metrics() -> List[Family]:
+    stats = cache_stats()
+    return [
+        (name, kind, help_text, [({"cache": cache}, float(s[field])) for cache, s in stats.items()])
+        for name, kind, help_text, field in (
+            ("kb_cache_hits_total", "counter", "Cache lookups that hit.", "hits"),
+            ("kb_cache_misses_total", "counter", "Cache lookups that missed.", "misses"),
+            ("kb_cache_evictions_total", "counter", "Entries evicted for capacity.", "evictions"),
+            ("kb_cache_entries", "gauge", "Entries currently cached.", "size"),
+            ("kb_cache_hit_ratio", "gauge", "Hits over lookups since start.", "hit_rate"),
+        )
+    ]
+
+
+register_collector(_cache_metrics)
+
+
+def document_filter(filters: Optional[Dict[str, Any]]) -> Optional[DocumentFilter]:
+    return DocumentFilter.of(**filters) if filters else None
+
+
+async def search_documents(
+    query: str, top_k: int, mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None
+) -> Retrieval:
+    return await get_pool("search").run(
+        retrieve_with_timings, query, top_k or settings.TOP_K_DEFAULT, mode, document_filter(filters)
+    )
 
 
-def search_documents(query: str, top_k: int) -> List[Dict[str, Any]]:
-    query_vec = embed_query(query)
-    results = VectorIndex.search(query_vec=query_vec, top_k=top_k or settings.TOP_K_DEFAULT)
-    return results
+async def search_documents_batch(
+    queries: List[str], top_k: int, mode: Optional[str] = None, filters: Optional[Dict[str, Any]] = None
+) -> BatchRetrieval:
+    return await get_pool("search").run(
+        retrieve_batch_with_timings, queries, top_k or settings.TOP_K_DEFAULT, mode, document_filter(filters)
+    )
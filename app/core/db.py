@@ -1,13 +1,45 @@
-from sqlalchemy import create_engine  # pyright: ignore[reportMissingImports]
+from sqlalchemy import create_engine, event  # pyright: ignore[reportMissingImports]
 from sqlalchemy.orm import sessionmaker, declarative_base  # pyright: ignore[reportMissingImports]
 from app.core.config import settings
 
 
-DATABASE_URL = f"sqlite:///{settings.DB_PATH}"
+DATABASE_URL = settings.DATABASE_URL or f"sqlite:///{settings.DB_PATH}"
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+if DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_SECONDS}
+    )
+else:
+    # Server databases get a bounded, health-checked pool per worker process; size it so
+    # workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under the server's max_connections.
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+
+IS_SQLITE = engine.dialect.name == "sqlite"
+IS_POSTGRES = engine.dialect.name == "postgresql"
+
+
+def _configure_sqlite(dbapi_connection, connection_record) -> None:
+    # WAL lets searches read while ingestion writes; with synchronous=NORMAL a commit no
+    # longer fsyncs (the WAL is synced at checkpoints), which is what makes small
+    # transactions cheap. cache_size is negative to mean KiB rather than pages.
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _configure_sqlite)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
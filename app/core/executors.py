@@ -0,0 +1,155 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.metrics import Family, register_collector
+
+
+class PoolSaturatedError(RuntimeError):
+    pass
+
+
+# Executor with a hard bound on work admitted (running + queued). Request handlers
+# get a fast PoolSaturatedError instead of an ever-growing backlog; background
+# producers may block until a slot frees up.
+class ManagedPool:
+    def __init__(self, name: str, kind: str, max_workers: int, max_queue: int) -> None:
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Executor | None = None
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    def submit(self, fn: Callable[..., Any], *args: Any, block: bool = True, **kwargs: Any) -> Future:
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturatedError(f"{self.name} pool is saturated ({self.max_workers} running, {self.max_queue} queued)")
+        if self.kind == "thread":
+            # Threads run in the caller's context, so request-scoped stage timings follow the work.
+            fn, args = contextvars.copy_context().run, (fn, *args)
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_flight += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._slots.release()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, block=False, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.max_workers),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _pool_specs() -> Dict[str, Tuple[str, int, int]]:
+    cpus = os.cpu_count() or 1
+    return {
+        # Query embedding, FAISS search and hydration.
+        "search": ("thread", settings.SEARCH_POOL_WORKERS or min(32, cpus + 4), settings.SEARCH_POOL_QUEUE),
+        # Database writes, document embedding and index updates.
+        "ingest": ("thread", settings.INGEST_POOL_WORKERS, settings.INGEST_POOL_QUEUE),
+        # CPU-bound parsing (PDF text extraction) outside the GIL.
+        "parse": ("process", settings.PARSE_WORKERS or cpus, settings.PARSE_POOL_QUEUE),
+    }
+
+
+_pools: Dict[str, ManagedPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> ManagedPool:
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                kind, workers, queue_size = _pool_specs()[name]
+                pool = ManagedPool(name, kind, workers, queue_size)
+                _pools[name] = pool
+    return pool
+
+
+def get_process_pool() -> ManagedPool:
+    return get_pool("parse")
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {name: get_pool(name).stats() for name in _pool_specs()}
+
+
+def _pool_metrics() -> List[Family]:
+    stats = pool_stats()
+    return [
+        (
+            f"kb_pool_{field}" + ("_total" if kind == "counter" else ""),
+            kind,
+            help_text,
+            [({"pool": name}, float(s[field])) for name, s in stats.items()],
+        )
+        for field, kind, help_text in (
+            ("in_flight", "gauge", "Tasks running or queued."),
+            ("queued", "gauge", "Tasks waiting for a worker."),
+            ("completed", "counter", "Tasks completed."),
+            ("failed", "counter", "Tasks that raised."),
+            ("rejected", "counter", "Submissions rejected because the pool was saturated."),
+        )
+    ]
+
+
+register_collector(_pool_metrics)
+
+
+def shutdown_executors() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,178 @@
+import math
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Process-wide metrics rendered in the Prometheus text format (0.0.4). Counters and
+# histograms are updated at the call sites; gauges are read from collectors at scrape time.
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+SIZE_BUCKETS: Tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value)]) families produced by a collector.
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _labels(values: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for key, value in labels:
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(values))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self._bounds = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per label set: (non-cumulative bucket counts with a trailing +Inf slot, sum, count).
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _labels(labels)
+        slot = len(self._bounds)
+        for i, bound in enumerate(self._bounds):
+            if value <= bound:
+                slot = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = ([0] * (len(self._bounds) + 1), [0.0, 0.0])
+                self._series[key] = series
+            series[0][slot] += 1
+            series[1][0] += value
+            series[1][1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(counts), list(totals)) for k, (counts, totals) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, (total, count) in sorted(series):
+            cumulative = 0
+            for bound, bucket in zip(self._bounds + (math.inf,), counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(count)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("kb_stage_seconds", "Time spent per pipeline stage.")
+BATCH_SIZE = Histogram("kb_batch_size", "Items per batched operation.", SIZE_BUCKETS)
+LOCK_WAIT_SECONDS = Histogram("kb_lock_wait_seconds", "Time spent waiting to acquire a lock.")
+HTTP_SECONDS = Histogram("kb_http_request_seconds", "HTTP request latency by route and status.")
+HTTP_ERRORS = Counter("kb_http_errors_total", "HTTP responses with a 5xx status, by route and status.")
+
+_metrics: List[object] = [STAGE_SECONDS, BATCH_SIZE, LOCK_WAIT_SECONDS, HTTP_SECONDS, HTTP_ERRORS]
+_collectors: List[Callable[[], Iterable[Family]]] = []
+
+# Stage timings of the request being served; copied into pool threads with the context.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def register_collector(collector: Callable[[], Iterable[Family]]) -> None:
+    _collectors.append(collector)
+
+
+def begin_request_timings() -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(component: str, stage_name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, component=component, stage=stage_name)
+    timings = _request_timings.get()
+    if timings is not None:
+        key = f"{component}-{stage_name}"
+        timings[key] = timings.get(key, 0.0) + seconds * 1000.0
+
+
+@contextmanager
+def stage(component: str, stage_name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(component, stage_name, time.perf_counter() - started)
+
+
+@contextmanager
+def timed_lock(lock: threading.Lock, name: str, op: str) -> Iterator[None]:
+    started = time.perf_counter()
+    with lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, lock=name, op=op)
+        yield
+
+
+def _process_metrics() -> List[Family]:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    families: List[Family] = [
+        ("process_cpu_seconds_total", "counter", "User and system CPU time.", [({}, usage.ru_utime + usage.ru_stime)]),
+        # ru_maxrss is in KiB on Linux.
+        ("process_max_resident_memory_bytes", "gauge", "Peak resident set size.", [({}, usage.ru_maxrss * 1024)]),
+    ]
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        families.append(
+            ("process_resident_memory_bytes", "gauge", "Resident set size.", [({}, resident_pages * os.sysconf("SC_PAGE_SIZE"))])
+        )
+    except (OSError, ValueError, IndexError):
+        pass
+    return families
+
+
+register_collector(_process_metrics)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())  # type: ignore[attr-defined]
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(_labels(labels))} {_format_value(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,81 @@
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+# Statistical profiler for a live process: a daemon thread samples every other thread's
+# stack at a fixed interval and counts collapsed stacks ("a;b;c" root first, the
+# flamegraph folded format). Idle while stopped, so it can stay wired in.
+class SamplingProfiler:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._interval = 0.01
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._started: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 10.0) -> None:
+        with self._lock:
+            self._interval = max(1.0, interval_ms) / 1000.0
+            if self.running:
+                return
+            self._stop.clear()
+            self._started = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout=1.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+            self._started = time.monotonic() if self.running else None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self._samples += 1
+
+    def folded(self, limit: int = 0) -> str:
+        with self._lock:
+            items = self._stacks.most_common(limit or None)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval_ms": round(self._interval * 1000.0, 3),
+                "samples": self._samples,
+                "distinct_stacks": len(self._stacks),
+                "seconds": round(time.monotonic() - self._started, 1) if self._started is not None else 0.0,
+            }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from app.core.metrics import Family, register_collector
+
+logger = logging.getLogger(__name__)
+
+Phase = Tuple[str, Callable[[], Any]]
+
+
+def _process_age() -> float:
+    # Seconds since the process started (interpreter start-up and imports included), from
+    # /proc where available; elsewhere timing starts when this module is imported.
+    try:
+        with open("/proc/self/stat", "r") as f:
+            started_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# Startup progress and readiness. The process answers /health as soon as it serves HTTP;
+# it is ready once every loading phase (payload store, index, embedding model, warm-up)
+# has finished. Phase durations are kept for /ready and /metrics. Optional phases (warm-up)
+# are best-effort: a failure is logged and reported under "warnings" but does not hold
+# readiness back.
+class Startup:
+    def __init__(self) -> None:
+        self._created = time.perf_counter() - _process_age()
+        self._lock = threading.Lock()
+        self._phases: Dict[str, float] = {}
+        self._running: Dict[str, float] = {}
+        self._state = "starting"
+        self._error: Optional[str] = None
+        self._optional: Set[str] = set()
+        self._warnings: Dict[str, str] = {}
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._phases[name] = seconds * 1000.0
+
+    def since_created(self) -> float:
+        return time.perf_counter() - self._created
+
+    def run_phase(self, name: str, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        with self._lock:
+            self._running[name] = started
+        try:
+            return fn()
+        except Exception as exc:
+            if name not in self._optional:
+                raise
+            logger.exception("Startup phase %s failed; continuing without it", name)
+            with self._lock:
+                self._warnings[name] = str(exc)
+            return None
+        finally:
+            with self._lock:
+                self._running.pop(name, None)
+            self.record(name, time.perf_counter() - started)
+            logger.info("Startup phase %s took %.1f ms", name, (time.perf_counter() - started) * 1000.0)
+
+    def _run(self, stages: Sequence[List[Phase]]) -> None:
+        # Phases within a stage run in parallel; stages run in order.
+        try:
+            for phases in stages:
+                if len(phases) == 1:
+                    self.run_phase(*phases[0])
+                    continue
+                with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="startup") as pool:
+                    futures = [pool.submit(self.run_phase, name, fn) for name, fn in phases]
+                    for future in futures:
+                        future.result()
+            self.record("total", self.since_created())
+            with self._lock:
+                self._state = "ready"
+            self._ready.set()
+        except Exception as exc:
+            logger.exception("Startup failed")
+            with self._lock:
+                self._state = "failed"
+                self._error = str(exc)
+            raise
+
+    def start(self, stages: Sequence[List[Phase]], background: bool, optional: Sequence[str] = ()) -> None:
+        self._optional = set(optional)
+        if not background:
+            self._run(stages)
+            return
+
+        def run() -> None:
+            try:
+                self._run(stages)
+            except Exception:
+                pass  # Reported through status(); the process keeps answering /health and /ready.
+
+        self._thread = threading.Thread(target=run, name="startup", daemon=True)
+        self._thread.start()
+
+    def join(self) -> None:
+        # Shutdown waits for loading to finish rather than closing a half-opened index.
+        if self._thread is not None:
+            self._thread.join()
+
+    def status(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        with self._lock:
+            return {
+                "ready": self._ready.is_set(),
+                "state": self._state,
+                "error": self._error,
+                "warnings": dict(self._warnings),
+                "phases_ms": dict(self._phases),
+                "running_ms": {name: (now - started) * 1000.0 for name, started in self._running.items()},
+                "uptime_ms": (now - self._created) * 1000.0,
+            }
+
+
+startup = Startup()
+
+
+def _startup_metrics() -> List[Family]:
+    status = startup.status()
+    return [
+        ("kb_ready", "gauge", "Whether startup has finished and the process serves requests.", [({}, float(status["ready"]))]),
+        (
+            "kb_startup_phase_seconds",
+            "gauge",
+            "Duration of each startup phase.",
+            [({"phase": name}, ms / 1000.0) for name, ms in status["phases_ms"].items()],
+        ),
+    ]
+
+
+register_collector(_startup_metrics)
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.infrastructure.persistence.models import AnswerCacheEntry
+from app.infrastructure.text.text_utils import clean_text
+
+
+# LLM answers persisted in the metadata database. The key covers everything the answer was
+# generated from: the whitespace-normalized question, the packed chunks in prompt order
+# (ids and content hashes) and the model, so a re-ingested chunk or a model switch misses
+# instead of serving a stale answer. Entries expire after `ttl_seconds`.
+class AnswerCache:
+    def __init__(self, name: str, ttl_seconds: float) -> None:
+        self.name = name
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0
+
+    @staticmethod
+    def key(question: str, chunks: List[Dict[str, Any]], model: str) -> str:
+        parts = [
+            [c.get("chunk_id"), hashlib.sha256(c.get("content", "").encode("utf-8")).hexdigest()] for c in chunks
+        ]
+        payload = json.dumps([clean_text(question), model, parts], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self._ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with SessionLocal() as session:
+            entry = session.get(AnswerCacheEntry, key)
+            answer = entry.answer if entry is not None and entry.created_at > self._cutoff() else None
+        with self._lock:
+            if answer is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return answer
+
+    def put(self, key: str, model: str, answer: str) -> None:
+        if not self.enabled:
+            return
+        with SessionLocal() as session:
+            # Expired entries are swept on write, which keeps the table bounded by the TTL.
+            expired = session.query(AnswerCacheEntry).filter(AnswerCacheEntry.created_at <= self._cutoff()).delete(
+                synchronize_session=False
+            )
+            session.merge(AnswerCacheEntry(key=key, model=model, answer=answer, created_at=datetime.utcnow()))
+            session.commit()
+        if expired:
+            with self._lock:
+                self._evictions += expired
+
+    def stats(self) -> Dict[str, Any]:
+        size = 0
+        if self.enabled:
+            with SessionLocal() as session:
+                size = session.query(AnswerCacheEntry).count()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": size,
+                "ttl_seconds": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache("qa_answers", settings.ANSWER_CACHE_TTL_SECONDS)
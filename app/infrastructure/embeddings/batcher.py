@@ -0,0 +1,100 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass, field
+from typing import Any, Callable, List
+
+import numpy as np
+
+
+@dataclass
+class _Request:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+# Coalesces concurrent embedding calls into one encode() call. The first request
+# in a batch waits at most `max_wait_ms` for company; a full batch runs at once.
+class EmbeddingBatcher:
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int, max_wait_ms: float) -> None:
+        self._encode = encode
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            # Restarted if it ever died, so callers never queue behind a worker that is gone.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        request = _Request(texts=list(texts))
+        if not request.texts:
+            request.future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return request.future
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    async def embed_async(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self._max_wait
+        while size < self._max_batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    @staticmethod
+    def _settle(future: Future, result: Any = None, exc: BaseException | None = None) -> None:
+        # A future cancelled by its caller must not take the worker down with it.
+        try:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            # Requests cancelled while queued (an abandoned embed_async) are dropped; the rest
+            # are marked running, after which a cancel can no longer reach them.
+            batch = [request for request in self._collect() if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [t for request in batch for t in request.texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as exc:
+                for request in batch:
+                    self._settle(request.future, exc=exc)
+                continue
+            offset = 0
+            for request in batch:
+                count = len(request.texts)
+                self._settle(request.future, vectors[offset:offset + count])
+                offset += count
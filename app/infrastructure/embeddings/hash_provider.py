@@ -0,0 +1,42 @@
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+
+DEFAULT_DIMENSION = 384
+# Each token adds +/-1 at this many hashed coordinates.
+_PROBES = 8
+
+_TOKEN = re.compile(r"\w+")
+
+
+# Signed feature hashing of lower-cased word tokens: no model, deterministic across
+# processes, and texts sharing words land close together. Meant for benchmarks that
+# isolate the index and storage from model inference, not for real retrieval quality.
+def get_embedding_dimension() -> int:
+    return settings.EMBEDDING_DIM or DEFAULT_DIMENSION
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def encode(texts: List[str]) -> np.ndarray:
+    dimension = get_embedding_dimension()
+    out = np.zeros((len(texts), dimension), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = _tokens(text)
+        if not tokens:
+            continue
+        digests = b"".join(hashlib.blake2b(t.encode("utf-8"), digest_size=2 * _PROBES).digest() for t in tokens)
+        probes = np.frombuffer(digests, dtype=np.uint16)
+        signs = np.where(probes & 1, 1.0, -1.0).astype(np.float32)
+        np.add.at(out[row], (probes >> 1) % dimension, signs)
+    return out
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    return [len(_tokens(text)) for text in texts]
@@ -0,0 +1,85 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+def resolve_model_name(name: str) -> str:
+    # SentenceTransformer accepts bare names of its own models; hub files need the full id.
+    if os.path.isdir(name) or "/" in name:
+        return name
+    return f"sentence-transformers/{name}"
+
+
+def read_model_file(name: str, filename: str) -> Optional[Dict[str, Any]]:
+    # A JSON file of a local model directory or a hub repository (served from the local
+    # hub cache once downloaded); None if the model has no such file.
+    name = resolve_model_name(name)
+    if os.path.isdir(name):
+        path = os.path.join(name, filename)
+        if not os.path.exists(path):
+            return None
+    else:
+        from huggingface_hub import hf_hub_download, try_to_load_from_cache
+        from huggingface_hub.utils import EntryNotFoundError
+
+        # The local hub cache first: no network round trip on every start.
+        cached = try_to_load_from_cache(name, filename)
+        if isinstance(cached, str):
+            path = cached
+        elif cached is not None:
+            return None  # cached as known-missing
+        else:
+            try:
+                path = hf_hub_download(name, filename)
+            except EntryNotFoundError:
+                return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def model_modules(name: str) -> List[Dict[str, Any]]:
+    # The sentence-transformers pipeline (Transformer, Pooling, Dense, Normalize, ...);
+    # a plain transformers model is treated as Transformer + mean pooling.
+    modules = read_model_file(name, "modules.json")
+    if modules is None:
+        return [
+            {"path": "", "type": "sentence_transformers.models.Transformer"},
+            {"path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+        ]
+    return modules
+
+
+def pooling_config(name: str) -> Dict[str, Any]:
+    for module in model_modules(name):
+        if module["type"].endswith("Pooling"):
+            config = read_model_file(name, os.path.join(module["path"], "config.json"))
+            if config is not None:
+                return config
+    return {"pooling_mode_mean_tokens": True}
+
+
+def max_seq_length(name: str) -> Optional[int]:
+    config = read_model_file(name, "sentence_bert_config.json")
+    return int(config["max_seq_length"]) if config and config.get("max_seq_length") else None
+
+
+def model_dimension(name: str) -> Optional[int]:
+    # The output width from configuration files alone, without loading weights: the last
+    # Dense layer if there is one, else the pooled transformer width.
+    dimension: Optional[int] = None
+    for module in model_modules(name):
+        kind = module["type"]
+        if kind.endswith("Dense"):
+            config = read_model_file(name, os.path.join(module["path"], "config.json"))
+            dimension = int(config["out_features"]) if config else None
+        elif kind.endswith("Pooling"):
+            config = read_model_file(name, os.path.join(module["path"], "config.json"))
+            if config and config.get("word_embedding_dimension"):
+                # Several enabled pooling modes are concatenated.
+                modes = sum(1 for key, value in config.items() if key.startswith("pooling_mode_") and value is True)
+                dimension = int(config["word_embedding_dimension"]) * max(1, modes)
+        elif kind.endswith("Transformer") and dimension is None:
+            config = read_model_file(name, "config.json")
+            width = (config or {}).get("hidden_size") or (config or {}).get("d_model")
+            dimension = int(width) if width else None
+    return dimension
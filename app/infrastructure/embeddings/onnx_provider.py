@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer, PreTrainedTokenizerBase
+
+from app.core.config import settings
+from app.infrastructure.embeddings.model_config import max_seq_length, model_modules, pooling_config, resolve_model_name
+
+_session_lock = threading.Lock()
+_session: ort.InferenceSession | None = None
+_tokenizer: PreTrainedTokenizerBase | None = None
+_meta: Dict[str, Any] | None = None
+
+_POOLING_MODES = ("cls", "mean", "max")
+
+
+def _export_dir() -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", settings.MODEL_NAME)
+    return os.path.join(settings.ONNX_CACHE_DIR, slug)
+
+
+def _pooling_mode(config: Dict[str, Any]) -> str:
+    enabled = [key for key, value in config.items() if key.startswith("pooling_mode_") and value is True]
+    mode = enabled[0][len("pooling_mode_"):].replace("_tokens", "").replace("_token", "") if len(enabled) == 1 else None
+    if mode not in _POOLING_MODES:
+        raise ValueError(f"ONNX backend supports a single cls/mean/max pooling mode, model uses {enabled}")
+    return mode
+
+
+def _export(directory: str) -> None:
+    # One-off: trace the transformer to ONNX (token embeddings out; pooling runs in numpy)
+    # and keep the tokenizer and pipeline settings next to it. Needs torch, serving does not.
+    import torch
+    from transformers import AutoModel
+
+    name = resolve_model_name(settings.MODEL_NAME)
+    unsupported = [m["type"] for m in model_modules(name) if not m["type"].endswith(("Transformer", "Pooling", "Normalize"))]
+    if unsupported:
+        raise ValueError(f"ONNX backend cannot export {', '.join(unsupported)} modules; use EMBEDDING_BACKEND=torch")
+    pooling = pooling_config(name)
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = AutoModel.from_pretrained(name)
+    model.eval()
+    sample = tokenizer(["export"], return_tensors="pt")
+    inputs = [key for key in ("input_ids", "attention_mask", "token_type_ids") if key in sample]
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, "model.onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[key] for key in inputs),
+            tmp,
+            input_names=inputs,
+            output_names=["token_embeddings"],
+            dynamic_axes={**{key: {0: "batch", 1: "sequence"} for key in inputs}, "token_embeddings": {0: "batch", 1: "sequence"}},
+            opset_version=14,
+        )
+    os.replace(tmp, os.path.join(directory, "model.onnx"))
+    # A quantized copy left by an earlier export belongs to that model.
+    if os.path.exists(os.path.join(directory, "model.int8.onnx")):
+        os.remove(os.path.join(directory, "model.int8.onnx"))
+    tokenizer.save_pretrained(directory)
+    max_length = max_seq_length(name) or min(tokenizer.model_max_length, 512)
+    meta = {
+        "model": settings.MODEL_NAME,
+        "inputs": inputs,
+        "pooling": _pooling_mode(pooling),
+        "dimension": int(pooling.get("word_embedding_dimension") or model.config.hidden_size),
+        "max_seq_length": int(max_length),
+    }
+    # Written last: its presence marks a complete export.
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _quantize(directory: str) -> str:
+    path = os.path.join(directory, "model.int8.onnx")
+    if not os.path.exists(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp = path + ".tmp"
+        # Dynamic quantization: int8 weights, activations quantized per batch at run time.
+        quantize_dynamic(os.path.join(directory, "model.onnx"), tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, path)
+    return path
+
+
+def exported_meta() -> Dict[str, Any] | None:
+    # Pipeline settings of a cached export, readable without loading anything. The directory
+    # slug is lossy ("org/model" and "org:model" share one), so an export of another model
+    # counts as missing and is replaced.
+    path = os.path.join(_export_dir(), "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta if meta.get("model") == settings.MODEL_NAME else None
+
+
+def _load_session() -> Tuple[ort.InferenceSession, PreTrainedTokenizerBase, Dict[str, Any]]:
+    global _session, _tokenizer, _meta
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                directory = _export_dir()
+                meta = exported_meta()
+                if meta is None:
+                    _export(directory)
+                    meta = exported_meta()
+                assert meta is not None
+                path = _quantize(directory) if settings.ONNX_QUANTIZE else os.path.join(directory, "model.onnx")
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if settings.ONNX_THREADS > 0:
+                    options.intra_op_num_threads = settings.ONNX_THREADS
+                providers = ["CPUExecutionProvider"]
+                if settings.DEVICE.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+                    providers.insert(0, "CUDAExecutionProvider")
+                _tokenizer = AutoTokenizer.from_pretrained(directory)
+                _meta = meta
+                _session = ort.InferenceSession(path, options, providers=providers)
+    assert _tokenizer is not None and _meta is not None
+    return _session, _tokenizer, _meta
+
+
+def get_embedding_dimension() -> int:
+    meta = exported_meta()
+    if meta is None:
+        meta = _load_session()[2]
+    return int(meta["dimension"])
+
+
+def _pool(token_embeddings: np.ndarray, mask: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "cls":
+        return token_embeddings[:, 0]
+    weights = mask[:, :, None].astype(np.float32)
+    if mode == "max":
+        return np.where(weights > 0, token_embeddings, -1e9).max(axis=1)
+    return (token_embeddings * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+
+def encode(texts: List[str], batch_size: int = 32) -> np.ndarray:
+    session, tokenizer, meta = _load_session()
+    out = np.zeros((len(texts), int(meta["dimension"])), dtype=np.float32)
+    # Length-sorted batches keep padding, and so wasted compute, to a minimum.
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    for start in range(0, len(texts), batch_size):
+        rows = order[start:start + batch_size]
+        encoded = tokenizer(
+            [texts[i] for i in rows], padding=True, truncation=True, max_length=int(meta["max_seq_length"]), return_tensors="np"
+        )
+        feeds = {key: encoded[key].astype(np.int64) for key in meta["inputs"]}
+        token_embeddings = session.run(None, feeds)[0]
+        out[rows] = _pool(token_embeddings, encoded["attention_mask"], meta["pooling"])
+    return out
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    tokenizer = _load_session()[1]
+    encoded = tokenizer(texts, add_special_tokens=False, truncation=False, verbose=False)
+    return [len(ids) for ids in encoded["input_ids"]]
@@ -0,0 +1,134 @@
+import asyncio
+import importlib
+import json
+import logging
+import threading
+from types import ModuleType
+from typing import List
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import BATCH_SIZE, stage
+from app.infrastructure.embeddings.batcher import EmbeddingBatcher
+from app.infrastructure.embeddings.model_config import model_dimension
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = {
+    "torch": "app.infrastructure.embeddings.sentence_transformer_provider",
+    "onnx": "app.infrastructure.embeddings.onnx_provider",
+    "hash": "app.infrastructure.embeddings.hash_provider",
+}
+
+_backend_lock = threading.Lock()
+_backend: ModuleType | None = None
+_dim: int | None = None
+
+
+def _backend_kind() -> str:
+    return settings.EMBEDDING_BACKEND.strip().lower()
+
+
+def _get_backend() -> ModuleType:
+    # Imported on first use, so only the selected runtime (torch or onnxruntime) is loaded.
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = _backend_kind()
+                if kind not in EMBEDDING_BACKENDS:
+                    raise ValueError(
+                        f"Unsupported EMBEDDING_BACKEND '{settings.EMBEDDING_BACKEND}', expected one of {', '.join(EMBEDDING_BACKENDS)}"
+                    )
+                _backend = importlib.import_module(EMBEDDING_BACKENDS[kind])
+    return _backend
+
+
+def embedding_model_key() -> str:
+    # Names the vector space: int8 weights shift embeddings enough to keep them apart.
+    kind = _backend_kind()
+    if kind == "hash":
+        return f"feature-hash-{get_embedding_dimension()}"
+    if kind == "onnx" and settings.ONNX_QUANTIZE:
+        return f"{settings.MODEL_NAME}-int8"
+    return settings.MODEL_NAME
+
+
+def _indexed_dimension() -> int | None:
+    # The width recorded next to the index, if it was built with the configured model.
+    try:
+        with open(settings.INDEX_META_PATH, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("model") != embedding_model_key() or not meta.get("dimension"):
+        return None
+    return int(meta["dimension"])
+
+
+def get_embedding_dimension() -> int:
+    # Answered from configuration or the index metadata when possible, so startup does not
+    # wait for the model.
+    global _dim
+    if _dim is None:
+        dimension = settings.EMBEDDING_DIM or None
+        # The hash backend has no model config to read and answers without loading anything.
+        if dimension is None and _backend_kind() != "hash":
+            dimension = _indexed_dimension()
+        if dimension is None and _backend_kind() != "hash":
+            try:
+                dimension = model_dimension(settings.MODEL_NAME)
+            except Exception as exc:
+                logger.warning("Could not read the embedding dimension from the model config: %s", exc)
+        _dim = dimension or _get_backend().get_embedding_dimension()
+    return _dim
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    return matrix / norms
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    BATCH_SIZE.observe(len(texts), operation="embed")
+    with stage("embedding", "encode"):
+        vectors = _get_backend().encode(texts)
+    vectors = _normalize(vectors)
+    return vectors.astype(np.float32)
+
+
+_batcher: EmbeddingBatcher | None = (
+    EmbeddingBatcher(_encode, settings.EMBED_BATCH_MAX_SIZE, settings.EMBED_BATCH_WAIT_MS) if settings.EMBED_BATCHING else None
+)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    # Small calls (queries, short documents) share forward passes; bulk calls are already batched.
+    if _batcher is not None and 0 < len(texts) < _batcher.max_batch_size:
+        return _batcher.embed(texts)
+    return _encode(texts)
+
+
+def embed_query(text: str) -> np.ndarray:
+    vec = embed_texts([text])
+    return vec
+
+
+async def embed_texts_async(texts: List[str]) -> np.ndarray:
+    if _batcher is not None and 0 < len(texts) < _batcher.max_batch_size:
+        return await _batcher.embed_async(texts)
+    return await asyncio.to_thread(_encode, texts)
+
+
+async def embed_query_async(text: str) -> np.ndarray:
+    return await embed_texts_async([text])
+
+
+def warm_up() -> None:
+    # Loads the model and runs one forward pass, so the first request does not pay for either.
+    _encode(["warm-up"])
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    return _get_backend().count_tokens(texts)
@@ -8,40 +8,32 @@ from app.core.config import settings
 
 _model_lock = threading.Lock()
 _model: SentenceTransformer | None = None
-_dim: int | None = None
 
 
 def _load_model() -> SentenceTransformer:
-    global _model, _dim
+    global _model
     if _model is None:
         with _model_lock:
             if _model is None:
                 _model = SentenceTransformer(settings.MODEL_NAME, device=settings.DEVICE)
-                # Probe dimension
-                probe = _model.encode(["dim"], convert_to_numpy=True, normalize_embeddings=False)
-                _dim = probe.shape[1]
     return _model
 
 
 def get_embedding_dimension() -> int:
-    if _dim is None:
-        _load_model()
-    assert _dim is not None
-    return _dim
+    dimension = _load_model().get_sentence_embedding_dimension()
+    assert dimension is not None
+    return int(dimension)
 
 
-def _normalize(matrix: np.ndarray) -> np.ndarray:
-    norms = np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
-    return matrix / norms
-
-
-def embed_texts(texts: List[str]) -> np.ndarray:
+def encode(texts: List[str]) -> np.ndarray:
     model = _load_model()
-    vectors = model.encode(texts, convert_to_numpy=True, normalize_embeddings=False)
-    vectors = _normalize(vectors)
-    return vectors.astype(np.float32)
+    return model.encode(texts, convert_to_numpy=True, normalize_embeddings=False)
 
 
-def embed_query(text: str) -> np.ndarray:
-    vec = embed_texts([text])
-    return vec
+def count_tokens(texts: List[str]) -> List[int]:
+    # Real model tokens (no special tokens), one batched tokenizer call per list.
+    if not texts:
+        return []
+    tokenizer = _load_model().tokenizer
+    encoded = tokenizer(texts, add_special_tokens=False, truncation=False, verbose=False)
+    return [len(ids) for ids in encoded["input_ids"]]
@@ -0,0 +1,165 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.infrastructure.embeddings.provider import embed_texts, embedding_model_key
+
+
+# Append-only vector store addressed by fixed-size binary keys. Vectors live in a
+# memory-mapped float32 file; row i of `<prefix>.keys` names row i of `<prefix>.f32`.
+# Several processes may share a store: appends and crash repair happen under an exclusive
+# lock on `<prefix>.lock`, and each writer first picks up the rows others appended.
+class MmapVectorStore:
+    def __init__(self, prefix: str, key_size: int) -> None:
+        self._prefix = prefix
+        self._key_size = key_size
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._dim: Optional[int] = None
+        self._count = 0
+        self._mmap: Optional[np.memmap] = None
+        self._load()
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _path(self, suffix: str) -> str:
+        return f"{self._prefix}.{suffix}"
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self._prefix) or ".", exist_ok=True)
+        with open(self._path("lock"), "wb") as handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _load(self) -> None:
+        with self._file_lock():
+            meta_path = self._path("json")
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self._dim = int(json.load(f)["dim"])
+            self._catch_up()
+
+    def _catch_up(self) -> None:
+        # Called under the file lock. Vectors are fsync'd before keys, so a crashed writer
+        # can only leave vector rows without keys (or a torn row); both files are cut back
+        # to the rows that have both. Rows appended by other processes are then indexed.
+        assert self._dim is not None
+        keys_size = os.path.getsize(self._path("keys")) if os.path.exists(self._path("keys")) else 0
+        vecs_size = os.path.getsize(self._path("f32")) if os.path.exists(self._path("f32")) else 0
+        count = min(keys_size // self._key_size, vecs_size // (4 * self._dim))
+        for path, row_bytes in ((self._path("keys"), self._key_size), (self._path("f32"), 4 * self._dim)):
+            if os.path.exists(path) and os.path.getsize(path) != count * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(count * row_bytes)
+        if count > self._count:
+            with open(self._path("keys"), "rb") as f:
+                f.seek(self._count * self._key_size)
+                data = f.read((count - self._count) * self._key_size)
+            for i in range(count - self._count):
+                self._rows[data[i * self._key_size:(i + 1) * self._key_size]] = self._count + i
+            self._count = count
+
+    def _vectors(self) -> np.ndarray:
+        assert self._dim is not None
+        if self._mmap is None or self._mmap.shape[0] < self._count:
+            self._mmap = np.memmap(self._path("f32"), dtype=np.float32, mode="r", shape=(self._count, self._dim))
+        return self._mmap
+
+    def lookup(self, keys: Sequence[bytes]) -> np.ndarray:
+        with self._lock:
+            return np.array([self._rows.get(k, -1) for k in keys], dtype=np.int64)
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if len(rows) == 0 or self._count == 0:
+                return np.zeros((0, self._dim or 0), dtype=np.float32)
+            return np.array(self._vectors()[rows], dtype=np.float32)
+
+    def put(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            if self._dim is None:
+                if os.path.exists(self._path("json")):
+                    with open(self._path("json"), "r", encoding="utf-8") as f:
+                        self._dim = int(json.load(f)["dim"])
+                else:
+                    self._dim = int(vectors.shape[1])
+                    with open(self._path("json"), "w", encoding="utf-8") as f:
+                        json.dump({"dim": self._dim}, f)
+            if vectors.shape[1] != self._dim:
+                return
+            self._catch_up()
+            fresh: List[int] = []
+            seen = set()
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in seen:
+                    fresh.append(i)
+                    seen.add(key)
+            if not fresh:
+                return
+            for suffix, payload in (("f32", vectors[fresh].tobytes()), ("keys", b"".join(keys[i] for i in fresh))):
+                with open(self._path(suffix), "ab") as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            for offset, i in enumerate(fresh):
+                self._rows[keys[i]] = self._count + offset
+            self._count += len(fresh)
+
+
+_store: MmapVectorStore | None = None
+_store_lock = threading.Lock()
+
+
+def _get_store() -> MmapVectorStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", embedding_model_key())
+                _store = MmapVectorStore(os.path.join(settings.VECTOR_CACHE_DIR, slug), key_size=32)
+    return _store
+
+
+def content_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def embed_texts_cached(texts: List[str]) -> np.ndarray:
+    if not settings.VECTOR_CACHE_ENABLED or not texts:
+        return embed_texts(texts)
+    store = _get_store()
+    keys = [content_key(t) for t in texts]
+    rows = store.lookup(keys)
+    missing = np.flatnonzero(rows < 0)
+    if len(missing) == 0:
+        return store.read(rows)
+    # Identical chunks within one call are embedded once.
+    unique: Dict[bytes, int] = {}
+    for i in missing.tolist():
+        unique.setdefault(keys[i], i)
+    fresh = embed_texts([texts[i] for i in unique.values()])
+    store.put(list(unique.keys()), fresh)
+    by_key = {key: fresh[j] for j, key in enumerate(unique.keys())}
+    out = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+    hit = np.flatnonzero(rows >= 0)
+    if len(hit):
+        out[hit] = store.read(rows[hit])
+    for i in missing.tolist():
+        out[i] = by_key[keys[i]]
+    return out
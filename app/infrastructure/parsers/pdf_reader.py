@@ -1,9 +1,134 @@
-from typing import Iterable
-from pypdf import PdfReader
+import io
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, BinaryIO, Deque, Iterable, Iterator, List, Optional
+
+_COPY_BLOCK = 1024 * 1024
+
+
+def _pdf_reader(stream: Any) -> Any:
+    # pypdf is imported on first use, keeping it off the server's import path.
+    from pypdf import PdfReader
+
+    return PdfReader(stream)
 
 
 def extract_text_pages(file_path: str) -> Iterable[str]:
-    reader = PdfReader(file_path)
+    reader = _pdf_reader(file_path)
     for page in reader.pages:
         text = page.extract_text() or ""
         yield text
+
+
+def extract_text_from_bytes(data: bytes) -> str:
+    # Module-level so it can run in a process pool worker.
+    reader = _pdf_reader(io.BytesIO(data))
+    return "\n\n".join((page.extract_text() or "") for page in reader.pages)
+
+
+# Seekable read-only stream over a memoryview, so pypdf can parse a buffer in place.
+class _BufferStream(io.RawIOBase):
+    def __init__(self, buffer: memoryview) -> None:
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target: Any) -> int:
+        n = max(0, min(len(target), len(self._buffer) - self._pos))
+        target[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._buffer)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._buffer.release()
+        super().close()
+
+
+def _extract_shared_pages(name: str, size: int, start: int, stop: int) -> List[str]:
+    # Runs in a process pool worker: attach to the parent's copy instead of receiving one.
+    shm = shared_memory.SharedMemory(name=name)
+    view = shm.buf[:size]
+    try:
+        reader = _pdf_reader(_BufferStream(view))
+        texts = [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+        del reader
+        return texts
+    finally:
+        view.release()
+        shm.close()
+
+
+# An uploaded PDF held once in shared memory. Page ranges are parsed in parallel by
+# process pool workers and yielded in order, with a bounded number of ranges in flight.
+class SharedPdf:
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+
+    @classmethod
+    def from_stream(cls, stream: BinaryIO, hasher: Optional[Any] = None) -> "SharedPdf":
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        pdf = cls(size)
+        try:
+            offset = 0
+            while offset < size:
+                block = stream.read(min(_COPY_BLOCK, size - offset))
+                if not block:
+                    break
+                pdf._shm.buf[offset:offset + len(block)] = block
+                if hasher is not None:
+                    hasher.update(block)
+                offset += len(block)
+            pdf.size = offset
+        except BaseException:
+            pdf.close()
+            raise
+        return pdf
+
+    def page_count(self) -> int:
+        view = self._shm.buf[:self.size]
+        try:
+            reader = _pdf_reader(_BufferStream(view))
+            count = len(reader.pages)
+            del reader
+            return count
+        finally:
+            view.release()
+
+    def iter_pages(self, pool: Any, pages_per_task: int, max_pending: int) -> Iterator[str]:
+        total = self.page_count()
+        step = max(1, pages_per_task)
+        pending: Deque[Future] = deque()
+        next_start = 0
+        while next_start < total or pending:
+            while next_start < total and len(pending) < max(1, max_pending):
+                stop = min(total, next_start + step)
+                pending.append(pool.submit(_extract_shared_pages, self._shm.name, self.size, next_start, stop))
+                next_start = stop
+            yield from pending.popleft().result()
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedPdf":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
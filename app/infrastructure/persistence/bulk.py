@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app.infrastructure.persistence.models import Chunk
+
+_COPY_COLUMNS = ("id", "document_id", "chunk_index", "content", "token_count", "created_at")
+
+
+def insert_chunks(session: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    # Returns the new chunk ids in the order of `rows`. Runs inside the session's
+    # transaction; the caller commits.
+    if not rows:
+        return []
+    if session.get_bind().dialect.name == "postgresql":
+        return _copy_chunks(session, rows)
+    # Batched multi-row INSERT ... RETURNING. RETURNING order is unspecified on SQLite (and
+    # asking SQLAlchemy to sort falls back to one statement per row), so ids are matched
+    # back through chunk_index, which is unique within one call.
+    result = session.execute(insert(Chunk).returning(Chunk.id, Chunk.chunk_index), rows)
+    id_by_position = {int(position): int(cid) for cid, position in result}
+    return [id_by_position[int(row["chunk_index"])] for row in rows]
+
+
+def _copy_chunks(session: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    # COPY cannot return ids, so they are reserved from the serial's sequence up front
+    # and written explicitly; the whole batch is then one streamed COPY.
+    ids = [
+        int(r[0])
+        for r in session.execute(
+            text("SELECT nextval(pg_get_serial_sequence('chunks', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(rows)},
+        )
+    ]
+    now = datetime.utcnow()
+    raw = session.connection().connection.driver_connection
+    with raw.cursor() as cursor:
+        with cursor.copy(f"COPY chunks ({', '.join(_COPY_COLUMNS)}) FROM STDIN") as copy:
+            for cid, row in zip(ids, rows):
+                copy.write_row((cid, row["document_id"], row["chunk_index"], row["content"], row["token_count"], now))
+    return ids
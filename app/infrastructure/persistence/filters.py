@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.db import SessionLocal
+from app.infrastructure.persistence.models import Chunk, Document
+
+
+# Restricts retrieval to chunks of matching documents. Frozen so that it can key caches.
+@dataclass(frozen=True)
+class DocumentFilter:
+    source_type: Optional[str] = None
+    uri_prefix: Optional[str] = None
+    document_ids: Optional[Tuple[int, ...]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    @classmethod
+    def of(
+        cls,
+        source_type: Optional[str] = None,
+        uri_prefix: Optional[str] = None,
+        document_ids: Optional[Iterable[int]] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> Optional["DocumentFilter"]:
+        # None when nothing is restricted, so unfiltered requests keep the unfiltered path.
+        ids = tuple(sorted(set(int(i) for i in document_ids))) if document_ids is not None else None
+        # Naive datetimes are stored (UTC), so aware bounds are converted and made naive.
+        after, before = (_naive_utc(d) for d in (created_after, created_before))
+        if source_type is None and not uri_prefix and ids is None and after is None and before is None:
+            return None
+        return cls(source_type, uri_prefix or None, ids, after, before)
+
+    def conditions(self) -> List[Any]:
+        conditions: List[Any] = []
+        if self.source_type is not None:
+            conditions.append(Document.source_type == self.source_type)
+        if self.uri_prefix:
+            conditions.append(Document.uri.startswith(self.uri_prefix, autoescape=True))
+        if self.document_ids is not None:
+            conditions.append(Document.id.in_(self.document_ids))
+        if self.created_after is not None:
+            conditions.append(Document.created_at >= self.created_after)
+        if self.created_before is not None:
+            conditions.append(Document.created_at < self.created_before)
+        return conditions
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def resolve_chunk_ids(document_filter: DocumentFilter) -> np.ndarray:
+    # Sorted ids of every chunk whose document matches, as int64.
+    with SessionLocal() as session:
+        rows = (
+            session.query(Chunk.id)
+            .join(Document, Chunk.document_id == Document.id)
+            .filter(*document_filter.conditions())
+            .order_by(Chunk.id.asc())
+            .all()
+        )
+    return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
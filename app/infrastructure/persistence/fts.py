@@ -0,0 +1,104 @@
+import re
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.engine import Engine
+
+from app.core.db import IS_POSTGRES, SessionLocal
+from app.infrastructure.persistence.filters import DocumentFilter
+from app.infrastructure.persistence.models import Chunk, Document
+
+# External-content FTS5 index over chunks.content; triggers keep it in sync with
+# every insert, delete and content update on the chunks table.
+_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+    "content, content='chunks', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN "
+    "INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN "
+    "INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE OF content ON chunks BEGIN "
+    "INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+
+# PostgreSQL has no FTS5; a stored tsvector column with a GIN index plays the same role
+# and is maintained by the database on every insert and content update.
+_PG_DDL = [
+    "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_chunks_content_tsv ON chunks USING GIN (content_tsv)",
+]
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_FTS = table("chunks_fts", column("rowid"))
+
+
+def ensure_chunk_fts(engine: Engine) -> None:
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for statement in _PG_DDL:
+                conn.execute(text(statement))
+        return
+    with engine.begin() as conn:
+        existed = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chunks_fts'")
+        ).first() is not None
+        for statement in _FTS_DDL:
+            conn.execute(text(statement))
+        if not existed:
+            # Backfill chunks written before the index existed.
+            conn.execute(text("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')"))
+
+
+def _match_expression(query: str) -> str:
+    # Quote every term so user input can never be parsed as FTS5 query syntax.
+    terms = _TOKEN_RE.findall(query)
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _restrict(stmt: Any, document_filter: Optional[DocumentFilter]) -> Any:
+    if document_filter is None:
+        return stmt
+    return stmt.join(Document, Document.id == Chunk.document_id).where(*document_filter.conditions())
+
+
+def _lexical_search_pg(query: str, limit: int, document_filter: Optional[DocumentFilter]) -> Tuple[List[int], List[float]]:
+    # \w+ tokens carry no tsquery operators, so OR-ing them is safe; matches FTS5's OR semantics.
+    terms = _TOKEN_RE.findall(query)
+    if not terms or limit <= 0:
+        return [], []
+    tsquery = func.to_tsquery("simple", " | ".join(terms))
+    content_tsv = literal_column("chunks.content_tsv")
+    stmt = (
+        select(Chunk.id, func.ts_rank_cd(content_tsv, tsquery).label("rank"))
+        .where(content_tsv.op("@@")(tsquery))
+        .order_by(text("rank DESC"))
+        .limit(limit)
+    )
+    with SessionLocal() as session:
+        rows = session.execute(_restrict(stmt, document_filter)).all()
+    return [int(r[0]) for r in rows], [float(r[1]) for r in rows]
+
+
+def lexical_search(
+    query: str, limit: int, document_filter: Optional[DocumentFilter] = None
+) -> Tuple[List[int], List[float]]:
+    if IS_POSTGRES:
+        return _lexical_search_pg(query, limit, document_filter)
+    expression = _match_expression(query)
+    if not expression or limit <= 0:
+        return [], []
+    stmt = (
+        select(_FTS.c.rowid, literal_column("bm25(chunks_fts)").label("rank"))
+        .select_from(_FTS)
+        .where(text("chunks_fts MATCH :expression"))
+        .order_by(text("rank"))
+        .limit(limit)
+    )
+    if document_filter is not None:
+        stmt = _restrict(stmt.join(Chunk, Chunk.id == _FTS.c.rowid), document_filter)
+    with SessionLocal() as session:
+        rows = session.execute(stmt, {"expression": expression}).all()
+    # bm25() is lower-is-better; flip it so every retriever reports higher-is-better scores.
+    return [int(r[0]) for r in rows], [-float(r[1]) for r in rows]
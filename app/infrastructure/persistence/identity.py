@@ -0,0 +1,30 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.core.db import SessionLocal
+from app.infrastructure.persistence.models import StoreMeta
+
+_DATABASE_ID_KEY = "database_id"
+_database_id: Optional[str] = None
+
+
+def database_id() -> str:
+    # A random id created once per metadata database. Files derived from the database (the
+    # vector index) record it, so pointing DATABASE_URL at another database is detected
+    # instead of mixing its chunk ids with the old ones.
+    global _database_id
+    if _database_id is None:
+        with SessionLocal() as session:
+            entry = session.get(StoreMeta, _DATABASE_ID_KEY)
+            if entry is None:
+                session.add(StoreMeta(key=_DATABASE_ID_KEY, value=uuid.uuid4().hex))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another process created it first.
+                    session.rollback()
+                entry = session.get(StoreMeta, _DATABASE_ID_KEY)
+            _database_id = entry.value
+    return _database_id
@@ -30,3 +30,19 @@ class Chunk(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     document = relationship("Document", back_populates="chunks")
+
+
+class AnswerCacheEntry(Base):
+    __tablename__ = "answer_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(128), nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class StoreMeta(Base):
+    __tablename__ = "kb_meta"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(String(256), nullable=False)
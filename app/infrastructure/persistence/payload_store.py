@@ -0,0 +1,353 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Any, BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.infrastructure.persistence.identity import database_id
+from app.infrastructure.persistence.models import Chunk, Document
+
+logger = logging.getLogger(__name__)
+
+# One fixed-size record per chunk write; the latest record for an id wins and a
+# negative length marks a removal.
+_RECORD = np.dtype([("id", "<i8"), ("document_id", "<i8"), ("offset", "<i8"), ("length", "<i4"), ("chunk_index", "<i4")])
+_REMOVED = -1
+_REBUILD_BATCH = 1000
+# Chunk ids written by processes that do not own the store, as little-endian int64s.
+_FOREIGN = "foreign.ids"
+# Text left behind by removals is reclaimed at startup once it outweighs the live text.
+_GARBAGE_MIN_BYTES = 16 * 1024 * 1024
+
+
+class ChunkPayload(NamedTuple):
+    document_id: int
+    chunk_index: int
+    offset: int
+    length: int
+
+
+# Everything a search result shows for a chunk, addressable by chunk id: chunk text in a
+# memory-mapped append-only blob, `chunks.idx` records pointing into it, and a small
+# document table for uris. The database remains the system of record; the store is
+# rebuilt from it after an unclean shutdown or whenever the two disagree.
+class PayloadStore:
+    def __init__(self, directory: str) -> None:
+        self._dir = directory
+        self._lock = threading.Lock()
+        self._chunks: Dict[int, ChunkPayload] = {}
+        self._uris: Dict[int, Optional[str]] = {}
+        self._blob_size = 0
+        self._live_bytes = 0
+        self._map: Optional[mmap.mmap] = None
+        self._blob: Optional[BinaryIO] = None
+        self._records: Optional[BinaryIO] = None
+        self._documents: Optional[BinaryIO] = None
+        self._owner: Optional[BinaryIO] = None
+        self._foreign_seen = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._dir, name)
+
+    def open(self) -> bool:
+        # The files are written by one process only: offsets come from the in-memory blob
+        # size and a rebuild truncates them. Another process that finds the directory locked
+        # gets False, hydrates from the database and reports the chunks it writes through
+        # `foreign.ids` (see invalidate_foreign).
+        with self._lock:
+            os.makedirs(self._dir, exist_ok=True)
+            owner = open(self._path("lock"), "wb")
+            try:
+                fcntl.flock(owner.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                owner.close()
+                return False
+            self._owner = owner
+            state = self._read_state()
+            # A store written for another database (DATABASE_URL changed) is rebuilt as well.
+            rebuild = not state.get("clean") or state.get("database") not in (None, database_id())
+            if not rebuild:
+                self._load()
+                self._foreign_seen = int(state.get("foreign", 0))
+                dead = self._blob_size - self._live_bytes
+                rebuild = not self._matches_db() or (dead > self._live_bytes and dead > _GARBAGE_MIN_BYTES)
+            if rebuild:
+                # Everything reported before the rebuild reads the database is already covered.
+                self._foreign_seen = self._foreign_size()
+            # Marked dirty before the first write, so a crash while open forces a rebuild.
+            self._write_state(clean=False)
+            if rebuild:
+                self._rebuild_from_db()
+            else:
+                self._open_files("ab")
+        self._catch_up()
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            for handle in (self._blob, self._records, self._documents):
+                if handle is not None:
+                    handle.close()
+            self._blob = self._records = self._documents = None
+            if self._owner is not None:
+                self._write_state(clean=True)
+                self._owner.close()
+                self._owner = None
+
+    def _read_state(self) -> Dict[str, Any]:
+        try:
+            with open(self._path("state.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, clean: bool) -> None:
+        tmp = self._path("state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"clean": clean, "database": database_id(), "foreign": self._foreign_seen}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("state.json"))
+
+    def _open_files(self, mode: str) -> None:
+        self._blob = open(self._path("chunks.bin"), mode)
+        self._records = open(self._path("chunks.idx"), mode)
+        self._documents = open(self._path("documents.jsonl"), mode)
+
+    def _load(self) -> None:
+        self._uris = {}
+        if os.path.exists(self._path("documents.jsonl")):
+            with open(self._path("documents.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._uris[int(entry["id"])] = entry["uri"]
+        records = np.zeros(0, dtype=_RECORD)
+        if os.path.exists(self._path("chunks.idx")):
+            records = np.fromfile(self._path("chunks.idx"), dtype=_RECORD)
+        self._chunks = {}
+        for cid, document_id, offset, length, chunk_index in records.tolist():
+            if length == _REMOVED:
+                self._chunks.pop(cid, None)
+            else:
+                self._chunks[cid] = ChunkPayload(document_id, chunk_index, offset, length)
+        self._live_bytes = sum(p.length for p in self._chunks.values())
+        self._blob_size = os.path.getsize(self._path("chunks.bin")) if os.path.exists(self._path("chunks.bin")) else 0
+        self._map = None
+
+    def _matches_db(self) -> bool:
+        # A cheap consistency check for a store that was closed cleanly: the database may
+        # still have been changed by another process or restored from a backup.
+        with SessionLocal() as session:
+            count, max_id = session.query(func.count(Chunk.id), func.max(Chunk.id)).one()
+        return int(count or 0) == len(self._chunks) and int(max_id or 0) == max(self._chunks, default=0)
+
+    def _rebuild_from_db(self) -> None:
+        self._chunks = {}
+        self._uris = {}
+        self._blob_size = 0
+        self._live_bytes = 0
+        self._map = None
+        self._open_files("wb")
+        last_id = 0
+        with SessionLocal() as session:
+            for document_id, uri in session.query(Document.id, Document.uri).all():
+                self._write_document(int(document_id), uri)
+            while True:
+                rows = (
+                    session.query(Chunk.id, Chunk.document_id, Chunk.chunk_index, Chunk.content)
+                    .filter(Chunk.id > last_id)
+                    .order_by(Chunk.id.asc())
+                    .limit(_REBUILD_BATCH)
+                    .all()
+                )
+                if not rows:
+                    break
+                self._append([(int(r.id), int(r.document_id), int(r.chunk_index), r.content) for r in rows])
+                last_id = rows[-1].id
+
+    def _write_document(self, document_id: int, uri: Optional[str]) -> None:
+        assert self._documents is not None
+        self._documents.write((json.dumps({"id": document_id, "uri": uri}) + "\n").encode("utf-8"))
+        self._documents.flush()
+        self._uris[document_id] = uri
+
+    def _append(self, rows: Sequence[Tuple[int, int, int, str]]) -> None:
+        assert self._blob is not None and self._records is not None
+        encoded = [content.encode("utf-8") for _, _, _, content in rows]
+        records = np.zeros(len(rows), dtype=_RECORD)
+        offset = self._blob_size
+        for i, ((cid, document_id, chunk_index, _), data) in enumerate(zip(rows, encoded)):
+            records[i] = (cid, document_id, offset, len(data), chunk_index)
+            offset += len(data)
+        # Text reaches the file before the records that point into it, and both before
+        # the ids become visible to readers.
+        self._blob.write(b"".join(encoded))
+        self._blob.flush()
+        self._records.write(records.tobytes())
+        self._records.flush()
+        for cid, document_id, record_offset, length, chunk_index in records.tolist():
+            previous = self._chunks.get(cid)
+            if previous is not None:
+                self._live_bytes -= previous.length
+            self._chunks[cid] = ChunkPayload(document_id, chunk_index, record_offset, length)
+            self._live_bytes += length
+        self._blob_size = offset
+
+    def put(
+        self, document_id: int, uri: Optional[str], ids: Sequence[int], chunk_indexes: Iterable[int], texts: Sequence[str]
+    ) -> None:
+        if not ids:
+            return
+        with self._lock:
+            if self._blob is None:
+                return
+            if document_id not in self._uris or self._uris[document_id] != uri:
+                self._write_document(document_id, uri)
+            self._append([(int(cid), document_id, int(idx), text) for cid, idx, text in zip(ids, chunk_indexes, texts)])
+
+    def remove(self, ids: Sequence[int]) -> None:
+        with self._lock:
+            if self._records is None:
+                return
+            gone = [cid for cid in dict.fromkeys(int(c) for c in ids) if cid in self._chunks]
+            if not gone:
+                return
+            records = np.zeros(len(gone), dtype=_RECORD)
+            records["id"] = gone
+            records["length"] = _REMOVED
+            self._records.write(records.tobytes())
+            self._records.flush()
+            for cid in gone:
+                self._live_bytes -= self._chunks.pop(cid).length
+
+    def _foreign_size(self) -> int:
+        try:
+            return os.path.getsize(self._path(_FOREIGN)) // 8 * 8
+        except OSError:
+            return 0
+
+    def _catch_up(self) -> None:
+        # Chunks another process changed since the last look are dropped (with a removal
+        # record, so a restart agrees) and hydrate from the database from now on.
+        size = self._foreign_size()
+        if size <= self._foreign_seen:
+            return
+        with self._lock:
+            if size <= self._foreign_seen:
+                return
+            with open(self._path(_FOREIGN), "rb") as f:
+                f.seek(self._foreign_seen)
+                ids = np.frombuffer(f.read(size - self._foreign_seen), dtype="<i8")
+            self._foreign_seen = size
+        self.remove(ids.tolist())
+
+    def _view(self, end: int) -> mmap.mmap:
+        view = self._map
+        if view is None or len(view) < end:
+            with self._lock:
+                if self._map is None or len(self._map) < end:
+                    # Earlier maps are left to the garbage collector: concurrent readers may still hold them.
+                    with open(self._path("chunks.bin"), "rb") as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = self._map
+        return view
+
+    def get(self, ids: Sequence[int]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+        # Lock-free on the common path: entries are immutable tuples and text is read
+        # from the shared map. Returns the payloads found and the ids that were not.
+        self._catch_up()
+        found: Dict[int, Dict[str, Any]] = {}
+        missing: List[int] = []
+        for cid in ids:
+            payload = self._chunks.get(cid)
+            if payload is None:
+                missing.append(cid)
+                continue
+            text = b""
+            if payload.length:
+                end = payload.offset + payload.length
+                text = self._view(end)[payload.offset:end]
+            found[cid] = {
+                "content": text.decode("utf-8"),
+                "document_id": payload.document_id,
+                "uri": self._uris.get(payload.document_id),
+                "chunk_index": payload.chunk_index,
+            }
+        return found, missing
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": len(self._chunks),
+            "documents": len(self._uris),
+            "blob_bytes": self._blob_size,
+            "live_bytes": self._live_bytes,
+        }
+
+
+def invalidate_foreign(directory: str, ids: Sequence[int]) -> None:
+    # One O_APPEND write per call, so records from several processes never interleave.
+    if not len(ids):
+        return
+    fd = os.open(os.path.join(directory, _FOREIGN), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, np.asarray(ids, dtype="<i8").tobytes())
+    finally:
+        os.close(fd)
+
+
+_store: Optional[PayloadStore] = None
+# Set in processes that found the store owned by another one.
+_foreign_dir: Optional[str] = None
+
+
+def open_payload_store() -> None:
+    global _store, _foreign_dir
+    if not settings.PAYLOAD_STORE_ENABLED:
+        return
+    store = PayloadStore(settings.PAYLOAD_STORE_DIR)
+    if not store.open():
+        logger.info("Payload store %s is open in another process; hydrating from the database", settings.PAYLOAD_STORE_DIR)
+        _foreign_dir = settings.PAYLOAD_STORE_DIR
+        return
+    _store = store
+
+
+def close_payload_store() -> None:
+    global _store, _foreign_dir
+    _foreign_dir = None
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+def get_payload_store() -> Optional[PayloadStore]:
+    return _store
+
+
+# Called by the write paths after the database commit and before the index changes, so
+# an id a search can return always has its payload.
+def mirror_chunks(
+    document_id: int, uri: Optional[str], ids: Sequence[int], chunk_indexes: Iterable[int], texts: Sequence[str]
+) -> None:
+    if _store is not None:
+        _store.put(document_id, uri, ids, chunk_indexes, texts)
+    elif _foreign_dir is not None:
+        invalidate_foreign(_foreign_dir, ids)
+
+
+def forget_chunks(ids: Sequence[int]) -> None:
+    if _store is not None:
+        _store.remove(ids)
+    elif _foreign_dir is not None:
+        invalidate_foreign(_foreign_dir, ids)
+
+
+def payload_stats() -> Dict[str, Any]:
+    return _store.stats() if _store is not None else {"enabled": False}
@@ -0,0 +1,115 @@
+import re
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.infrastructure.text.text_utils import clean_text, estimate_tokens, iter_chunks
+
+CHUNKERS = ("chars", "sentences")
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+_TOKEN_BATCH = 256
+
+
+class TextChunk(NamedTuple):
+    text: str
+    token_count: int
+
+
+def clean_paragraphs(pieces: Iterable[str], hasher: Optional[Any] = None) -> Iterator[str]:
+    # Cleans each paragraph exactly once. The paragraphs joined by single spaces are
+    # identical to clean_text() of the whole input, and that is what `hasher` receives.
+    first = True
+    for piece in pieces:
+        for raw in _PARAGRAPH_RE.split(piece):
+            paragraph = clean_text(raw)
+            if not paragraph:
+                continue
+            if hasher is not None:
+                hasher.update((paragraph if first else " " + paragraph).encode("utf-8"))
+            first = False
+            yield paragraph
+
+
+# Fixed-size character windows (the original behaviour).
+class CharChunker:
+    def __init__(self, chunk_size: int, overlap: int) -> None:
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunks(self, pieces: Iterable[str], hasher: Optional[Any] = None) -> Iterator[TextChunk]:
+        for text in iter_chunks(clean_paragraphs(pieces, hasher), self.chunk_size, self.overlap):
+            yield TextChunk(text, estimate_tokens(text))
+
+
+# Packs whole sentences into chunks of at most `chunk_size` model tokens, repeating up
+# to `overlap` tokens of trailing sentences at the start of the next chunk. Paragraphs
+# are streamed and sentences tokenized in batches, so nothing is materialized up front.
+class SentenceChunker:
+    def __init__(self, chunk_size: int, overlap: int, count_tokens: Callable[[List[str]], List[int]]) -> None:
+        self.chunk_size = max(1, chunk_size)
+        self.overlap = max(0, min(overlap, self.chunk_size - 1))
+        self._count_tokens = count_tokens
+
+    def _sentences(self, pieces: Iterable[str], hasher: Optional[Any]) -> Iterator[str]:
+        for paragraph in clean_paragraphs(pieces, hasher):
+            for sentence in _SENTENCE_RE.split(paragraph):
+                if sentence:
+                    yield sentence
+
+    def _counted(self, sentences: Iterator[str]) -> Iterator[Tuple[str, int]]:
+        batch: List[str] = []
+        for sentence in sentences:
+            batch.append(sentence)
+            if len(batch) >= _TOKEN_BATCH:
+                yield from zip(batch, self._count_tokens(batch))
+                batch = []
+        if batch:
+            yield from zip(batch, self._count_tokens(batch))
+
+    def _units(self, counted: Iterator[Tuple[str, int]]) -> Iterator[Tuple[str, int]]:
+        # A sentence longer than a whole chunk is cut into word runs of about chunk_size tokens.
+        for sentence, tokens in counted:
+            if tokens <= self.chunk_size:
+                yield sentence, tokens
+                continue
+            words = sentence.split(" ")
+            per_piece = max(1, len(words) * self.chunk_size // tokens)
+            for start in range(0, len(words), per_piece):
+                part = words[start:start + per_piece]
+                yield " ".join(part), max(1, tokens * len(part) // len(words))
+
+    def chunks(self, pieces: Iterable[str], hasher: Optional[Any] = None) -> Iterator[TextChunk]:
+        current: List[Tuple[str, int]] = []
+        tokens = 0
+        fresh = False
+        for text, count in self._units(self._counted(self._sentences(pieces, hasher))):
+            if current and tokens + count > self.chunk_size:
+                if fresh:
+                    yield TextChunk(" ".join(t for t, _ in current), tokens)
+                    fresh = False
+                    kept = 0
+                    keep_from = len(current)
+                    while keep_from > 0 and kept + current[keep_from - 1][1] <= self.overlap:
+                        keep_from -= 1
+                        kept += current[keep_from][1]
+                    current = current[keep_from:]
+                    tokens = kept
+                while current and tokens + count > self.chunk_size:
+                    tokens -= current.pop(0)[1]
+            current.append((text, count))
+            tokens += count
+            fresh = True
+        if fresh:
+            yield TextChunk(" ".join(t for t, _ in current), tokens)
+
+
+def get_chunker() -> Any:
+    kind = settings.CHUNKER.strip().lower()
+    if kind == "chars":
+        return CharChunker(settings.CHUNK_SIZE_CHARS, settings.CHUNK_OVERLAP_CHARS)
+    if kind == "sentences":
+        from app.infrastructure.embeddings.provider import count_tokens
+
+        return SentenceChunker(settings.CHUNK_SIZE_TOKENS, settings.CHUNK_OVERLAP_TOKENS, count_tokens)
+    raise ValueError(f"Unsupported CHUNKER '{settings.CHUNKER}', expected one of {', '.join(CHUNKERS)}")
@@ -1,5 +1,5 @@
 import re
-from typing import Iterable, List
+from typing import Iterable, Iterator, List
 
 
 _WHITESPACE_RE = re.compile(r"\s+")
@@ -17,11 +17,11 @@ def estimate_tokens(text: str) -> int:
 
 
 def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
-    if chunk_size <= 0:
-        return [text]
     text = clean_text(text)
     if not text:
         return []
+    if chunk_size <= 0:
+        return [text]
     chunks: List[str] = []
     start = 0
     n = len(text)
@@ -34,3 +34,29 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
             break
         start += step
     return chunks
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int, overlap: int) -> Iterator[str]:
+    # Streaming equivalent of chunk_text(" ".join(pieces)) for already-cleaned pieces:
+    # only the unread tail of the text is buffered.
+    step = max(1, chunk_size - overlap)
+    buffer = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer = f"{buffer} {piece}" if buffer else piece
+        if chunk_size <= 0:
+            continue
+        while len(buffer) > chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]
+    if not buffer:
+        return
+    if chunk_size <= 0:
+        yield buffer
+        return
+    while True:
+        yield buffer[:chunk_size]
+        if len(buffer) <= chunk_size:
+            return
+        buffer = buffer[step:]
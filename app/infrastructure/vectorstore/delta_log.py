@@ -0,0 +1,148 @@
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+OP_ADD = b"A"
+OP_REMOVE = b"R"
+
+# op, count, dim, crc32(payload)
+_HEADER = struct.Struct("<cIII")
+
+
+# Append-only log of index mutations split into numbered segments. A snapshot
+# taken at `rotate()` covers every segment below the returned sequence number.
+class DeltaLog:
+    def __init__(self, prefix: str) -> None:
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._file = None
+        self._seq = 0
+        self._bytes = 0
+
+    def _segment_path(self, seq: int) -> str:
+        return f"{self._prefix}.{seq:08d}"
+
+    def segments(self) -> List[Tuple[int, str]]:
+        directory = os.path.dirname(self._prefix) or "."
+        base = os.path.basename(self._prefix) + "."
+        found: List[Tuple[int, str]] = []
+        if not os.path.isdir(directory):
+            return found
+        for name in os.listdir(directory):
+            if not name.startswith(base):
+                continue
+            suffix = name[len(base):]
+            if suffix.isdigit():
+                found.append((int(suffix), os.path.join(directory, name)))
+        found.sort()
+        return found
+
+    def open(self) -> None:
+        with self._lock:
+            existing = self.segments()
+            # Always start a fresh segment so a torn tail is never appended to.
+            self._seq = (existing[-1][0] + 1) if existing else 1
+            self._bytes = self._disk_size()
+            self._open_active()
+
+    def _open_active(self) -> None:
+        os.makedirs(os.path.dirname(self._prefix) or ".", exist_ok=True)
+        self._file = open(self._segment_path(self._seq), "ab")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                empty = self._file.tell() == 0
+                self._file.close()
+                self._file = None
+                # Every open starts a new segment; an unused one is not left behind.
+                if empty:
+                    os.remove(self._segment_path(self._seq))
+
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _disk_size(self) -> int:
+        total = 0
+        for _, path in self.segments():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def append_add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._append(OP_ADD, ids, vectors.shape[1], ids.tobytes() + vectors.tobytes())
+
+    def append_remove(self, ids: np.ndarray) -> None:
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self._append(OP_REMOVE, ids, 0, ids.tobytes())
+
+    def _append(self, op: bytes, ids: np.ndarray, dim: int, payload: bytes) -> None:
+        header = _HEADER.pack(op, len(ids), dim, zlib.crc32(payload))
+        with self._lock:
+            assert self._file is not None
+            self._file.write(header + payload)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._bytes += len(header) + len(payload)
+
+    def rotate(self) -> int:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._seq += 1
+            self._open_active()
+            return self._seq
+
+    def drop_before(self, seq: int) -> None:
+        for s, path in self.segments():
+            if s >= seq:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes = self._disk_size()
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            for _, path in self.segments():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._seq = 1
+            self._bytes = 0
+            self._open_active()
+
+    def replay(self, before: Optional[int] = None) -> Iterator[Tuple[bytes, np.ndarray, Optional[np.ndarray]]]:
+        for seq, path in self.segments():
+            if before is not None and seq >= before:
+                break
+            with open(path, "rb") as f:
+                while True:
+                    header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+                    op, count, dim, crc = _HEADER.unpack(header)
+                    size = count * 8 + count * dim * 4
+                    payload = f.read(size)
+                    # A short or corrupt record is a torn write from a crash; the rest of the segment is unusable.
+                    if len(payload) < size or zlib.crc32(payload) != crc:
+                        break
+                    ids = np.frombuffer(payload, dtype=np.int64, count=count)
+                    vectors = None
+                    if op == OP_ADD:
+                        vectors = np.frombuffer(payload, dtype=np.float32, offset=count * 8).reshape(count, dim)
+                    yield op, ids, vectors
@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Full-precision vectors addressed directly by id: row `id` of one float32 file, so a
+# lookup is a single fancy index into a read-only memory map. Rows never written (ids
+# not stored yet, file holes) read back as zeros and are reported missing; embeddings
+# are normalized, so a real vector is never all zeros.
+class ExactVectors:
+    def __init__(self, path: str, dimension: int) -> None:
+        self._path = path
+        self._dim = dimension
+        self._row_bytes = 4 * dimension
+        self._lock = threading.Lock()
+        self._map: Optional[np.memmap] = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta_path = path + ".json"
+        stored_dim = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                stored_dim = int(json.load(f)["dim"])
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if stored_dim != dimension:
+            # Written by another model; every row is stale.
+            os.ftruncate(self._fd, 0)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dimension}, f)
+
+    def put(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        rows = np.ascontiguousarray(vectors[order], dtype=np.float32)
+        # One write per run of consecutive ids; ids are allocated sequentially, so runs are long.
+        breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+        with self._lock:
+            for start, stop in zip(np.concatenate([[0], breaks]), np.concatenate([breaks, [len(ids)]])):
+                os.pwrite(self._fd, rows[start:stop].tobytes(), int(ids[start]) * self._row_bytes)
+
+    def _view(self) -> Optional[np.memmap]:
+        size = os.fstat(self._fd).st_size // self._row_bytes
+        view = self._map
+        if view is None or view.shape[0] < size:
+            with self._lock:
+                if size == 0:
+                    return None
+                if self._map is None or self._map.shape[0] < size:
+                    # Earlier maps are left to the garbage collector: concurrent readers may still hold them.
+                    self._map = np.memmap(self._path, dtype=np.float32, mode="r", shape=(size, self._dim))
+                view = self._map
+        return view
+
+    def read(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (vectors, present) for `ids` of any shape; absent rows are zeros.
+        ids = np.asarray(ids, dtype=np.int64)
+        out = np.zeros(ids.shape + (self._dim,), dtype=np.float32)
+        view = self._view()
+        if view is None:
+            return out, np.zeros(ids.shape, dtype=bool)
+        inside = (ids >= 0) & (ids < view.shape[0])
+        out[inside] = view[ids[inside]]
+        present = inside & np.any(out != 0, axis=-1)
+        return out, present
+
+    def missing(self, ids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        absent = []
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            absent.append(batch[~self.read(batch)[1]])
+        return np.concatenate(absent) if absent else np.zeros(0, dtype=np.int64)
+
+    def close(self) -> None:
+        with self._lock:
+            os.close(self._fd)
@@ -1,136 +1,835 @@
+import fcntl
 import json
+import logging
 import os
 import threading
-from typing import List, Dict, Any
+import time
+from typing import BinaryIO, List, Dict, Any, Iterable, Optional, Set, Tuple
 
 import faiss
 import numpy as np
+from sqlalchemy import ARRAY, Integer, any_, bindparam, func
 
 from app.core.config import settings
-from app.core.db import SessionLocal
+from app.core.db import IS_POSTGRES, SessionLocal
+from app.core.metrics import Family, record_stage, register_collector, timed_lock
+from app.infrastructure.persistence.identity import database_id
 from app.infrastructure.persistence.models import Chunk, Document
-from app.infrastructure.embeddings.sentence_transformer_provider import embed_texts
+from app.infrastructure.persistence.payload_store import get_payload_store
+from app.infrastructure.embeddings.provider import embedding_model_key
+from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+from app.infrastructure.vectorstore.delta_log import DeltaLog, OP_ADD, OP_REMOVE
+from app.infrastructure.vectorstore.index_factory import (
+    apply_search_params,
+    build_index,
+    detect_index_type,
+    index_memory_bytes,
+    is_lossy,
+    min_training_points,
+    needs_rescore,
+    normalize_index_type,
+    requires_training,
+    supports_remove,
+)
+from app.infrastructure.vectorstore.exact_store import ExactVectors
+from app.infrastructure.vectorstore.partition import shard_filter
+from app.infrastructure.vectorstore.rebuild import IndexRebuild, new_rebuild
+from app.infrastructure.vectorstore.snapshot import AllowedIds, IndexSnapshot, SnapshotDraft, index_vectors, mutable_copy
 
+logger = logging.getLogger(__name__)
 
+# Rebuild an index that cannot delete in place once this share of it is tombstoned.
+_TOMBSTONE_PURGE_RATIO = 0.2
+
+Op = Tuple[bytes, np.ndarray, Optional[np.ndarray]]
+
+
+def _ids_match(column: Any, ids: List[int]) -> Any:
+    # On PostgreSQL one array parameter (= ANY) keeps a single cached plan for every k,
+    # where IN expands to a different statement per list length.
+    if IS_POSTGRES:
+        return column == any_(bindparam("hydrate_ids", value=list(ids), type_=ARRAY(Integer)))
+    return column.in_(ids)
+
+
+# Searches read the published IndexSnapshot without locking. Writers serialize on
+# `_lock`, log to the WAL, and publish a new snapshot whose small flat delta segments
+# hold recent adds; the compactor merges deltas into a fresh base off the lock.
 class VectorIndex:
-    _index: faiss.Index | None = None
-    _lock = threading.RLock()
+    _snapshot: IndexSnapshot | None = None
+    _lock = threading.Lock()
     _dim: int | None = None
+    _wal: DeltaLog | None = None
+    _compact_lock = threading.Lock()
+    _compact_event = threading.Event()
+    _compactor: threading.Thread | None = None
+    _last_compaction: float = 0.0
+    _target_type: str = "flat"
+    _shadow_ops: List[Op] | None = None
+    # Full-precision copies of base vectors, kept while the base (or its target) is compressed.
+    _exact: ExactVectors | None = None
+    # A full re-embedding in progress; every mutation since it started is logged under
+    # INDEX_REBUILD_DIR (not held in memory) and replayed onto the rebuilt index at the swap.
+    _rebuild_job: IndexRebuild | None = None
+    _rebuild_log: DeltaLog | None = None
+    # The model behind the served vectors. After a same-width model change it is not the
+    # configured one until the rebuild swaps in: vector search is off meanwhile and new
+    # vectors only go to the rebuild log, so the served index never mixes two vector spaces.
+    _serving_model: str | None = None
+    # New-model adds that arrive while a rebuild swaps in over such a stale index.
+    _held_ops: List[Op] | None = None
+    # Bumped on every change to the searchable contents; result caches key off it.
+    _generation: int = 0
+    _owner: BinaryIO | None = None
+
+    @classmethod
+    def generation(cls) -> int:
+        return cls._generation
+
+    @classmethod
+    def touch(cls) -> None:
+        # The vectors are unchanged but what results show for them (e.g. chunk positions) moved.
+        with cls._lock:
+            cls._generation += 1
+
+    @classmethod
+    def serves_current_model(cls) -> bool:
+        return cls._serving_model in (None, embedding_model_key())
 
     @classmethod
     def initialize(cls, dimension: int) -> None:
         with cls._lock:
+            cls._acquire_owner()
             cls._dim = dimension
-            if os.path.exists(settings.INDEX_PATH):
-                idx = faiss.read_index(settings.INDEX_PATH)
-                if isinstance(idx, (faiss.IndexIDMap, faiss.IndexIDMap2)):
-                    cls._index = idx
+            cls._target_type = normalize_index_type(settings.INDEX_TYPE)
+            cls._wal = DeltaLog(settings.INDEX_WAL_PATH)
+            base: faiss.Index | None = None
+            needs_rebuild = False
+            needs_save = False
+            meta = cls._stored_meta()
+            # An index built from another metadata database (DATABASE_URL changed) holds ids
+            # that mean something else here: it is discarded and rebuilt from this one.
+            foreign = meta.get("database") not in (None, database_id())
+            if foreign:
+                logger.warning("Vector index was built from another database; rebuilding it")
+                needs_rebuild = True
+            elif os.path.exists(settings.INDEX_PATH):
+                idx = cls._read_base()
+                if isinstance(idx, (faiss.IndexIDMap, faiss.IndexIDMap2)) and idx.d == dimension:
+                    base = idx
+                elif not isinstance(idx, (faiss.IndexIDMap, faiss.IndexIDMap2)) and idx.d == dimension and idx.ntotal == 0:
+                    base = faiss.IndexIDMap2(idx)
+                    needs_save = True
                 else:
-                    if idx.d != dimension:
-                        cls._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
-                        cls._persist_meta()
-                        cls._save()
-                        cls._rebuild_from_db()
-                    elif idx.ntotal == 0:
-                        cls._index = faiss.IndexIDMap2(idx)
-                        cls._persist_meta()
-                        cls._save()
-                    else:
-                        cls._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
-                        cls._persist_meta()
-                        cls._save()
-                        cls._rebuild_from_db()
-                if cls._index is not None and cls._index.d != dimension:
-                    cls._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
-                    cls._persist_meta()
-                    cls._save()
-                    cls._rebuild_from_db()
+                    needs_rebuild = True
             else:
-                cls._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
-                cls._persist_meta()
-                cls._save()
+                needs_save = True
+            if base is None:
+                base = cls._new_index(dimension)
+            cls._serving_model = embedding_model_key() if needs_rebuild else meta.get("model") or embedding_model_key()
+            # A model change of the same width keeps the old vectors (for removals, not for
+            # search) until the rebuild swaps; an interrupted rebuild for this model is resumed.
+            rebuild = needs_rebuild or meta.get("model") not in (None, embedding_model_key())
+            rebuild = rebuild or IndexRebuild.pending(settings.INDEX_REBUILD_DIR, embedding_model_key())
+            if needs_rebuild:
+                # The old index cannot serve this model: an empty one (plus new writes) serves
+                # until the rebuild fills it, and its pending deltas are obsolete.
+                cls._wal.reset()
+                needs_save = True
+            base_type = detect_index_type(base)
+            apply_search_params(base, base_type)
+            cls._open_exact(dimension, base_type)
+            deleted = cls._load_tombstones(base_type) if not needs_rebuild else set()
+            if cls._exact is not None and is_lossy(base_type) and cls.serves_current_model():
+                cls._backfill_exact(cls._present_ids(base, deleted))
+            draft = SnapshotDraft(dimension, base, base_type, deleted=deleted)
+            # Replay is idempotent: segments already folded into the snapshot (a crash
+            # between snapshot and segment cleanup) re-apply to the same end state.
+            cls._apply_ops(draft, cls._wal.replay(), cls._present_ids(base, deleted))
+            cls._wal.open()
+            if needs_save or "database" not in meta:
+                cls._persist_meta(base_type)
+            if needs_save:
+                cls._write_snapshot(faiss.serialize_index(base), np.array(sorted(deleted), dtype=np.int64))
+            cls._last_compaction = time.monotonic()
+            cls._publish(draft)
+        cls._start_compactor()
+        cls._maybe_schedule_compaction()
+        if not cls.serves_current_model():
+            logger.warning(
+                "Vector index holds %s vectors; searches are lexical until the rebuild for %s swaps in",
+                cls._serving_model,
+                embedding_model_key(),
+            )
+        if rebuild:
+            if settings.INDEX_REBUILD_BACKGROUND:
+                cls.start_rebuild()
+            else:
+                cls._run_rebuild(cls._begin_rebuild())
+
+    @classmethod
+    def _acquire_owner(cls) -> None:
+        # One process owns an index: its WAL segment numbers, snapshots and compactions assume
+        # no other writer, so a second process opening the same INDEX_PATH is refused.
+        # Several API workers share one index through a shard server instead.
+        if cls._owner is not None:
+            cls._owner.close()
+        os.makedirs(os.path.dirname(settings.INDEX_PATH) or ".", exist_ok=True)
+        handle = open(settings.INDEX_PATH + ".lock", "wb")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            cls._owner = None
+            raise RuntimeError(
+                f"{settings.INDEX_PATH} is already open in another process; run several workers "
+                "against one index server (INDEX_SHARD_ADDRESSES) instead"
+            )
+        cls._owner = handle
+
+    @classmethod
+    def _forget_owner(cls) -> None:
+        # Forked children (the parse pool) share the lock's open file; their copy is closed so
+        # only this process holds the index and a close() here really releases it.
+        if cls._owner is not None:
+            cls._owner.close()
+            cls._owner = None
+
+    @staticmethod
+    def _stored_meta() -> Dict[str, Any]:
+        if not os.path.exists(settings.INDEX_META_PATH):
+            return {}
+        with open(settings.INDEX_META_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def _begin_rebuild(cls) -> IndexRebuild:
+        assert cls._dim is not None
+        with cls._lock:
+            job = new_rebuild(cls._dim)
+            cls._rebuild_job = job
+            if cls._rebuild_log is None:
+                cls._rebuild_log = DeltaLog(os.path.join(settings.INDEX_REBUILD_DIR, "ops"))
+                if IndexRebuild.pending(settings.INDEX_REBUILD_DIR, job.model):
+                    # Mutations logged before an interruption still have to reach the rebuilt index.
+                    cls._rebuild_log.open()
+                else:
+                    cls._rebuild_log.reset()
+        return job
+
+    @classmethod
+    def start_rebuild(cls) -> Dict[str, Any]:
+        # Re-embeds every chunk in the background while the current index keeps serving.
+        with cls._lock:
+            running = cls._rebuild_job
+        if running is not None and running.active:
+            return running.progress()
+        job = cls._begin_rebuild()
+        threading.Thread(target=cls._run_rebuild, args=(job,), name="index-rebuild", daemon=True).start()
+        return job.progress()
+
+    @classmethod
+    def rebuild_status(cls) -> Dict[str, Any]:
+        job = cls._rebuild_job
+        return job.progress() if job is not None else {"state": "idle"}
+
+    @classmethod
+    def _run_rebuild(cls, job: IndexRebuild) -> None:
+        assert cls._dim is not None
+        try:
+            job.run()
+            job.set_state("indexing")
+            ids, vectors = job.vectors()
+            target = cls._target_type
+            if requires_training(target) and len(ids) < min_training_points(target):
+                target = "flat"
+            base = cls._build_from(ids, vectors, target)
+            job.set_state("swapping")
+            cls.compact(adopt=(base, target))
+            job.discard()
+            logger.info("Vector index rebuilt from %d chunks", len(ids))
+        except Exception as exc:
+            # The rebuild log stays open: a retry (or the next start) resumes with it.
+            logger.exception("Vector index rebuild failed")
+            if job.active:
+                job.fail(exc)
+
+    @classmethod
+    def _open_exact(cls, dimension: int, base_type: str) -> None:
+        if cls._exact is not None:
+            cls._exact.close()
+            cls._exact = None
+        if is_lossy(base_type) or is_lossy(cls._target_type):
+            cls._exact = ExactVectors(settings.INDEX_EXACT_PATH, dimension)
+
+    @classmethod
+    def _remember_exact(cls, ids: np.ndarray, vectors: np.ndarray) -> None:
+        if cls._exact is not None:
+            cls._exact.put(ids, vectors)
+
+    @classmethod
+    def _backfill_exact(cls, present: Set[int], batch_size: int = 256) -> None:
+        # Base vectors without an exact copy (the store is new, or lost writes) are re-embedded.
+        assert cls._exact is not None
+        missing = cls._exact.missing(np.array(sorted(present), dtype=np.int64))
+        if not len(missing):
+            return
+        logger.info("Restoring %d full-precision vectors for rescoring", len(missing))
+        with SessionLocal() as session:
+            for start in range(0, len(missing), batch_size):
+                wanted = missing[start:start + batch_size].tolist()
+                rows = session.query(Chunk.id, Chunk.content).filter(_ids_match(Chunk.id, wanted)).all()
+                if rows:
+                    ids = np.array([int(r.id) for r in rows], dtype=np.int64)
+                    cls._exact.put(ids, embed_texts_cached([r.content for r in rows]))
+
+    @classmethod
+    def _rescore(cls, queries: np.ndarray, ids: np.ndarray, approximate: np.ndarray) -> np.ndarray:
+        exact = cls._exact
+        assert exact is not None
+        scores = np.empty(ids.shape, dtype=np.float32)
+        # Row by row, so a wide candidate list never materializes a (queries x candidates x dim) block.
+        for row in range(len(ids)):
+            vectors, present = exact.read(ids[row])
+            scores[row] = np.where(present, vectors @ queries[row], approximate[row])
+        return scores
+
+    @classmethod
+    def _rescorer(cls, base_type: str) -> Any:
+        if cls._exact is None or not is_lossy(base_type):
+            return None
+        if not (settings.INDEX_RESCORE or needs_rescore(base_type)):
+            return None
+        if needs_rescore(base_type):
+            # Hamming distances cannot stand in for a missing exact score.
+            return lambda queries, ids, approximate: cls._rescore(queries, ids, np.full(ids.shape, -np.inf, dtype=np.float32))
+        return cls._rescore
+
+    @classmethod
+    def _new_index(cls, dimension: int) -> faiss.Index:
+        # Trained index types start flat and migrate once enough vectors exist to train on.
+        if requires_training(cls._target_type):
+            return build_index(dimension, "flat")
+        return build_index(dimension, cls._target_type)
+
+    @staticmethod
+    def _read_base() -> faiss.Index:
+        # A memory-mapped, read-only base lets every worker process share one copy of the
+        # index through the page cache. Older faiss builds without these flags read normally.
+        flags = 0
+        if settings.INDEX_MMAP:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+        if flags:
+            try:
+                return faiss.read_index(settings.INDEX_PATH, flags)
+            except RuntimeError:
+                logger.warning("Memory-mapped read of %s failed; loading into memory", settings.INDEX_PATH)
+        return faiss.read_index(settings.INDEX_PATH)
 
     @classmethod
-    def _persist_meta(cls) -> None:
-        meta = {"dimension": cls._dim, "model": settings.MODEL_NAME}
+    def _persist_meta(cls, index_type: str) -> None:
+        meta = {
+            "dimension": cls._dim,
+            "model": cls._serving_model or embedding_model_key(),
+            "index_type": index_type,
+            "database": database_id(),
+        }
         os.makedirs(os.path.dirname(settings.INDEX_META_PATH), exist_ok=True)
         with open(settings.INDEX_META_PATH, "w", encoding="utf-8") as f:
             json.dump(meta, f)
 
+    @staticmethod
+    def _write_file(path: str, payload: bytes) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def _write_snapshot(cls, data: Optional[np.ndarray], tombstones: np.ndarray) -> None:
+        # Tombstones go first: a crash before the snapshot lands leaves the old snapshot plus
+        # the not-yet-dropped log segments, which replay to the same tombstone set.
+        cls._write_file(settings.INDEX_PATH + ".tombstones", tombstones.tobytes())
+        if data is not None:
+            cls._write_file(settings.INDEX_PATH, data.tobytes())
+
+    @staticmethod
+    def _load_tombstones(index_type: str) -> Set[int]:
+        path = settings.INDEX_PATH + ".tombstones"
+        if supports_remove(index_type) or not os.path.exists(path):
+            return set()
+        with open(path, "rb") as f:
+            return set(np.frombuffer(f.read(), dtype=np.int64).tolist())
+
+    @staticmethod
+    def _present_ids(base: faiss.Index, deleted: Set[int]) -> Set[int]:
+        if not base.ntotal:
+            return set()
+        return set(faiss.vector_to_array(base.id_map).tolist()) - deleted
+
+    @classmethod
+    def _apply_ops(cls, draft: SnapshotDraft, ops: Iterable[Op], present: Set[int]) -> int:
+        applied = 0
+        for op, ids, vectors in ops:
+            if op == OP_ADD:
+                assert vectors is not None
+                if vectors.shape[1] != cls._dim:
+                    continue
+                keep = np.array([i not in present for i in ids.tolist()], dtype=bool)
+                if keep.any():
+                    draft.add(vectors[keep], ids[keep])
+                    present.update(ids[keep].tolist())
+            else:
+                draft.remove(ids)
+                present.difference_update(ids.tolist())
+            applied += 1
+        return applied
+
+    @classmethod
+    def _publish(cls, draft: SnapshotDraft) -> None:
+        # Caller holds `_lock`. A single reference assignment is the whole swap.
+        cls._generation += 1
+        cls._snapshot = draft.freeze(cls._generation, settings.INDEX_DELTA_MAX_SEGMENTS)
+
+    @classmethod
+    def _start_compactor(cls) -> None:
+        if cls._compactor is not None and cls._compactor.is_alive():
+            return
+        cls._compactor = threading.Thread(target=cls._compaction_loop, name="vector-index-compactor", daemon=True)
+        cls._compactor.start()
+
+    @classmethod
+    def _compaction_loop(cls) -> None:
+        interval = max(1, settings.WAL_COMPACT_INTERVAL_SECONDS)
+        while True:
+            cls._compact_event.wait(timeout=interval)
+            cls._compact_event.clear()
+            try:
+                if cls._should_compact():
+                    cls.compact()
+            except Exception:
+                logger.exception("Vector index compaction failed")
+
+    @classmethod
+    def _compaction_due(cls) -> bool:
+        snapshot = cls._snapshot
+        if cls._wal is None or snapshot is None:
+            return False
+        if cls._wal.size_bytes() >= settings.WAL_COMPACT_BYTES:
+            return True
+        if snapshot.delta_count >= settings.INDEX_DELTA_MAX_VECTORS:
+            return True
+        return cls._rebuild_target(snapshot) is not None
+
+    @classmethod
+    def _should_compact(cls) -> bool:
+        if cls._compaction_due():
+            return True
+        assert cls._wal is not None and cls._snapshot is not None
+        pending = cls._wal.size_bytes() > 0 or bool(cls._snapshot.deltas)
+        return pending and time.monotonic() - cls._last_compaction >= settings.WAL_COMPACT_INTERVAL_SECONDS
+
+    @classmethod
+    def _maybe_schedule_compaction(cls) -> None:
+        if cls._compaction_due():
+            cls._compact_event.set()
+
+    @classmethod
+    def _rebuild_target(cls, snapshot: IndexSnapshot) -> Optional[str]:
+        if not cls.serves_current_model():
+            # A stale index could only be re-embedded with the new model; the pending rebuild does that.
+            return None
+        target = cls._target_type
+        if snapshot.base_type != target:
+            if not requires_training(target) or snapshot.ntotal >= min_training_points(target):
+                return target
+        if supports_remove(snapshot.base_type) or not snapshot.deleted:
+            return None
+        # Tombstoned bases are rebuilt once enough of them is dead, or when a tombstoned id
+        # was re-added (merging it would leave two vectors under one id).
+        if len(snapshot.deleted) > _TOMBSTONE_PURGE_RATIO * max(1, snapshot.base.ntotal):
+            return snapshot.base_type
+        if any(segment.ids & snapshot.deleted for segment in snapshot.deltas):
+            return snapshot.base_type
+        return None
+
+    @classmethod
+    def compact(cls, adopt: Optional[Tuple[faiss.Index, str]] = None) -> None:
+        # `adopt` replaces the base with a rebuilt index, replaying every mutation since the rebuild began.
+        assert cls._snapshot is not None and cls._wal is not None and cls._dim is not None
+        with cls._compact_lock:
+            with timed_lock(cls._lock, "vector_index", "compact"):
+                snapshot = cls._snapshot
+                boundary = cls._wal.rotate()
+                # From here on every mutation is also queued for the merged base, so the
+                # captured snapshot plus the queued ops is exactly the state at swap time.
+                cls._shadow_ops = []
+                rebuild_log = cls._rebuild_log if adopt is not None else None
+                log_boundary = 0
+                if rebuild_log is not None:
+                    log_boundary = rebuild_log.rotate()
+                    cls._held_ops = None if cls.serves_current_model() else []
+            started = time.monotonic()
+            try:
+                if adopt is not None:
+                    replay = rebuild_log.replay(before=log_boundary) if rebuild_log is not None else []
+                    base, base_type, deleted, from_db = cls._adopt(adopt[0], adopt[1], replay)
+                else:
+                    base, base_type, deleted, from_db = cls._merge(snapshot)
+                tombstones = np.array(sorted(deleted), dtype=np.int64)
+                if base is snapshot.base:
+                    cls._write_snapshot(None, tombstones)
+                else:
+                    cls._write_snapshot(faiss.serialize_index(base), tombstones)
+                    if settings.INDEX_MMAP:
+                        base = cls._read_base()
+                        apply_search_params(base, base_type)
+                with timed_lock(cls._lock, "vector_index", "compact"):
+                    pending = cls._shadow_ops or []
+                    held = cls._held_ops or []
+                    cls._shadow_ops = cls._held_ops = None
+                    draft = SnapshotDraft(cls._dim, base, base_type, deleted=deleted)
+                    # Only a base re-embedded from the database can already hold queued adds.
+                    cls._apply_ops(draft, pending, cls._present_ids(base, deleted) if from_db else set())
+                    if adopt is not None:
+                        cls._serving_model = embedding_model_key()
+                        cls._rebuild_log = None
+                        # Adds kept out of the stale index now belong in the log of the live one.
+                        for _, ids, vectors in held:
+                            assert vectors is not None
+                            cls._wal.append_add(ids, vectors)
+                    if adopt is not None or base_type != snapshot.base_type:
+                        cls._persist_meta(base_type)
+                    cls._publish(draft)
+            except Exception:
+                with timed_lock(cls._lock, "vector_index", "compact"):
+                    cls._shadow_ops = cls._held_ops = None
+                raise
+            if rebuild_log is not None:
+                rebuild_log.close()
+            cls._wal.drop_before(boundary)
+            cls._last_compaction = time.monotonic()
+            record_stage("index", "adopt" if adopt is not None else "compact", cls._last_compaction - started)
+            if base_type != snapshot.base_type:
+                logger.info(
+                    "Vector index migrated to %s (%d vectors) in %.1fs", base_type, base.ntotal, time.monotonic() - started
+                )
+
+    @classmethod
+    def _adopt(cls, base: faiss.Index, base_type: str, ops: Iterable[Op]) -> Tuple[faiss.Index, str, Set[int], bool]:
+        assert cls._dim is not None
+        draft = SnapshotDraft(cls._dim, base, base_type)
+        cls._apply_ops(draft, ops, cls._present_ids(base, set()))
+        merged, merged_type, deleted, _ = cls._merge(draft.freeze(cls._generation, settings.INDEX_DELTA_MAX_SEGMENTS))
+        # Removals replayed for chunks the rebuild never read leave no tombstone behind.
+        deleted &= cls._present_ids(merged, set())
+        # Like a base re-embedded from the database, it may already hold adds queued during the swap.
+        return merged, merged_type, deleted, True
+
+    @classmethod
+    def _merge(cls, snapshot: IndexSnapshot) -> Tuple[faiss.Index, str, Set[int], bool]:
+        assert cls._dim is not None
+        target = cls._rebuild_target(snapshot)
+        if target is not None:
+            return cls._rebuild(snapshot, target)
+        deleted = set(snapshot.deleted)
+        removable = supports_remove(snapshot.base_type)
+        if not snapshot.deltas and not (removable and deleted):
+            return snapshot.base, snapshot.base_type, deleted, False
+        # Published bases are shared with in-flight searches (and may be read-only
+        # mappings), so the merge always works on a private copy.
+        base = mutable_copy(snapshot.base)
+        if removable and deleted:
+            base.remove_ids(faiss.IDSelectorBatch(np.array(sorted(deleted), dtype=np.int64)))
+            deleted = set()
+        elif deleted:
+            # Drop tombstones for ids that only ever lived in a delta segment.
+            deleted &= set(faiss.vector_to_array(base.id_map).tolist())
+        for segment in snapshot.deltas:
+            ids, vectors = index_vectors(segment.index)
+            cls._remember_exact(ids, vectors)
+            base.add_with_ids(vectors, ids)
+        apply_search_params(base, snapshot.base_type)
+        return base, snapshot.base_type, deleted, False
+
+    @classmethod
+    def _rebuild(cls, snapshot: IndexSnapshot, target: str) -> Tuple[faiss.Index, str, Set[int], bool]:
+        assert cls._dim is not None
+        ids, vectors = cls._export_vectors(snapshot)
+        from_db = vectors is None
+        if vectors is None:
+            ids, vectors = cls._vectors_from_db()
+        return cls._build_from(ids, vectors, target), target, set(), from_db
+
+    @classmethod
+    def _build_from(cls, ids: np.ndarray, vectors: np.ndarray, target: str) -> faiss.Index:
+        assert cls._dim is not None
+        if is_lossy(target) and cls._exact is None:
+            cls._open_exact(cls._dim, target)
+        cls._remember_exact(ids, vectors)
+        new_index = build_index(cls._dim, target)
+        if requires_training(target):
+            new_index.train(cls._training_sample(ids, vectors))
+        for start in range(0, len(ids), 65536):
+            new_index.add_with_ids(
+                np.ascontiguousarray(vectors[start:start + 65536], dtype=np.float32), ids[start:start + 65536]
+            )
+        return new_index
+
     @classmethod
-    def _save(cls) -> None:
-        assert cls._index is not None
-        faiss.write_index(cls._index, settings.INDEX_PATH)
+    def _export_vectors(cls, snapshot: IndexSnapshot) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if is_lossy(snapshot.base_type):
+            # Reconstructions from a compressed index are approximate: use the exact copies when
+            # every one is there, otherwise re-embed from the database.
+            if cls._exact is None:
+                return np.zeros(0, dtype=np.int64), None
+            ids = np.array(sorted(cls._present_ids(snapshot.base, set(snapshot.deleted))), dtype=np.int64)
+            vectors, present = cls._exact.read(ids)
+            if not present.all():
+                return np.zeros(0, dtype=np.int64), None
+        else:
+            ids, vectors = index_vectors(snapshot.base)
+        if snapshot.deleted:
+            keep = np.array([i not in snapshot.deleted for i in ids.tolist()], dtype=bool)
+            ids, vectors = ids[keep], vectors[keep]
+        parts = [index_vectors(segment.index) for segment in snapshot.deltas]
+        return (
+            np.concatenate([ids, *[p[0] for p in parts]]),
+            np.vstack([vectors, *[p[1] for p in parts]]),
+        )
 
     @classmethod
-    def _rebuild_from_db(cls, batch_size: int = 256) -> None:
-        assert cls._index is not None
+    def close(cls) -> None:
+        if cls._snapshot is None or cls._wal is None:
+            return
+        if cls._wal.size_bytes() > 0 or cls._snapshot.deltas:
+            cls.compact()
+        cls._wal.close()
+        if cls._rebuild_log is not None:
+            cls._rebuild_log.close()
+            cls._rebuild_log = None
+        if cls._exact is not None:
+            cls._exact.close()
+            cls._exact = None
+        if cls._owner is not None:
+            cls._owner.close()
+            cls._owner = None
+
+    @classmethod
+    def _vectors_from_db(cls, batch_size: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+        id_parts: List[np.ndarray] = []
+        vector_parts: List[np.ndarray] = []
         last_id = 0
         with SessionLocal() as session:
             while True:
-                rows: List[Chunk] = (
-                    session.query(Chunk)
-                    .filter(Chunk.id > last_id)
+                rows = (
+                    session.query(Chunk.id, Chunk.content)
+                    .filter(Chunk.id > last_id, *shard_filter(Chunk.id))
                     .order_by(Chunk.id.asc())
                     .limit(batch_size)
                     .all()
                 )
                 if not rows:
                     break
-                texts = [r.content for r in rows]
-                ids = [int(r.id) for r in rows]
-                vectors = embed_texts(texts)
-                cls._index.add_with_ids(vectors, np.array(ids, dtype=np.int64))
+                id_parts.append(np.array([int(r.id) for r in rows], dtype=np.int64))
+                vector_parts.append(embed_texts_cached([r.content for r in rows]))
                 last_id = rows[-1].id
-        cls._save()
+        if not id_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, cls._dim or 0), dtype=np.float32)
+        return np.concatenate(id_parts), np.vstack(vector_parts)
+
+    @classmethod
+    def _training_sample(cls, ids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        size = min(settings.INDEX_TRAIN_SAMPLE, len(ids))
+        with SessionLocal() as session:
+            query = session.query(Chunk.id).filter(*shard_filter(Chunk.id))
+            sampled = [int(r[0]) for r in query.order_by(func.random()).limit(size).all()]
+        order = np.argsort(ids)
+        sorted_ids = ids[order]
+        wanted = np.array(sampled, dtype=np.int64)
+        positions = np.clip(np.searchsorted(sorted_ids, wanted), 0, len(ids) - 1)
+        picked = order[positions[sorted_ids[positions] == wanted]]
+        if len(picked) < size:
+            # Chunks not yet in the index (or a drifted database) are topped up with random vectors.
+            rest = np.setdiff1d(np.arange(len(ids)), picked)
+            extra = np.random.default_rng().choice(rest, size=min(len(rest), size - len(picked)), replace=False)
+            picked = np.concatenate([picked, extra])
+        return np.ascontiguousarray(vectors[picked], dtype=np.float32)
 
     @classmethod
     def add(cls, embeddings: np.ndarray, ids: List[int]) -> None:
-        assert cls._index is not None
-        with cls._lock:
-            cls._index.add_with_ids(embeddings, np.array(ids, dtype=np.int64))
-            cls._save()
+        assert cls._snapshot is not None and cls._wal is not None and cls._dim is not None
+        id_array = np.array(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with timed_lock(cls._lock, "vector_index", "add"):
+            if cls._rebuild_log is not None:
+                cls._rebuild_log.append_add(id_array, vectors)
+            if not cls.serves_current_model():
+                # Only the rebuild takes new-model vectors; the generation still moves for result caches.
+                cls._generation += 1
+                if cls._held_ops is not None and cls._shadow_ops is not None:
+                    cls._shadow_ops.append((OP_ADD, id_array, vectors))
+                    cls._held_ops.append((OP_ADD, id_array, vectors))
+                return
+            cls._wal.append_add(id_array, vectors)
+            draft = SnapshotDraft.of(cls._dim, cls._snapshot)
+            draft.add(vectors, id_array)
+            cls._publish(draft)
+            if cls._shadow_ops is not None:
+                cls._shadow_ops.append((OP_ADD, id_array, vectors))
+        cls._maybe_schedule_compaction()
 
     @classmethod
     def remove_ids(cls, ids: List[int]) -> None:
-        assert cls._index is not None
+        assert cls._snapshot is not None and cls._wal is not None and cls._dim is not None
         if not ids:
             return
-        with cls._lock:
-            to_remove = faiss.IDSelectorArray(np.array(ids, dtype=np.int64))
-            cls._index.remove_ids(to_remove)
-            cls._save()
+        id_array = np.array(ids, dtype=np.int64)
+        with timed_lock(cls._lock, "vector_index", "remove"):
+            cls._wal.append_remove(id_array)
+            draft = SnapshotDraft.of(cls._dim, cls._snapshot)
+            draft.remove(id_array)
+            cls._publish(draft)
+            if cls._shadow_ops is not None:
+                cls._shadow_ops.append((OP_REMOVE, id_array, None))
+            if cls._rebuild_log is not None:
+                cls._rebuild_log.append_remove(id_array)
+        cls._maybe_schedule_compaction()
 
     @classmethod
-    def search(cls, query_vec: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
-        assert cls._index is not None
-        with cls._lock:
-            distances, id_matrix = cls._index.search(query_vec, top_k)
-        id_list = id_matrix[0].tolist()
-        score_list = distances[0].tolist()
-        results: List[Dict[str, Any]] = []
-        with SessionLocal() as session:
-            rows = (
-                session.query(Chunk, Document)
-                .join(Document, Chunk.document_id == Document.id)
-                .filter(Chunk.id.in_([cid for cid in id_list if cid != -1]))
-                .all()
-            )
-            chunk_by_id = {chunk.id: (chunk, doc) for (chunk, doc) in rows}
-        for cid, score in zip(id_list, score_list):
-            if cid == -1:
-                continue
-            pair = chunk_by_id.get(cid)
-            if not pair:
-                continue
-            chunk, doc = pair
-            results.append(
-                {
-                    "content": chunk.content,
-                    "score": float(score),
-                    "document_id": int(doc.id),
-                    "uri": doc.uri,
-                    "chunk_index": int(chunk.chunk_index),
+    def ids(cls) -> np.ndarray:
+        # Every searchable id, in no particular order.
+        snapshot = cls._snapshot
+        assert snapshot is not None
+        present = cls._present_ids(snapshot.base, set(snapshot.deleted))
+        for segment in snapshot.deltas:
+            present |= segment.ids
+        return np.fromiter(present, dtype=np.int64, count=len(present))
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        snapshot = cls._snapshot
+        if snapshot is None:
+            return {}
+        memory = index_memory_bytes(snapshot.base) + sum(index_memory_bytes(d.index) for d in snapshot.deltas)
+        return {
+            "index_type": snapshot.base_type,
+            "vectors": snapshot.ntotal,
+            "delta_vectors": snapshot.delta_count,
+            "tombstones": len(snapshot.deleted),
+            "generation": snapshot.generation,
+            "memory_bytes": memory,
+        }
+
+    @classmethod
+    def search_ids(
+        cls, query_vec: np.ndarray, top_k: int, allowed: Optional[AllowedIds] = None
+    ) -> Tuple[List[int], List[float]]:
+        return cls.search_ids_batch(query_vec, top_k, allowed)[0]
+
+    @classmethod
+    def search_ids_batch(
+        cls, query_vecs: np.ndarray, top_k: int, allowed: Optional[AllowedIds] = None
+    ) -> List[Tuple[List[int], List[float]]]:
+        # One FAISS call for the whole query matrix; one (ids, scores) ranking per row.
+        snapshot = cls._snapshot
+        assert snapshot is not None
+        rescore = cls._rescorer(snapshot.base_type)
+        candidates = top_k * max(1, settings.INDEX_RESCORE_FACTOR)
+        started = time.perf_counter()
+        distances, id_matrix = snapshot.search(query_vecs, top_k, allowed, rescore, candidates)
+        record_stage("index", "search", time.perf_counter() - started)
+        rankings: List[Tuple[List[int], List[float]]] = []
+        for id_row, score_row in zip(id_matrix.tolist(), distances.tolist()):
+            pairs = [(cid, score) for cid, score in zip(id_row, score_row) if cid != -1]
+            rankings.append(([cid for cid, _ in pairs], [float(score) for _, score in pairs]))
+        return rankings
+
+    @staticmethod
+    def _payloads(id_list: List[int]) -> Dict[int, Dict[str, Any]]:
+        payloads: Dict[int, Dict[str, Any]] = {}
+        missing = id_list
+        store = get_payload_store()
+        if store is not None:
+            payloads, missing = store.get(id_list)
+        if missing:
+            # Without a payload store, or for ids it does not hold (e.g. removed since the search).
+            with SessionLocal() as session:
+                rows = (
+                    session.query(Chunk.id, Chunk.content, Chunk.chunk_index, Document.id, Document.uri)
+                    .join(Document, Chunk.document_id == Document.id)
+                    .filter(_ids_match(Chunk.id, missing))
+                    .all()
+                )
+            for cid, content, chunk_index, document_id, uri in rows:
+                payloads[int(cid)] = {
+                    "content": content,
+                    "document_id": int(document_id),
+                    "uri": uri,
+                    "chunk_index": int(chunk_index),
                 }
-            )
-        return results
+        return payloads
+
+    @classmethod
+    def hydrate(cls, id_list: List[int], score_list: List[float]) -> List[Dict[str, Any]]:
+        return cls.hydrate_many([(id_list, score_list)])[0]
+
+    @classmethod
+    def hydrate_many(cls, rankings: List[Tuple[List[int], List[float]]]) -> List[List[Dict[str, Any]]]:
+        # Payloads for every ranking are fetched in one lookup over the union of ids.
+        wanted = list(dict.fromkeys(cid for id_list, _ in rankings for cid in id_list))
+        payloads = cls._payloads(wanted) if wanted else {}
+        hydrated: List[List[Dict[str, Any]]] = []
+        for id_list, score_list in rankings:
+            results: List[Dict[str, Any]] = []
+            for cid, score in zip(id_list, score_list):
+                payload = payloads.get(cid)
+                if not payload:
+                    continue
+                results.append(
+                    {
+                        "chunk_id": int(cid),
+                        "content": payload["content"],
+                        "score": float(score),
+                        "document_id": payload["document_id"],
+                        "uri": payload["uri"],
+                        "chunk_index": payload["chunk_index"],
+                    }
+                )
+            hydrated.append(results)
+        return hydrated
+
+    @classmethod
+    def search(cls, query_vec: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        id_list, score_list = cls.search_ids(query_vec, top_k)
+        return cls.hydrate(id_list, score_list)
+
+
+def _index_metrics() -> List[Family]:
+    stats = VectorIndex.stats()
+    if not stats:
+        return []
+    rebuild = VectorIndex.rebuild_status()
+    return index_families([({"index_type": stats["index_type"]}, stats)]) + [
+        ("kb_index_rebuild_percent", "gauge", "Progress of a running rebuild.", [({"state": rebuild["state"]}, rebuild.get("percent") or 0.0)]),
+    ]
+
+
+def index_families(shards: List[Tuple[Dict[str, str], Dict[str, Any]]]) -> List[Family]:
+    # One sample per (labels, stats) pair: the in-process index, or every shard of a sharded one.
+    def samples(key: str) -> List[Tuple[Dict[str, str], float]]:
+        return [(labels, stats[key]) for labels, stats in shards]
+
+    return [
+        ("kb_index_vectors", "gauge", "Searchable vectors (base minus tombstones plus deltas).", samples("vectors")),
+        ("kb_index_delta_vectors", "gauge", "Vectors in delta segments awaiting compaction.", samples("delta_vectors")),
+        ("kb_index_tombstones", "gauge", "Removed ids still stored in the base.", samples("tombstones")),
+        ("kb_index_generation", "gauge", "Published snapshot generation.", samples("generation")),
+        ("kb_index_memory_bytes", "gauge", "Approximate size of the base and delta indexes.", samples("memory_bytes")),
+    ]
+
+
+os.register_at_fork(after_in_child=VectorIndex._forget_owner)
+register_collector(_index_metrics)
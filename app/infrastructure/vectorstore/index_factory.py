@@ -0,0 +1,136 @@
+from typing import Any, Tuple
+
+import faiss
+
+from app.core.config import settings
+
+
+INDEX_TYPES: Tuple[str, ...] = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8", "binary")
+
+
+def normalize_index_type(index_type: str | None) -> str:
+    value = (index_type or "flat").strip().lower().replace("-", "_")
+    if value not in INDEX_TYPES:
+        raise ValueError(f"Unsupported INDEX_TYPE '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    return value
+
+
+def requires_training(index_type: str) -> bool:
+    return index_type in ("ivf_flat", "ivf_pq", "sq_int8", "binary")
+
+
+def supports_remove(index_type: str) -> bool:
+    # HNSW cannot delete at all and IVF under IndexIDMap2 cannot delete without renumbering;
+    # both rely on tombstones filtered at search time.
+    return index_type in ("flat", "sq_fp16", "sq_int8", "binary")
+
+
+def supports_selectors(index_type: str) -> bool:
+    # IndexLSH rejects SearchParameters; its candidates are filtered after the search.
+    return index_type != "binary"
+
+
+def is_lossy(index_type: str) -> bool:
+    return index_type in ("ivf_pq", "sq_fp16", "sq_int8", "binary")
+
+
+def needs_rescore(index_type: str) -> bool:
+    # Hamming distances are not on the inner-product scale, so binary results are always rescored.
+    return index_type == "binary"
+
+
+def min_training_points(index_type: str) -> int:
+    # FAISS wants ~39 points per centroid; PQ also trains 2^nbits centroids per sub-quantizer.
+    if index_type == "ivf_flat":
+        return settings.IVF_NLIST * 39
+    if index_type == "ivf_pq":
+        return max(settings.IVF_NLIST, 1 << settings.PQ_NBITS) * 39
+    if index_type in ("sq_int8", "binary"):
+        # Per-dimension ranges (int8) or medians (binary thresholds) only.
+        return 1000
+    return 0
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    m = max(1, min(settings.PQ_M, dimension))
+    while dimension % m != 0:
+        m -= 1
+    return m
+
+
+def build_index(dimension: int, index_type: str) -> faiss.Index:
+    if index_type == "flat":
+        inner = faiss.IndexFlatIP(dimension)
+    elif index_type == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dimension)
+        inner = faiss.IndexIVFFlat(quantizer, dimension, settings.IVF_NLIST, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dimension)
+        inner = faiss.IndexIVFPQ(
+            quantizer, dimension, settings.IVF_NLIST, _pq_subquantizers(dimension), settings.PQ_NBITS, faiss.METRIC_INNER_PRODUCT
+        )
+    elif index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimension, settings.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type == "sq_fp16":
+        inner = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "sq_int8":
+        inner = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "binary":
+        # Randomly rotated sign bits with per-bit median thresholds, compared by Hamming distance.
+        inner = faiss.IndexLSH(dimension, settings.BINARY_NBITS or dimension, True, True)
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}")
+    index = faiss.IndexIDMap2(inner)
+    apply_search_params(index, index_type)
+    return index
+
+
+def detect_index_type(index: faiss.Index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    if isinstance(inner, faiss.IndexLSH):
+        return "binary"
+    return "flat"
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    # Codes, ids and graph links; headers and training data (centroids, codebooks) are ignored.
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    total = 8 * index.ntotal if inner is not index else 0
+    if isinstance(inner, faiss.IndexHNSW):
+        storage = faiss.downcast_index(inner.storage)
+        return total + storage.code_size * inner.ntotal + 4 * inner.hnsw.neighbors.size()
+    if isinstance(inner, faiss.IndexIVF):
+        # Inverted lists store an id next to every code.
+        return total + (inner.code_size + 8) * inner.ntotal
+    return total + int(getattr(inner, "code_size", 4 * inner.d)) * inner.ntotal
+
+
+def apply_search_params(index: faiss.Index, index_type: str) -> None:
+    space = faiss.ParameterSpace()
+    if index_type in ("ivf_flat", "ivf_pq"):
+        space.set_index_parameter(index, "nprobe", settings.IVF_NPROBE)
+    elif index_type == "hnsw":
+        space.set_index_parameter(index, "efSearch", settings.HNSW_EF_SEARCH)
+
+
+def search_parameters(index_type: str, selector: Any) -> faiss.SearchParameters:
+    # Explicit parameters override the index's own knobs, so they have to be carried over.
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = settings.IVF_NPROBE
+    elif index_type == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = settings.HNSW_EF_SEARCH
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return params
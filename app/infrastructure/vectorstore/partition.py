@@ -0,0 +1,56 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+
+PARTITIONS = ("mod", "range")
+
+
+# How chunk ids map to shards. Both schemes are plain integer arithmetic so a shard can
+# select its own rows from the chunks table in SQL: "mod" spreads every document over
+# all shards; "range" keeps blocks of consecutive ids (a document's chunks) together.
+@dataclass(frozen=True)
+class ShardLayout:
+    shards: int
+    partition: str = "mod"
+    range_size: int = 65536
+
+    def __post_init__(self) -> None:
+        if self.shards < 1:
+            raise ValueError("A shard layout needs at least one shard")
+        if self.partition not in PARTITIONS:
+            raise ValueError(f"Unsupported shard partition '{self.partition}', expected one of {', '.join(PARTITIONS)}")
+
+    def owners(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.partition == "range":
+            return (ids // max(1, self.range_size)) % self.shards
+        return ids % self.shards
+
+    def clause(self, column: Any, shard: int) -> Any:
+        if self.partition == "range":
+            return (column // max(1, self.range_size)) % self.shards == shard
+        return column % self.shards == shard
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ShardLayout":
+        return cls(int(data["shards"]), str(data.get("partition", "mod")), int(data.get("range_size", 65536)))
+
+
+def configured_layout() -> ShardLayout:
+    return ShardLayout(
+        max(1, settings.INDEX_SHARDS), settings.INDEX_SHARD_PARTITION.strip().lower(), settings.INDEX_SHARD_RANGE_SIZE
+    )
+
+
+def shard_filter(column: Any) -> List[Any]:
+    # Extra WHERE conditions for reads of the chunks table: in a shard server process, only
+    # the rows it owns; everywhere else, none.
+    if settings.INDEX_SHARD_ID < 0:
+        return []
+    return [configured_layout().clause(column, settings.INDEX_SHARD_ID)]
@@ -0,0 +1,266 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.infrastructure.embeddings.provider import embedding_model_key, get_embedding_dimension
+from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+from app.infrastructure.persistence.identity import database_id
+from app.infrastructure.persistence.models import Chunk
+from app.infrastructure.vectorstore.partition import shard_filter
+
+logger = logging.getLogger(__name__)
+
+
+# Re-embeds the whole chunks table (a shard server: only its partition) into `directory`:
+# ids and float32 vectors are appended in chunk id order and a checkpoint (last id, row
+# count) is committed after every page, so an interrupted run resumes where it stopped.
+# Pages are read ahead while up to `workers` earlier pages are being embedded. A lock file
+# keeps a server and the CLI from working on the same directory at once.
+class IndexRebuild:
+    def __init__(self, directory: str, dimension: int, model: str, workers: int, batch_size: int) -> None:
+        self.directory = directory
+        self.dimension = dimension
+        self.model = model
+        self._workers = max(1, workers)
+        self._batch_size = max(1, batch_size)
+        self._state = "pending"
+        self._error: Optional[str] = None
+        self._count = 0
+        self._last_id = 0
+        self._resumed = 0
+        self._total = 0
+        self._started = 0.0
+        self._finished: Optional[float] = None
+        self._lock_file: Optional[BinaryIO] = None
+        self._ids_file: Optional[BinaryIO] = None
+        self._vectors_file: Optional[BinaryIO] = None
+
+    @staticmethod
+    def pending(directory: str, model: str) -> bool:
+        # A checkpoint left by an interrupted (or offline) run for `model`.
+        try:
+            with open(os.path.join(directory, "checkpoint.json"), "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return checkpoint.get("model") == model and checkpoint.get("database") in (None, database_id())
+
+    @property
+    def active(self) -> bool:
+        return self._state not in ("done", "failed")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _acquire(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(self._path("lock"), "wb")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"Another process is rebuilding into {self.directory}")
+
+    def close(self) -> None:
+        for handle in (self._ids_file, self._vectors_file, self._lock_file):
+            if handle is not None:
+                handle.close()
+        self._ids_file = self._vectors_file = self._lock_file = None
+
+    def _resume(self) -> None:
+        checkpoint: Dict[str, Any] = {}
+        if os.path.exists(self._path("checkpoint.json")):
+            with open(self._path("checkpoint.json"), "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        if (
+            checkpoint.get("model") == self.model
+            and checkpoint.get("dimension") == self.dimension
+            and checkpoint.get("database") in (None, database_id())
+        ):
+            self._count = int(checkpoint["count"])
+            self._last_id = int(checkpoint["last_id"])
+        else:
+            # Another model or database (or no checkpoint): nothing on disk is reusable.
+            self._count = 0
+            self._last_id = 0
+        self._resumed = self._count
+        # Rows appended after the last checkpoint are dropped and embedded again.
+        self._ids_file = open(self._path("ids.i64"), "ab")
+        self._vectors_file = open(self._path("vectors.f32"), "ab")
+        self._ids_file.truncate(8 * self._count)
+        self._vectors_file.truncate(4 * self.dimension * self._count)
+        self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        tmp = self._path("checkpoint.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model": self.model,
+                    "dimension": self.dimension,
+                    "database": database_id(),
+                    "count": self._count,
+                    "last_id": self._last_id,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path("checkpoint.json"))
+
+    def _append(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        assert self._ids_file is not None and self._vectors_file is not None
+        # Data is durable before the checkpoint that covers it.
+        for handle, payload in ((self._ids_file, ids), (self._vectors_file, vectors)):
+            handle.write(np.ascontiguousarray(payload).tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._count += len(ids)
+        self._last_id = int(ids[-1])
+        self._checkpoint()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = embed_texts_cached(texts)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index dimension {self.dimension}")
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def run(self) -> None:
+        self._acquire()
+        try:
+            self._state = "embedding"
+            self._started = time.monotonic()
+            self._resume()
+            with SessionLocal() as session:
+                remaining = (
+                    session.query(func.count(Chunk.id)).filter(Chunk.id > self._last_id, *shard_filter(Chunk.id)).scalar()
+                )
+            self._total = self._count + int(remaining or 0)
+            inflight: Deque[Tuple[np.ndarray, Future]] = deque()
+            last_read = self._last_id
+            with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="index-rebuild") as pool:
+                with SessionLocal() as session:
+                    while True:
+                        rows = (
+                            session.query(Chunk.id, Chunk.content)
+                            .filter(Chunk.id > last_read, *shard_filter(Chunk.id))
+                            .order_by(Chunk.id.asc())
+                            .limit(self._batch_size)
+                            .all()
+                        )
+                        if rows:
+                            last_read = int(rows[-1].id)
+                            ids = np.array([int(r.id) for r in rows], dtype=np.int64)
+                            inflight.append((ids, pool.submit(self._embed, [r.content for r in rows])))
+                        # Pages are committed in order, so the checkpoint is always a prefix.
+                        if inflight and (not rows or len(inflight) >= 2 * self._workers):
+                            ids, future = inflight.popleft()
+                            self._append(ids, future.result())
+                        if not rows and not inflight:
+                            break
+            self._state = "embedded"
+        except Exception as exc:
+            self.fail(exc)
+            raise
+
+    def vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Everything embedded, minus chunks deleted from the database since they were read.
+        ids = np.fromfile(self._path("ids.i64"), dtype=np.int64, count=self._count)
+        if not self._count:
+            return ids, np.zeros((0, self.dimension), dtype=np.float32)
+        vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(self._count, self.dimension))
+        with SessionLocal() as session:
+            rows = session.query(Chunk.id).filter(Chunk.id <= self._last_id, *shard_filter(Chunk.id)).all()
+            live = np.array([r[0] for r in rows], dtype=np.int64)
+        keep = np.isin(ids, live)
+        if keep.all():
+            return ids, vectors
+        return ids[keep], np.asarray(vectors[keep])
+
+    def set_state(self, state: str) -> None:
+        self._state = state
+        if state == "done":
+            self._finished = time.monotonic()
+
+    def fail(self, exc: BaseException) -> None:
+        self._state = "failed"
+        self._error = str(exc)
+        self._finished = time.monotonic()
+        self.close()
+
+    def discard(self) -> None:
+        # The rebuilt index is live and persisted; the checkpoint has nothing left to resume.
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.set_state("done")
+
+    def progress(self) -> Dict[str, Any]:
+        elapsed = ((self._finished or time.monotonic()) - self._started) if self._started else 0.0
+        rate = (self._count - self._resumed) / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self._state == "embedding" and rate > 0:
+            eta = round(max(0, self._total - self._count) / rate, 1)
+        return {
+            "state": self._state,
+            "model": self.model,
+            "embedded": self._count,
+            "total": self._total,
+            "resumed_from": self._resumed,
+            "percent": round(min(100.0, 100.0 * self._count / self._total), 2) if self._total else None,
+            "rate_per_second": round(rate, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta,
+            "error": self._error,
+        }
+
+
+def new_rebuild(dimension: int) -> IndexRebuild:
+    return IndexRebuild(
+        settings.INDEX_REBUILD_DIR, dimension, embedding_model_key(), settings.INDEX_REBUILD_WORKERS, settings.INDEX_REBUILD_BATCH
+    )
+
+
+def main(argv: List[str] | None = None) -> int:
+    # Offline mode: embed everything while the server keeps serving the old index; the
+    # next server start (or POST /index/rebuild) finishes and swaps in the new one.
+    parser = argparse.ArgumentParser(description="Re-embed all chunks into a resumable rebuild checkpoint.")
+    parser.add_argument("--workers", type=int, default=settings.INDEX_REBUILD_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=settings.INDEX_REBUILD_BATCH)
+    parser.add_argument("--report-seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    job = IndexRebuild(settings.INDEX_REBUILD_DIR, get_embedding_dimension(), embedding_model_key(), args.workers, args.batch_size)
+    done = threading.Event()
+
+    def report() -> None:
+        while not done.wait(args.report_seconds):
+            sys.stdout.write(json.dumps(job.progress()) + "\n")
+            sys.stdout.flush()
+
+    threading.Thread(target=report, name="rebuild-report", daemon=True).start()
+    try:
+        job.run()
+    finally:
+        done.set()
+        job.close()
+    sys.stdout.write(json.dumps(job.progress()) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
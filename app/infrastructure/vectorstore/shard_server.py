@@ -0,0 +1,138 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.infrastructure.embeddings.provider import get_embedding_dimension
+from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.infrastructure.vectorstore.snapshot import AllowedIds
+
+logger = logging.getLogger(__name__)
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.strip().rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Shard address '{value}' is not host:port")
+    return host, int(port)
+
+
+def _search(query_vecs: np.ndarray, top_k: int, allowed_ids: Optional[np.ndarray]) -> List[Tuple[List[int], List[float]]]:
+    allowed = AllowedIds(allowed_ids) if allowed_ids is not None else None
+    return VectorIndex.search_ids_batch(query_vecs, top_k, allowed)
+
+
+def _info() -> Dict[str, Any]:
+    return {"shard": settings.INDEX_SHARD_ID, "pid": os.getpid(), **VectorIndex.stats(), "rebuild": VectorIndex.rebuild_status()}
+
+
+METHODS: Dict[str, Callable[..., Any]] = {
+    "info": _info,
+    "search": _search,
+    "add": VectorIndex.add,
+    "remove_ids": VectorIndex.remove_ids,
+    "ids": VectorIndex.ids,
+    "compact": VectorIndex.compact,
+    "start_rebuild": VectorIndex.start_rebuild,
+    "rebuild_status": VectorIndex.rebuild_status,
+    "serves_current_model": VectorIndex.serves_current_model,
+}
+
+
+# One process owning one partition of the index: a regular VectorIndex (WAL, snapshots,
+# compaction, rebuilds) behind multiprocessing.connection. Requests are pickled
+# (method, args) tuples, answered with ("ok", result) or ("error", type, message); every
+# connection gets a thread, so concurrent searches run in parallel as they do in-process.
+class ShardServer:
+    def __init__(self, address: Tuple[str, int], authkey: bytes) -> None:
+        self._listener = Listener(address, authkey=authkey)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._listener.address
+
+    def serve_forever(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError) as exc:
+                # Failed handshakes (wrong authkey, port scanners) must not stop the shard.
+                logger.warning("Rejected shard connection: %s", exc)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="shard-connection", daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if method == "close":
+                    conn.send(("ok", None))
+                    # The main thread closes the index on the way out.
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    return
+                try:
+                    if method not in METHODS:
+                        raise ValueError(f"Unknown shard method '{method}'")
+                    reply: Tuple[Any, ...] = ("ok", METHODS[method](*args))
+                except Exception as exc:
+                    logger.exception("Shard method %s failed", method)
+                    reply = ("error", type(exc).__name__, str(exc))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+
+
+def _watch_parent(parent_pid: int) -> None:
+    # A shard spawned by an API process exits with it instead of lingering as an orphan.
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve one index shard (INDEX_SHARD_ID of INDEX_SHARDS).")
+    parser.add_argument("--listen", default="127.0.0.1:0", help="host:port to listen on (port 0 picks a free one)")
+    parser.add_argument("--address-file", help="write the bound address here once the shard is ready")
+    parser.add_argument("--parent-pid", type=int, help="exit when this process goes away")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s shard-{settings.INDEX_SHARD_ID} %(levelname)s %(message)s")
+    if settings.INDEX_SHARD_ID < 0:
+        parser.error("INDEX_SHARD_ID must be set for a shard server")
+    if not settings.INDEX_SHARD_AUTHKEY:
+        parser.error("INDEX_SHARD_AUTHKEY must be set for a shard server")
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    VectorIndex.initialize(dimension=get_embedding_dimension())
+    try:
+        server = ShardServer(parse_address(args.listen), settings.INDEX_SHARD_AUTHKEY.encode("utf-8"))
+        if args.address_file:
+            host, port = server.address
+            tmp = args.address_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"host": host, "port": port, "pid": os.getpid()}, f)
+            os.replace(tmp, args.address_file)
+        if args.parent_pid:
+            threading.Thread(target=_watch_parent, args=(args.parent_pid,), name="shard-parent-watch", daemon=True).start()
+        logger.info("Index shard %d listening on %s:%d", settings.INDEX_SHARD_ID, *server.address)
+        server.serve_forever()
+    finally:
+        VectorIndex.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,566 @@
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.metrics import Family, record_stage, register_collector, timed_lock
+from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+from app.infrastructure.persistence.models import Chunk
+from app.infrastructure.vectorstore.faiss_index import VectorIndex, _ids_match, index_families
+from app.infrastructure.vectorstore.partition import ShardLayout, configured_layout
+from app.infrastructure.vectorstore.shard_server import parse_address
+from app.infrastructure.vectorstore.snapshot import AllowedIds
+
+logger = logging.getLogger(__name__)
+
+Ranking = Tuple[List[int], List[float]]
+
+
+def sharding_enabled() -> bool:
+    # Shard servers themselves always serve their partition with the in-process index.
+    if settings.INDEX_SHARD_ID >= 0:
+        return False
+    return settings.INDEX_SHARDS > 1 or bool(settings.INDEX_SHARD_ADDRESSES.strip())
+
+
+def vector_index() -> Any:
+    # The class behind index calls: the in-process VectorIndex or the shard coordinator.
+    # Both expose the same classmethods.
+    return ShardedIndex if sharding_enabled() else VectorIndex
+
+
+# A few authenticated connections to one shard server; a call borrows one for its
+# round trip, so up to `connections` calls to the shard are in flight at once.
+class ShardClient:
+    def __init__(self, shard: int, address: Tuple[str, int], authkey: bytes, connections: int) -> None:
+        self.shard = shard
+        self.address = address
+        self._authkey = authkey
+        self._slots = threading.BoundedSemaphore(max(1, connections))
+        self._lock = threading.Lock()
+        self._idle: List[Connection] = []
+
+    def call(self, method: str, *args: Any) -> Any:
+        with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = Client(self.address, authkey=self._authkey)
+                conn.send((method, args))
+                reply = conn.recv()
+            except (EOFError, OSError) as exc:
+                if conn is not None:
+                    conn.close()
+                raise RuntimeError(f"Index shard {self.shard} at {self.address[0]}:{self.address[1]} is unavailable: {exc}")
+            with self._lock:
+                self._idle.append(conn)
+        if reply[0] == "ok":
+            return reply[1]
+        _, kind, message = reply
+        if kind == "ValueError":
+            raise ValueError(message)
+        raise RuntimeError(f"Index shard {self.shard}: {kind}: {message}")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def _merge_rankings(parts: List[List[Ranking]], rows: int, top_k: int) -> List[Ranking]:
+    # Global top-k from per-shard top-k lists. An id can briefly live on two shards while a
+    # rebalance moves it, so duplicates keep their best score.
+    merged: List[Ranking] = []
+    for row in range(rows):
+        best: Dict[int, float] = {}
+        for part in parts:
+            ids, scores = part[row]
+            for cid, score in zip(ids, scores):
+                if score > best.get(cid, float("-inf")):
+                    best[cid] = score
+        ranked = sorted(best.items(), key=lambda pair: pair[1], reverse=True)[:top_k]
+        merged.append(([cid for cid, _ in ranked], [score for _, score in ranked]))
+    return merged
+
+
+# Coordinator for a sharded index. Every shard is a VectorIndex in its own shard server
+# process (spawned here, or remote); searches fan out to all shards in parallel and the
+# per-shard top-k are merged, writes go to the owning shard. The layout in use is kept in
+# INDEX_SHARD_DIR/layout.json; when the configured one differs, a background rebalance
+# moves every chunk whose owner changed (re-embedded through the vector cache) while all
+# shards keep serving, then drains shards that are no longer part of the layout.
+class ShardedIndex:
+    _lock = threading.Lock()
+    _dim: int | None = None
+    _layout: ShardLayout | None = None
+    _rebalancing = False
+    _clients: List[ShardClient] = []
+    _processes: Dict[int, subprocess.Popen] = {}
+    _pool: ThreadPoolExecutor | None = None
+    _authkey: bytes = b""
+    _rebalance: Dict[str, Any] = {"state": "idle"}
+    _stopping = threading.Event()
+    _generation: int = 0
+    _serves_current = True
+    _model_checked = 0.0
+
+    @classmethod
+    def generation(cls) -> int:
+        return cls._generation
+
+    @classmethod
+    def touch(cls) -> None:
+        with cls._lock:
+            cls._generation += 1
+
+    @classmethod
+    def serves_current_model(cls) -> bool:
+        # Every search asks; the shards are polled at most once a second.
+        now = time.monotonic()
+        if cls._clients and now - cls._model_checked >= 1.0:
+            cls._model_checked = now
+            cls._serves_current = all(cls._fan_out([(client, "serves_current_model", ()) for client in cls._clients]))
+        return cls._serves_current
+
+    @staticmethod
+    def _layout_path() -> str:
+        return os.path.join(settings.INDEX_SHARD_DIR, "layout.json")
+
+    @classmethod
+    def _read_layout(cls) -> Tuple[Optional[ShardLayout], int]:
+        # (committed layout, shards that may hold data); None before the first fill finished.
+        try:
+            with open(cls._layout_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None, 0
+        layout = ShardLayout.from_json(data["layout"]) if data.get("layout") else None
+        return layout, int(data.get("spawned", layout.shards if layout else 0))
+
+    @classmethod
+    def _write_layout(cls, layout: Optional[ShardLayout], spawned: int) -> None:
+        os.makedirs(settings.INDEX_SHARD_DIR, exist_ok=True)
+        tmp = f"{cls._layout_path()}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"layout": layout.to_json() if layout else None, "spawned": spawned}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, cls._layout_path())
+
+    @classmethod
+    def initialize(cls, dimension: int) -> None:
+        cls._dim = dimension
+        cls._stopping.clear()
+        wanted = configured_layout()
+        stored, spawned = cls._read_layout()
+        count = max(wanted.shards, spawned)
+        addresses = [a for a in settings.INDEX_SHARD_ADDRESSES.split(",") if a.strip()]
+        if addresses:
+            if not settings.INDEX_SHARD_AUTHKEY:
+                raise ValueError("INDEX_SHARD_AUTHKEY is required with INDEX_SHARD_ADDRESSES")
+            if len(addresses) < count:
+                raise ValueError(f"INDEX_SHARD_ADDRESSES lists {len(addresses)} shard servers, {count} are needed")
+            cls._authkey = settings.INDEX_SHARD_AUTHKEY.encode("utf-8")
+            endpoints = [parse_address(a) for a in addresses[:count]]
+        else:
+            cls._authkey = (settings.INDEX_SHARD_AUTHKEY or secrets.token_hex(32)).encode("utf-8")
+            endpoints = cls._spawn_local(count, wanted)
+        cls._clients = [ShardClient(i, endpoint, cls._authkey, settings.INDEX_SHARD_CONNECTIONS) for i, endpoint in enumerate(endpoints)]
+        cls._pool = ThreadPoolExecutor(max_workers=count * max(1, settings.INDEX_SHARD_CONNECTIONS), thread_name_prefix="shard-rpc")
+        for client in cls._clients:
+            client.call("info")
+        # New writes follow the configured layout at once; while a rebalance runs, reads and
+        # removes cover every shard.
+        cls._layout = wanted
+        if stored == wanted and spawned == wanted.shards:
+            return
+        cls._rebalancing = True
+        cls._rebalance = {"state": "filling" if stored is None else "moving", "layout": wanted.to_json(), "moved": 0, "total": None}
+        cls._write_layout(stored, count)
+        threading.Thread(target=cls._run_rebalance, args=(wanted,), name="index-rebalance", daemon=True).start()
+
+    @classmethod
+    def _shard_env(cls, shard: int, count: int, layout: ShardLayout) -> Dict[str, str]:
+        directory = os.path.join(settings.INDEX_SHARD_DIR, f"shard-{shard}")
+        index_path = os.path.join(directory, "index.faiss")
+        env = dict(os.environ)
+        env.update(
+            {
+                "DATA_DIR": settings.DATA_DIR,
+                "DB_PATH": settings.DB_PATH,
+                "DATABASE_URL": settings.DATABASE_URL,
+                "INDEX_PATH": index_path,
+                "INDEX_META_PATH": os.path.join(directory, "index_meta.json"),
+                "INDEX_WAL_PATH": index_path + ".wal",
+                "INDEX_EXACT_PATH": index_path + ".exact",
+                "INDEX_REBUILD_DIR": index_path + ".rebuild",
+                # Shards share the API's vector cache, so their rebuilds reuse vectors it already has.
+                "VECTOR_CACHE_DIR": settings.VECTOR_CACHE_DIR,
+                "ONNX_CACHE_DIR": settings.ONNX_CACHE_DIR,
+                "EMBEDDING_DIM": str(cls._dim),
+                "INDEX_SHARD_ID": str(shard),
+                "INDEX_SHARDS": str(layout.shards),
+                "INDEX_SHARD_PARTITION": layout.partition,
+                "INDEX_SHARD_RANGE_SIZE": str(layout.range_size),
+                "INDEX_SHARD_ADDRESSES": "",
+                "INDEX_SHARD_AUTHKEY": cls._authkey.decode("utf-8"),
+            }
+        )
+        # FAISS sizes its OpenMP pool to every core; N shards on one host share them.
+        env.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // count)))
+        return env
+
+    @classmethod
+    def _spawn_local(cls, count: int, layout: ShardLayout) -> List[Tuple[str, int]]:
+        address_files = []
+        for shard in range(count):
+            directory = os.path.join(settings.INDEX_SHARD_DIR, f"shard-{shard}")
+            os.makedirs(directory, exist_ok=True)
+            address_file = os.path.join(directory, "address.json")
+            if os.path.exists(address_file):
+                os.remove(address_file)
+            cls._processes[shard] = subprocess.Popen(
+                [
+                    sys.executable, "-m", "app.infrastructure.vectorstore.shard_server",
+                    "--address-file", address_file, "--parent-pid", str(os.getpid()),
+                ],
+                env=cls._shard_env(shard, count, layout),
+            )
+            address_files.append(address_file)
+        endpoints: List[Tuple[str, int]] = []
+        deadline = time.monotonic() + settings.INDEX_SHARD_START_TIMEOUT_SECONDS
+        for shard, address_file in enumerate(address_files):
+            while not os.path.exists(address_file):
+                code = cls._processes[shard].poll()
+                if code is not None:
+                    raise RuntimeError(f"Index shard {shard} exited during startup with status {code}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Index shard {shard} did not start within {settings.INDEX_SHARD_START_TIMEOUT_SECONDS}s")
+                time.sleep(0.05)
+            with open(address_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            endpoints.append((data["host"], int(data["port"])))
+        return endpoints
+
+    @classmethod
+    def _fan_out(cls, calls: List[Tuple[ShardClient, str, Tuple[Any, ...]]]) -> List[Any]:
+        assert cls._pool is not None
+        if len(calls) == 1:
+            client, method, args = calls[0]
+            return [client.call(method, *args)]
+        # Each call runs in a copy of the caller's context, so per-shard stage timings land in the request.
+        futures = [cls._pool.submit(contextvars.copy_context().run, client.call, method, *args) for client, method, args in calls]
+        return [future.result() for future in futures]
+
+    @classmethod
+    def _owners(cls, ids: np.ndarray) -> Dict[int, np.ndarray]:
+        assert cls._layout is not None
+        owners = cls._layout.owners(ids)
+        return {int(shard): np.flatnonzero(owners == shard) for shard in np.unique(owners)}
+
+    @classmethod
+    def add(cls, embeddings: np.ndarray, ids: List[int]) -> None:
+        id_array = np.array(ids, dtype=np.int64)
+        if not len(id_array):
+            return
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with timed_lock(cls._lock, "sharded_index", "add"):
+            calls = [
+                (cls._clients[shard], "add", (vectors[rows], id_array[rows])) for shard, rows in cls._owners(id_array).items()
+            ]
+            cls._fan_out(calls)
+            cls._generation += 1
+
+    @classmethod
+    def remove_ids(cls, ids: List[int]) -> None:
+        id_array = np.array(ids, dtype=np.int64)
+        if not len(id_array):
+            return
+        with timed_lock(cls._lock, "sharded_index", "remove"):
+            if cls._rebalancing:
+                # The chunk may still sit on its old shard.
+                calls = [(client, "remove_ids", (id_array.tolist(),)) for client in cls._clients]
+            else:
+                calls = [(cls._clients[shard], "remove_ids", (id_array[rows].tolist(),)) for shard, rows in cls._owners(id_array).items()]
+            cls._fan_out(calls)
+            cls._generation += 1
+
+    @classmethod
+    def search_ids(cls, query_vec: np.ndarray, top_k: int, allowed: Optional[AllowedIds] = None) -> Ranking:
+        return cls.search_ids_batch(query_vec, top_k, allowed)[0]
+
+    @classmethod
+    def _search_shard(cls, client: ShardClient, queries: np.ndarray, top_k: int, allowed: Optional[np.ndarray]) -> List[Ranking]:
+        started = time.perf_counter()
+        rankings = client.call("search", queries, top_k, allowed)
+        record_stage(f"shard{client.shard}", "search", time.perf_counter() - started)
+        return rankings
+
+    @classmethod
+    def search_ids_batch(cls, query_vecs: np.ndarray, top_k: int, allowed: Optional[AllowedIds] = None) -> List[Ranking]:
+        assert cls._pool is not None
+        queries = np.ascontiguousarray(query_vecs, dtype=np.float32).reshape(-1, cls._dim or query_vecs.shape[-1])
+        clients = cls._clients
+        per_shard: Dict[int, Optional[np.ndarray]] = {client.shard: None for client in clients}
+        if allowed is not None:
+            allowed_ids = allowed.ids()
+            if cls._rebalancing:
+                per_shard = {client.shard: allowed_ids for client in clients}
+            else:
+                # Each shard only needs the allowed ids it owns; shards owning none are skipped.
+                per_shard = {shard: allowed_ids[rows] for shard, rows in cls._owners(allowed_ids).items()}
+        started = time.perf_counter()
+        futures = [
+            cls._pool.submit(contextvars.copy_context().run, cls._search_shard, client, queries, top_k, per_shard[client.shard])
+            for client in clients
+            if client.shard in per_shard
+        ]
+        parts = [future.result() for future in futures]
+        merged = _merge_rankings(parts, len(queries), top_k)
+        record_stage("index", "search", time.perf_counter() - started)
+        return merged
+
+    @classmethod
+    def hydrate(cls, id_list: List[int], score_list: List[float]) -> List[Dict[str, Any]]:
+        return VectorIndex.hydrate(id_list, score_list)
+
+    @classmethod
+    def hydrate_many(cls, rankings: List[Ranking]) -> List[List[Dict[str, Any]]]:
+        return VectorIndex.hydrate_many(rankings)
+
+    @classmethod
+    def compact(cls) -> None:
+        cls._fan_out([(client, "compact", ()) for client in cls._clients])
+
+    @classmethod
+    def start_rebuild(cls) -> Dict[str, Any]:
+        cls._fan_out([(client, "start_rebuild", ()) for client in cls._clients])
+        return cls.rebuild_status()
+
+    @classmethod
+    def rebuild_status(cls) -> Dict[str, Any]:
+        shards = cls._fan_out([(client, "rebuild_status", ()) for client in cls._clients])
+        states = {status["state"] for status in shards}
+        if "failed" in states:
+            state = "failed"
+        elif states - {"idle", "done", "failed"}:
+            state = "running"
+        else:
+            state = "done" if "done" in states else "idle"
+        percents = [status["percent"] for status in shards if status.get("percent") is not None]
+        return {
+            "state": state,
+            "percent": round(sum(percents) / len(percents), 2) if percents else None,
+            "shards": shards,
+            "rebalance": dict(cls._rebalance),
+        }
+
+    @classmethod
+    def shard_status(cls) -> Dict[str, Any]:
+        return {
+            "layout": cls._layout.to_json() if cls._layout else None,
+            "rebalance": dict(cls._rebalance),
+            "shards": cls._fan_out([(client, "info", ()) for client in cls._clients]),
+        }
+
+    @classmethod
+    def _held_ids(cls) -> List[np.ndarray]:
+        return [np.sort(ids) for ids in cls._fan_out([(client, "ids", ()) for client in cls._clients])]
+
+    @staticmethod
+    def _chunk_vectors(ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        # Chunks deleted from the database meanwhile simply do not come back.
+        with SessionLocal() as session:
+            rows = session.query(Chunk.id, Chunk.content).filter(_ids_match(Chunk.id, ids)).all()
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.float32)
+        return np.array([int(r.id) for r in rows], dtype=np.int64), embed_texts_cached([r.content for r in rows])
+
+    @classmethod
+    def _run_rebalance(cls, layout: ShardLayout) -> None:
+        # API workers sharing remote shard servers each start a rebalance; a lock file in
+        # INDEX_SHARD_DIR lets one of them move the chunks while the others wait, then find
+        # the layout committed and only drain.
+        os.makedirs(settings.INDEX_SHARD_DIR, exist_ok=True)
+        with open(os.path.join(settings.INDEX_SHARD_DIR, "layout.lock"), "wb") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                stored, _ = cls._read_layout()
+                if stored != layout:
+                    with cls._lock:
+                        held = cls._held_ids()
+                        with SessionLocal() as session:
+                            ceiling = int(session.query(func.max(Chunk.id)).scalar() or 0)
+                    if stored is None:
+                        cls._fill_from_db(layout, held, ceiling)
+                    else:
+                        cls._move(layout, held)
+                    if cls._stopping.is_set():
+                        return
+                cls._drain(layout)
+                cls._rebalance["state"] = "done"
+                logger.info("Index shards rebalanced to %s", layout)
+            except Exception as exc:
+                logger.exception("Index shard rebalance failed")
+                cls._rebalance.update(state="failed", error=str(exc))
+
+    @staticmethod
+    def _missing(held: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        positions = np.clip(np.searchsorted(held, ids), 0, max(0, len(held) - 1))
+        return ids if not len(held) else ids[held[positions] != ids]
+
+    @classmethod
+    def _fill_from_db(cls, layout: ShardLayout, held: List[np.ndarray], ceiling: int) -> None:
+        # First start in sharded mode: every chunk is routed to its owner. Ids a shard already
+        # holds (a fill interrupted by a restart) are skipped, so this is safe to resume; chunks
+        # past `ceiling` were ingested since and are already on their owner.
+        batch = max(1, settings.INDEX_REBUILD_BATCH)
+        with SessionLocal() as session:
+            cls._rebalance["total"] = int(session.query(func.count(Chunk.id)).filter(Chunk.id <= ceiling).scalar() or 0)
+        last_id = 0
+        while not cls._stopping.is_set():
+            with SessionLocal() as session:
+                rows = (
+                    session.query(Chunk.id)
+                    .filter(Chunk.id > last_id, Chunk.id <= ceiling)
+                    .order_by(Chunk.id.asc())
+                    .limit(batch)
+                    .all()
+                )
+            if not rows:
+                break
+            last_id = int(rows[-1].id)
+            page = np.array([int(r.id) for r in rows], dtype=np.int64)
+            owners = layout.owners(page)
+            wanted = np.concatenate([cls._missing(held[s], page[owners == s]) for s in range(layout.shards)])
+            if len(wanted):
+                with timed_lock(cls._lock, "sharded_index", "rebalance"):
+                    ids, vectors = cls._chunk_vectors(wanted.tolist())
+                    if len(ids):
+                        cls._fan_out(
+                            [(cls._clients[shard], "add", (vectors[rows_], ids[rows_])) for shard, rows_ in cls._owners(ids).items()]
+                        )
+                        cls._generation += 1
+            cls._rebalance["moved"] += len(page)
+
+    @classmethod
+    def _move(cls, layout: ShardLayout, held: List[np.ndarray]) -> None:
+        moves = []
+        for shard, ids in enumerate(held):
+            misplaced = ids[layout.owners(ids) != shard] if len(ids) else ids
+            moves.append(misplaced)
+        cls._rebalance["total"] = int(sum(len(m) for m in moves))
+        batch = max(1, settings.INDEX_REBUILD_BATCH)
+        for source, misplaced in enumerate(moves):
+            for start in range(0, len(misplaced), batch):
+                if cls._stopping.is_set():
+                    return
+                page = misplaced[start:start + batch]
+                # Under the write lock, so a concurrent remove cannot be undone by the move.
+                with timed_lock(cls._lock, "sharded_index", "rebalance"):
+                    ids, vectors = cls._chunk_vectors(page.tolist())
+                    calls: List[Tuple[ShardClient, str, Tuple[Any, ...]]] = []
+                    if len(ids):
+                        owners = layout.owners(ids)
+                        for target in np.unique(owners):
+                            rows = np.flatnonzero(owners == target)
+                            # A move interrupted after the add but before the remove is not added twice.
+                            fresh = np.isin(ids[rows], cls._missing(held[target], ids[rows]))
+                            if fresh.any():
+                                calls.append((cls._clients[int(target)], "add", (vectors[rows][fresh], ids[rows][fresh])))
+                    if calls:
+                        cls._fan_out(calls)
+                    cls._clients[source].call("remove_ids", page.tolist())
+                    cls._generation += 1
+                cls._rebalance["moved"] += len(page)
+
+    @classmethod
+    def _drain(cls, layout: ShardLayout) -> None:
+        with cls._lock:
+            cls._write_layout(layout, layout.shards)
+            drained = cls._clients[layout.shards:]
+            cls._clients = cls._clients[:layout.shards]
+            cls._rebalancing = False
+        for client in drained:
+            process = cls._processes.pop(client.shard, None)
+            if process is None:
+                # A remote shard server: left running for its operator to retire.
+                client.close()
+                continue
+            cls._stop_local(client, process)
+            shutil.rmtree(os.path.join(settings.INDEX_SHARD_DIR, f"shard-{client.shard}"), ignore_errors=True)
+
+    @staticmethod
+    def _stop_local(client: ShardClient, process: subprocess.Popen) -> None:
+        try:
+            client.call("close")
+        except RuntimeError:
+            pass
+        client.close()
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+            process.wait(timeout=10)
+
+    @classmethod
+    def close(cls) -> None:
+        cls._stopping.set()
+        with cls._lock:
+            clients, cls._clients = cls._clients, []
+        for client in clients:
+            process = cls._processes.pop(client.shard, None)
+            if process is not None:
+                cls._stop_local(client, process)
+            else:
+                client.close()
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=False)
+            cls._pool = None
+
+
+def _shard_metrics() -> List[Family]:
+    if not ShardedIndex._clients:
+        return []
+    shards: List[Tuple[Dict[str, str], Dict[str, Any]]] = []
+    up: List[Tuple[Dict[str, str], float]] = []
+    for client in list(ShardedIndex._clients):
+        try:
+            info = client.call("info")
+        except RuntimeError:
+            up.append(({"shard": str(client.shard)}, 0.0))
+            continue
+        up.append(({"shard": str(client.shard)}, 1.0))
+        if "vectors" in info:
+            shards.append(({"shard": str(client.shard), "index_type": info["index_type"]}, info))
+    families = index_families(shards) if shards else []
+    families.append(("kb_index_shard_up", "gauge", "Whether the shard server answered.", up))
+    rebuild = ShardedIndex.rebuild_status() if len(shards) == len(up) else {"state": "unknown"}
+    families.append(
+        ("kb_index_rebuild_percent", "gauge", "Progress of a running rebuild.", [({"state": rebuild["state"]}, rebuild.get("percent") or 0.0)])
+    )
+    rebalance = ShardedIndex._rebalance
+    if rebalance.get("total"):
+        percent = 100.0 * rebalance["moved"] / rebalance["total"]
+        families.append(("kb_index_rebalance_percent", "gauge", "Progress of a shard rebalance.", [({"state": rebalance["state"]}, percent)]))
+    return families
+
+
+register_collector(_shard_metrics)
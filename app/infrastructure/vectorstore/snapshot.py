@@ -0,0 +1,226 @@
+from typing import Any, Callable, FrozenSet, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+
+from app.infrastructure.vectorstore.index_factory import build_index, search_parameters, supports_selectors
+
+# (queries, candidate ids, approximate scores) -> exact scores, one row per query.
+Rescorer = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+# Upper bound on candidates fetched per query when a filter cannot be pushed into the index.
+_MAX_POST_FILTER_FETCH = 65536
+
+
+def mutable_copy(index: faiss.Index) -> faiss.Index:
+    # clone_index keeps memory-mapped storage as a read-only view; a serialize round-trip always owns its data.
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def index_vectors(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    ids = faiss.vector_to_array(index.id_map).copy()
+    if not len(ids):
+        return ids, np.zeros((0, index.d), dtype=np.float32)
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        # The direct map is built on a private copy; `owner` keeps it alive while in use.
+        owner = mutable_copy(index)
+        inner = faiss.downcast_index(owner.index)
+        inner.make_direct_map(True)
+        return ids, inner.reconstruct_n(0, inner.ntotal)
+    return ids, inner.reconstruct_n(0, inner.ntotal)
+
+
+# A small exact index holding vectors added since the base was last merged.
+class DeltaSegment:
+    __slots__ = ("index", "ids")
+
+    def __init__(self, index: faiss.Index, ids: FrozenSet[int]) -> None:
+        self.index = index
+        self.ids = ids
+
+    @classmethod
+    def build(cls, dimension: int, vectors: np.ndarray, ids: np.ndarray) -> "DeltaSegment":
+        index = build_index(dimension, "flat")
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+        return cls(index, frozenset(ids.tolist()))
+
+    def without(self, ids: Set[int]) -> Optional["DeltaSegment"]:
+        keep = self.ids - ids
+        if not keep:
+            return None
+        copy = faiss.clone_index(self.index)
+        copy.remove_ids(faiss.IDSelectorBatch(np.array(sorted(self.ids & ids), dtype=np.int64)))
+        return DeltaSegment(copy, frozenset(keep))
+
+
+def coalesce(dimension: int, segments: List[DeltaSegment]) -> DeltaSegment:
+    parts = [index_vectors(segment.index) for segment in segments]
+    return DeltaSegment.build(dimension, np.vstack([v for _, v in parts]), np.concatenate([i for i, _ in parts]))
+
+
+def _build_selector(deleted: FrozenSet[int]) -> Tuple[Any, ...]:
+    if not deleted:
+        return (None,)
+    batch = faiss.IDSelectorBatch(np.fromiter(deleted, dtype=np.int64, count=len(deleted)))
+    return faiss.IDSelectorNot(batch), batch
+
+
+# An allow-list of ids as a FAISS bitmap selector (one bit per id up to the largest),
+# built once per filter and shared by concurrent searches.
+class AllowedIds:
+    __slots__ = ("count", "_bitmap", "selector")
+
+    def __init__(self, ids: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        self.count = int(len(ids))
+        size = int(ids.max()) + 1 if self.count else 0
+        bits = np.zeros(size, dtype=bool)
+        bits[ids] = True
+        # Kept referenced: the selector reads the buffer in place.
+        self._bitmap = np.packbits(bits, bitorder="little")
+        # The selector's length argument counts bytes, not bits.
+        self.selector = faiss.IDSelectorBitmap(len(self._bitmap), faiss.swig_ptr(self._bitmap))
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(self._bitmap, bitorder="little")).astype(np.int64)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        inside = (ids >= 0) & (ids < 8 * len(self._bitmap))
+        safe = np.where(inside, ids, 0)
+        return inside & ((self._bitmap[safe >> 3] >> (safe & 7)) & 1).astype(bool)
+
+
+# Immutable view served to readers. Searches never take a lock: writers build the
+# next snapshot and swap the class reference, and an old snapshot stays alive for
+# as long as any in-flight search still holds it.
+class IndexSnapshot:
+    __slots__ = ("base", "base_type", "deltas", "deleted", "generation", "_selector")
+
+    def __init__(
+        self,
+        base: faiss.Index,
+        base_type: str,
+        deltas: Tuple[DeltaSegment, ...],
+        deleted: FrozenSet[int],
+        generation: int,
+        selector: Any = None,
+    ) -> None:
+        self.base = base
+        self.base_type = base_type
+        self.deltas = deltas
+        self.deleted = deleted
+        self.generation = generation
+        # (selector, id batch): the batch must outlive the selector that points at it.
+        self._selector = selector if selector is not None else _build_selector(deleted)
+
+    @property
+    def delta_count(self) -> int:
+        return sum(segment.index.ntotal for segment in self.deltas)
+
+    @property
+    def ntotal(self) -> int:
+        return max(0, self.base.ntotal - len(self.deleted)) + self.delta_count
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        allowed: Optional[AllowedIds] = None,
+        rescore: Optional[Rescorer] = None,
+        candidates: int = 0,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # With `rescore`, the base returns `candidates` approximate hits per query whose
+        # scores are replaced by exact ones before merging with the (exact) delta segments.
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if allowed is not None and allowed.count == 0:
+            return np.full((len(queries), k), -np.inf, dtype=np.float32), np.full((len(queries), k), -1, dtype=np.int64)
+        fetch = max(k, candidates) if rescore is not None else k
+        if supports_selectors(self.base_type):
+            # Selectors are shared, but IndexIDMap2.search rewrites its params in place, so every
+            # search gets its own SearchParameters.
+            selector = self._selector[0]
+            if allowed is not None:
+                # Filters are applied inside the search, so k results are found among the allowed ids.
+                selector = faiss.IDSelectorAnd(allowed.selector, selector) if selector is not None else allowed.selector
+            params = search_parameters(self.base_type, selector) if selector is not None else None
+            distances, ids = self.base.search(queries, fetch, params=params)
+        else:
+            # Over-fetch in proportion to the filter's selectivity, then drop what it excludes.
+            if allowed is not None:
+                fetch = int(np.ceil(fetch * self.base.ntotal / allowed.count))
+            fetch = max(1, min(self.base.ntotal, _MAX_POST_FILTER_FETCH, fetch + len(self.deleted)))
+            distances, ids = self.base.search(queries, fetch)
+            keep = ids != -1
+            if allowed is not None:
+                keep &= allowed.contains(ids)
+            if self.deleted:
+                keep &= ~np.isin(ids, np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)))
+            ids = np.where(keep, ids, -1)
+        if rescore is not None:
+            distances = rescore(queries, ids, distances)
+        distances = np.where(ids == -1, -np.inf, distances).astype(np.float32)
+        if not self.deltas and distances.shape[1] == k:
+            return distances, ids
+        parts_d = [distances]
+        parts_i = [ids]
+        for segment in self.deltas:
+            delta_params = search_parameters("flat", allowed.selector) if allowed is not None else None
+            d, i = segment.index.search(queries, k, params=delta_params)
+            parts_d.append(np.where(i == -1, -np.inf, d))
+            parts_i.append(i)
+        all_d = np.hstack(parts_d)
+        all_i = np.hstack(parts_i)
+        order = np.argsort(-all_d, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(all_d, order, axis=1), np.take_along_axis(all_i, order, axis=1)
+
+
+# Mutable working copy a writer edits before publishing it as the next snapshot.
+class SnapshotDraft:
+    def __init__(
+        self,
+        dimension: int,
+        base: faiss.Index,
+        base_type: str,
+        deltas: Optional[List[DeltaSegment]] = None,
+        deleted: Optional[Set[int]] = None,
+    ) -> None:
+        self.dimension = dimension
+        self.base = base
+        self.base_type = base_type
+        self.deltas = list(deltas or [])
+        self.deleted = set(deleted or ())
+        self._selector: Any = None
+
+    @classmethod
+    def of(cls, dimension: int, snapshot: IndexSnapshot) -> "SnapshotDraft":
+        draft = cls(dimension, snapshot.base, snapshot.base_type, list(snapshot.deltas), set(snapshot.deleted))
+        # Adds never touch the base, so its selector carries over until the next remove.
+        draft._selector = snapshot._selector
+        return draft
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if len(ids):
+            self.deltas.append(DeltaSegment.build(self.dimension, vectors, ids))
+
+    def remove(self, ids: np.ndarray) -> None:
+        wanted = set(ids.tolist())
+        deltas: List[DeltaSegment] = []
+        for segment in self.deltas:
+            if segment.ids & wanted:
+                remaining = segment.without(wanted)
+                if remaining is not None:
+                    deltas.append(remaining)
+            else:
+                deltas.append(segment)
+        self.deltas = deltas
+        self._selector = None
+        # Ids that only lived in a delta segment are harmless here; the next merge drops them.
+        self.deleted |= wanted
+
+    def freeze(self, generation: int, max_segments: int) -> IndexSnapshot:
+        deltas = self.deltas
+        if len(deltas) > max(1, max_segments):
+            deltas = [coalesce(self.dimension, deltas)]
+        return IndexSnapshot(
+            self.base, self.base_type, tuple(deltas), frozenset(self.deleted), generation, self._selector
+        )
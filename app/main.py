@@ -1,13 +1,26 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.core.config import settings
 from app.core.db import Base, engine
-from app.infrastructure.embeddings.sentence_transformer_provider import get_embedding_dimension
-from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.core.executors import shutdown_executors
+from app.core.metrics import HTTP_ERRORS, HTTP_SECONDS, begin_request_timings
+from app.core.profiler import profiler
+from app.core.startup import startup
+from app.infrastructure.persistence.fts import ensure_chunk_fts
+from app.infrastructure.persistence.payload_store import close_payload_store, open_payload_store
+from app.infrastructure.embeddings.provider import get_embedding_dimension, warm_up
+from app.infrastructure.vectorstore.sharded_index import vector_index
+from app.application.services.qa_service import close_llm_client
+from app.application.services.search_service import warm_up_queries
 
 from app.api.routes.health import router as health_router
+from app.api.routes.index import router as index_router
 from app.api.routes.ingest import router as ingest_router
+from app.api.routes.metrics import router as metrics_router
 from app.api.routes.search import router as search_router
 from app.api.routes.qa import router as qa_router
 
@@ -21,10 +34,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Answered while the index and model are still loading.
+_ALWAYS_SERVED = ("/health", "/ready", "/stats", "/metrics", "/debug/", "/docs", "/redoc", "/openapi.json")
+
+
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    if startup.ready or request.url.path.startswith(_ALWAYS_SERVED):
+        return await call_next(request)
+    status = startup.status()
+    return JSONResponse(
+        {"detail": "Starting up" if status["state"] != "failed" else f"Startup failed: {status['error']}", **status},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    timings = begin_request_timings()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        # Route templates, not raw paths, keep the label set bounded.
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_SECONDS.observe(elapsed, method=request.method, route=path, status=status)
+        if status >= 500:
+            HTTP_ERRORS.inc(method=request.method, route=path, status=status)
+    if settings.SERVER_TIMING_HEADER:
+        # Search routes set their own breakdown; everything else reports the stages it went through.
+        entries = [response.headers["Server-Timing"]] if "Server-Timing" in response.headers else [
+            f"{name};dur={ms:.3f}" for name, ms in timings.items()
+        ]
+        entries.append(f"total;dur={elapsed * 1000.0:.3f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def _create_schema() -> None:
+    Base.metadata.create_all(bind=engine)
+    ensure_chunk_fts(engine)
+
+
+def _initialize_index() -> None:
+    vector_index().initialize(dimension=get_embedding_dimension())
+
+
 @app.on_event("startup")
 def on_startup() -> None:
-    Base.metadata.create_all(bind=engine)
-    VectorIndex.initialize(dimension=get_embedding_dimension())
+    # Interpreter start-up and imports, up to the first startup handler.
+    startup.record("boot", startup.since_created())
+    startup.run_phase("schema", _create_schema)
+    if settings.PROFILER_ENABLED:
+        profiler.start(settings.PROFILER_INTERVAL_MS)
+    # Loading overlaps: the payload store and index read from disk while the model loads.
+    startup.start(
+        [
+            [("payloads", open_payload_store), ("index", _initialize_index), ("model", warm_up)],
+            [("warmup", warm_up_queries)],
+        ],
+        background=settings.STARTUP_BACKGROUND,
+        # A failed warm-up only means colder first requests.
+        optional=("warmup",),
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    startup.join()
+    await close_llm_client()
+    profiler.stop()
+    vector_index().close()
+    shutdown_executors()
+    close_payload_store()
 
 
 # Routers
@@ -32,3 +120,5 @@ app.include_router(health_router)
 app.include_router(ingest_router)
 app.include_router(search_router)
 app.include_router(qa_router)
+app.include_router(index_router)
+app.include_router(metrics_router)
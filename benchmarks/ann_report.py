@@ -0,0 +1,103 @@
+"""Recall@k and latency of the ANN index modes against the exact flat baseline.
+
+    python -m benchmarks.ann_report --synthetic 200000 --dim 384
+    python -m benchmarks.ann_report --from-index data/index.faiss --modes flat,hnsw
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.infrastructure.vectorstore.index_factory import INDEX_TYPES, build_index, requires_training
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+
+
+def _synthetic(n: int, dim: int, seed: int) -> np.ndarray:
+    # Clustered data is closer to real embeddings than uniform noise, which flatters no index.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    assignment = rng.integers(0, len(centers), size=n)
+    return _normalize(centers[assignment] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)).astype(np.float32)
+
+
+def _from_index(path: str) -> np.ndarray:
+    index = faiss.read_index(path)
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map(True)
+    return inner.reconstruct_n(0, inner.ntotal).astype(np.float32)
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, List[float]]:
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies: List[float] = []
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, row = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        ids[i] = row[0]
+    return ids, latencies
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f.tolist()) & set(t.tolist()) - {-1}) for f, t in zip(found, truth))
+    return hits / float(truth.size)
+
+
+def run(vectors: np.ndarray, modes: List[str], k: int, num_queries: int, seed: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[query_rows])
+    ids = np.arange(len(vectors), dtype=np.int64)
+    report: Dict = {"n": int(len(vectors)), "dim": int(vectors.shape[1]), "k": k, "queries": int(len(queries)), "modes": {}}
+    truth = None
+    for mode in ["flat"] + [m for m in modes if m != "flat"]:
+        index = build_index(vectors.shape[1], mode)
+        started = time.perf_counter()
+        if requires_training(mode):
+            sample = vectors[rng.choice(len(vectors), size=min(settings.INDEX_TRAIN_SAMPLE, len(vectors)), replace=False)]
+            index.train(sample)
+        index.add_with_ids(vectors, ids)
+        build_seconds = time.perf_counter() - started
+        found, latencies = _timed_search(index, queries, k)
+        if truth is None:
+            truth = found
+        report["modes"][mode] = {
+            "recall_at_k": round(_recall(found, truth), 4),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+            "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": int(faiss.serialize_index(index).size),
+        }
+    return report
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, help="number of synthetic clustered vectors")
+    source.add_argument("--from-index", help="path of an existing index.faiss to read vectors from")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--modes", default=",".join(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=settings.TOP_K_DEFAULT)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    vectors = _synthetic(args.synthetic, args.dim, args.seed) if args.synthetic else _from_index(args.from_index)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    json.dump(run(vectors, modes, args.k, args.queries, args.seed), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
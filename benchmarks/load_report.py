@@ -0,0 +1,567 @@
+"""End-to-end load test on a synthetic corpus: ingest throughput, search and Q&A latency
+against concurrency, recall against exact search, memory footprint and startup time.
+
+    python -m benchmarks.load_report --chunks 10000,100000
+    python -m benchmarks.load_report --chunks 20000 --embedder torch --model sentence-transformers/paraphrase-MiniLM-L3-v2
+    python -m benchmarks.load_report --chunks 100000 --index-type hnsw --set HNSW_EF_SEARCH=128 --output hnsw.json
+    python -m benchmarks.load_report --chunks 100000 --baseline main.json --fail-on-regression
+    python -m benchmarks.load_report --url http://localhost:8000 --chunks 10000,50000
+
+In-process runs drive the ASGI app directly, in a child process with a fresh DATA_DIR per
+scale (settings are read at import), then time a cold start in another child against the
+populated data. --url drives a running server over HTTP instead: scales grow its corpus in
+place, so point it at a scratch deployment; recall and startup need the server's data and
+are left out. The default `hash` embedder (feature hashing, no model) isolates the index
+and storage from model inference. Corpus, queries and request order depend only on --seed.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+
+_SYLLABLES = (
+    "ka", "lo", "mi", "ne", "ru", "ta", "vi", "so", "pe", "da", "gu", "fo", "zi", "be", "ha", "tu",
+    "ri", "ma", "no", "se", "la", "ko", "ve", "di", "an", "or", "el", "is", "um", "ex",
+)
+_TOPICS = 64
+_TOPIC_WORDS = 200
+_COMMON_WORDS = 2000
+# Settings that would point a child at the caller's data instead of its scratch directory.
+_DATA_SETTINGS = (
+    "DB_PATH", "DATABASE_URL", "INDEX_PATH", "INDEX_META_PATH", "INDEX_WAL_PATH", "INDEX_EXACT_PATH",
+    "INDEX_REBUILD_DIR", "PAYLOAD_STORE_DIR", "VECTOR_CACHE_DIR",
+)
+# Report fields that describe the run rather than measure it.
+_UNCOMPARED = {"concurrency", "requests", "documents", "chunks_target", "chunks", "k", "queries", "samples"}
+_HIGHER_IS_BETTER = ("per_second", "recall", "throughput")
+
+
+class Corpus:
+    # Documents mix words from two of _TOPICS topic vocabularies with common words, so
+    # queries drawn from a topic have a meaningful neighbourhood under any embedder.
+    # Document i is the same text on every run with the same seed.
+    def __init__(self, seed: int, chunk_chars: int, chunks_per_doc: int) -> None:
+        rng = np.random.default_rng(seed)
+        words = set()
+        while len(words) < _COMMON_WORDS + _TOPICS * _TOPIC_WORDS:
+            words.add("".join(rng.choice(_SYLLABLES, size=int(rng.integers(2, 5)))))
+        vocabulary = np.array(sorted(words), dtype=object)
+        rng.shuffle(vocabulary)
+        self._common = vocabulary[:_COMMON_WORDS]
+        self._topics = vocabulary[_COMMON_WORDS:].reshape(_TOPICS, _TOPIC_WORDS)
+        self._seed = seed
+        self._words_per_doc = max(8, chunk_chars * chunks_per_doc // 7)
+
+    def _draw(self, rng: np.random.Generator, pool: np.ndarray, n: int) -> np.ndarray:
+        # Zipf-like: a few words per vocabulary dominate, as in real text.
+        ranks = np.minimum(rng.zipf(1.3, size=n) - 1, len(pool) - 1)
+        return pool[ranks]
+
+    def document(self, i: int) -> Tuple[str, str]:
+        rng = np.random.default_rng((self._seed, i))
+        main, second = rng.choice(_TOPICS, size=2, replace=False)
+        n = self._words_per_doc
+        source = rng.random(n)
+        words = np.where(
+            source < 0.55,
+            self._draw(rng, self._topics[main], n),
+            np.where(source < 0.7, self._draw(rng, self._topics[second], n), self._draw(rng, self._common, n)),
+        )
+        sentences = [" ".join(words[s:s + 12]) + "." for s in range(0, n, 12)]
+        return f"bench/{self._seed}/{i}", " ".join(sentences)
+
+    def queries(self, seed: int, n: int) -> List[str]:
+        # A stream apart from the documents', so query sets never line up with document numbers.
+        rng = np.random.default_rng((self._seed, 1_000_003, seed))
+        out = []
+        for _ in range(n):
+            topic = int(rng.integers(_TOPICS))
+            terms = list(self._draw(rng, self._topics[topic], int(rng.integers(3, 7)))) + list(self._draw(rng, self._common, 1))
+            out.append(" ".join(terms))
+        return out
+
+
+def _percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    arr = np.asarray(values)
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p90": round(float(np.percentile(arr, 90)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def _server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, rest = entry.strip().partition(";dur=")
+        if name and rest:
+            try:
+                stages[name] = float(rest)
+            except ValueError:
+                continue
+    return stages
+
+
+async def _scrape(client: httpx.AsyncClient) -> Dict[str, float]:
+    # Prometheus text from /metrics, summed over label sets per metric name.
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    totals: Dict[str, float] = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name = series.split("{", 1)[0]
+        try:
+            totals[name] = totals.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return totals
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 600.0) -> Dict[str, Any]:
+    # The server listens before its index and model are loaded; /ready says when it serves.
+    deadline = time.monotonic() + timeout
+    while True:
+        response = await client.get("/ready")
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 503 and response.json().get("state") == "failed":
+            raise RuntimeError(f"Server startup failed: {response.json().get('error')}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+        await asyncio.sleep(0.05)
+
+
+async def _ndjson(corpus: Corpus, first: int, stop: int) -> AsyncIterator[bytes]:
+    for i in range(first, stop):
+        uri, text = corpus.document(i)
+        yield (json.dumps({"uri": uri, "text": text}) + "\n").encode("utf-8")
+        if i % 64 == 0:
+            # Generating text is CPU work on the event loop; let the in-process server run too.
+            await asyncio.sleep(0)
+
+
+async def _ingest(client: httpx.AsyncClient, corpus: Corpus, first: int, stop: int, samples: int) -> Dict[str, Any]:
+    before = await _scrape(client)
+    started = time.perf_counter()
+    response = await client.post("/ingest/stream", content=_ndjson(corpus, first, stop))
+    seconds = time.perf_counter() - started
+    response.raise_for_status()
+    summary = response.json()
+    after = await _scrape(client)
+    chunks = int(after.get("kb_index_vectors", 0) - before.get("kb_index_vectors", 0))
+    # Single-document latency through /ingest/text, on documents past the streamed range.
+    latencies = []
+    for i in range(stop, stop + samples):
+        uri, text = corpus.document(i)
+        t0 = time.perf_counter()
+        (await client.post("/ingest/text", json={"uri": uri, "text": text})).raise_for_status()
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+    return {
+        "documents": stop - first,
+        "chunks": chunks,
+        "failed": summary.get("failed", 0),
+        "seconds": round(seconds, 3),
+        "documents_per_second": round((stop - first) / seconds, 1) if seconds else None,
+        "chunks_per_second": round(chunks / seconds, 1) if seconds else None,
+        "single_document_ms": {**_percentiles(latencies), "samples": len(latencies)},
+    }
+
+
+async def _sweep(
+    client: httpx.AsyncClient, path: str, payloads: List[Dict[str, Any]], concurrency: int, warmup: int
+) -> Dict[str, Any]:
+    for payload in payloads[:warmup]:
+        await client.post(path, json=payload)
+    pending = list(reversed(payloads[warmup:]))
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while pending:
+            payload = pending.pop()
+            t0 = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            if response.status_code != 200:
+                errors += 1
+                continue
+            for name, ms in _server_timing(response.headers.get("server-timing")).items():
+                stages.setdefault(name, []).append(ms)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_second": round(len(latencies) / seconds, 1) if seconds else None,
+        "latency_ms": _percentiles(latencies),
+        "server_timing_ms_mean": {name: round(float(np.mean(v)), 3) for name, v in sorted(stages.items())},
+    }
+
+
+def _payloads(endpoint: str, queries: List[str], k: int, mode: Optional[str]) -> Tuple[str, List[Dict[str, Any]]]:
+    if endpoint == "search":
+        return "/search", [{"query": q, "k": k, "mode": mode} for q in queries]
+    if endpoint == "qa":
+        return "/qa", [{"question": q, "k": k, "mode": mode} for q in queries]
+    raise ValueError(f"Unknown endpoint '{endpoint}', expected search or qa")
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    cfg: Dict[str, Any],
+    first_doc: int,
+    settle: Optional[Callable[[], Dict[str, Any]]] = None,
+    recall: Optional[Callable[[List[str], int], Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    corpus = Corpus(cfg["seed"], cfg["chunk_chars"], cfg["chunks_per_doc"])
+    stop = max(first_doc, math.ceil(cfg["chunks"] / cfg["chunks_per_doc"]))
+    result: Dict[str, Any] = {"chunks_target": cfg["chunks"]}
+    await _wait_ready(client)
+    result["ingest"] = await _ingest(client, corpus, first_doc, stop, cfg["ingest_samples"])
+    if settle is not None:
+        result["settle"] = await asyncio.to_thread(settle)
+    metrics = await _scrape(client)
+    result["index"] = {
+        "vectors": int(metrics.get("kb_index_vectors", 0)),
+        "memory_bytes": int(metrics.get("kb_index_memory_bytes", 0)),
+    }
+    result["latency"] = {}
+    total = cfg["requests"] + cfg["warmup"]
+    for e, endpoint in enumerate(cfg["endpoints"]):
+        levels: Dict[str, Any] = {}
+        for level, concurrency in enumerate(cfg["concurrency"]):
+            # Distinct queries per endpoint and level unless a pool is given, so the caches do not answer them all.
+            pool = cfg["query_pool"] or total
+            queries = corpus.queries(100 * e + level, pool)
+            queries = [queries[i % pool] for i in range(total)]
+            path, payloads = _payloads(endpoint, queries, cfg["k"], cfg["mode"])
+            levels[f"c{concurrency}"] = await _sweep(client, path, payloads, concurrency, cfg["warmup"])
+        result["latency"][endpoint] = levels
+    metrics = await _scrape(client)
+    result["memory"] = {
+        "resident_bytes": int(metrics.get("process_resident_memory_bytes", 0)),
+        "max_resident_bytes": int(metrics.get("process_max_resident_memory_bytes", 0)),
+        "index_bytes": int(metrics.get("kb_index_memory_bytes", 0)),
+    }
+    if recall is not None and cfg["recall_queries"]:
+        result["recall"] = await asyncio.to_thread(recall, corpus.queries(10_000, cfg["recall_queries"]), cfg["k"])
+    result["next_document"] = stop + cfg["ingest_samples"]
+    return result
+
+
+def _settle() -> Dict[str, Any]:
+    # Steady state for the sweeps: deltas merged and, for trained types, the migration done.
+    from app.infrastructure.vectorstore.faiss_index import VectorIndex
+
+    started = time.perf_counter()
+    VectorIndex.compact()
+    snapshot = VectorIndex._snapshot
+    return {"compact_seconds": round(time.perf_counter() - started, 3), "index_type": snapshot.base_type if snapshot else None}
+
+
+def _exact_recall(queries: List[str], k: int) -> Dict[str, Any]:
+    # Served top-k against a brute-force scan of every chunk vector, paged so memory stays
+    # flat. A served id counts as a hit when it scores at least the exact k-th score, so
+    # ties between equally similar chunks are not counted as misses.
+    from app.core.db import SessionLocal
+    from app.infrastructure.embeddings.provider import embed_texts
+    from app.infrastructure.embeddings.vector_cache import embed_texts_cached
+    from app.infrastructure.persistence.models import Chunk
+    from app.infrastructure.vectorstore.faiss_index import VectorIndex
+
+    query_vecs = np.ascontiguousarray(embed_texts(queries), dtype=np.float32)
+    started = time.perf_counter()
+    served = VectorIndex.search_ids_batch(query_vecs, k)
+    served_ms = (time.perf_counter() - started) * 1000.0
+    best = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    found_scores: Dict[int, np.ndarray] = {}
+    wanted = {cid for ids, _ in served for cid in ids}
+    last_id = 0
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        while True:
+            rows = (
+                session.query(Chunk.id, Chunk.content)
+                .filter(Chunk.id > last_id)
+                .order_by(Chunk.id.asc())
+                .limit(8192)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = int(rows[-1].id)
+            scores = query_vecs @ embed_texts_cached([r.content for r in rows]).T
+            best = -np.sort(-np.concatenate([best, scores], axis=1), axis=1)[:, :k]
+            for col, row in enumerate(rows):
+                if int(row.id) in wanted:
+                    found_scores[int(row.id)] = scores[:, col]
+    exact_seconds = time.perf_counter() - started
+    hits = 0
+    for q, (ids, _) in enumerate(served):
+        threshold = best[q, -1] - 1e-5
+        hits += sum(1 for cid in ids if cid in found_scores and found_scores[cid][q] >= threshold)
+    return {
+        "queries": len(queries),
+        "k": k,
+        "recall_at_k": round(hits / float(len(queries) * k), 4),
+        "served_batch_ms": round(served_ms, 3),
+        "exact_scan_seconds": round(exact_seconds, 3),
+    }
+
+
+async def _run_in_process(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return await _drive(client, cfg, 0, settle=_settle, recall=_exact_recall)
+
+
+async def _startup_probe() -> Dict[str, Any]:
+    # Cold start against the populated data: import, startup handlers (after which the server
+    # listens), loading and warm-up until /ready, then the first search.
+    started = time.perf_counter()
+    from app.main import app
+
+    imported = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        listening = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            readiness = await _wait_ready(client)
+            ready = time.perf_counter()
+            (await client.post("/search", json={"query": "cold start", "k": settings.TOP_K_DEFAULT})).raise_for_status()
+            first_search = time.perf_counter()
+            metrics = await _scrape(client)
+    return {
+        "import_seconds": round(imported - started, 3),
+        "startup_seconds": round(listening - imported, 3),
+        "ready_seconds": round(ready - imported, 3),
+        "phases_ms": {name: round(ms, 3) for name, ms in readiness["phases_ms"].items()},
+        "first_search_ms": round((first_search - ready) * 1000.0, 3),
+        "resident_bytes": int(metrics.get("process_resident_memory_bytes", 0)),
+    }
+
+
+def _child(mode: str, cfg: Dict[str, Any], env: Dict[str, str]) -> Tuple[Dict[str, Any], float]:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.load_report", mode, json.dumps(cfg)],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1]), time.perf_counter() - started
+
+
+def _child_env(data_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = {key: value for key, value in os.environ.items() if key not in _DATA_SETTINGS}
+    env["DATA_DIR"] = data_dir
+    env["EMBEDDING_BACKEND"] = args.embedder
+    # Keep ONNX exports out of the scratch directory so every scale does not re-export.
+    env.setdefault("ONNX_CACHE_DIR", os.path.abspath(settings.ONNX_CACHE_DIR))
+    if args.model:
+        env["EMBEDDING_MODEL"] = args.model
+    if args.index_type:
+        env["INDEX_TYPE"] = args.index_type
+    for override in args.set:
+        key, _, value = override.partition("=")
+        env[key.strip()] = value
+    return env
+
+
+def _git_revision() -> Optional[str]:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        revision = subprocess.run(
+            ["git", "-C", root, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "-C", root, "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(node: Any, path: str, out: Dict[str, float]) -> None:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            _flatten(value, f"{path}.{key}" if path else str(key), out)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool) and path.rsplit(".", 1)[-1] not in _UNCOMPARED:
+        out[path] = float(node)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    # Scales are matched by chunk target; a change beyond `tolerance` in the worse direction is a regression.
+    now: Dict[str, float] = {}
+    before: Dict[str, float] = {}
+    for report, flat in ((current, now), (baseline, before)):
+        for scale in report.get("scales", []):
+            _flatten({k: v for k, v in scale.items() if k != "next_document"}, f"chunks={scale.get('chunks_target')}", flat)
+    changes = []
+    for path in sorted(now.keys() & before.keys()):
+        old, new = before[path], now[path]
+        if old == 0:
+            continue
+        change = (new - old) / abs(old)
+        if abs(change) < tolerance:
+            continue
+        higher_is_better = any(marker in path for marker in _HIGHER_IS_BETTER)
+        changes.append({
+            "metric": path,
+            "baseline": old,
+            "current": new,
+            "change": round(change, 4),
+            "regression": change < 0 if higher_is_better else change > 0,
+        })
+    return {
+        "baseline_revision": baseline.get("meta", {}).get("revision"),
+        "tolerance": tolerance,
+        "regressions": sum(1 for c in changes if c["regression"]),
+        "changes": changes,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scales = sorted(int(s) for s in args.chunks.split(",") if s.strip())
+    cfg: Dict[str, Any] = {
+        "seed": args.seed,
+        "chunk_chars": args.chunk_chars,
+        "chunks_per_doc": args.chunks_per_doc,
+        "ingest_samples": args.ingest_samples,
+        "endpoints": [e.strip() for e in args.endpoints.split(",") if e.strip()],
+        "concurrency": [int(c) for c in args.concurrency.split(",") if c.strip()],
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "query_pool": args.query_pool,
+        "k": args.k,
+        "mode": args.mode,
+        "recall_queries": args.recall_queries,
+    }
+    report: Dict[str, Any] = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "transport": "http" if args.url else "asgi",
+            "url": args.url,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": args.embedder,
+            "model": args.model or settings.MODEL_NAME,
+            "index_type": args.index_type or settings.INDEX_TYPE,
+            "overrides": args.set,
+            **cfg,
+        },
+        "scales": [],
+    }
+    if args.url:
+        next_doc = 0
+
+        async def over_http(chunks: int) -> Dict[str, Any]:
+            async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+                return await _drive(client, {**cfg, "chunks": chunks}, next_doc)
+
+        for chunks in scales:
+            result = asyncio.run(over_http(chunks))
+            next_doc = result["next_document"]
+            report["scales"].append(result)
+        return report
+
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    for chunks in scales:
+        data_dir = tempfile.mkdtemp(prefix="kb-bench-", dir=args.work_dir)
+        try:
+            env = _child_env(data_dir, args)
+            result, _ = _child("--worker", {**cfg, "chunks": chunks}, env)
+            startup, wall = _child("--startup-probe", cfg, env)
+            result["startup"] = {**startup, "process_seconds": round(wall, 3)}
+            result["disk_bytes"] = sum(
+                os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(data_dir) for name in names
+            )
+            report["scales"].append(result)
+        finally:
+            if not args.keep_data:
+                shutil.rmtree(data_dir, ignore_errors=True)
+    return report
+
+
+def main(argv: List[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    # Child entry points: settings come from the environment the parent prepared.
+    if argv and argv[0] in ("--worker", "--startup-probe"):
+        cfg = json.loads(argv[1])
+        result = asyncio.run(_run_in_process(cfg) if argv[0] == "--worker" else _startup_probe())
+        sys.stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="10000", help="comma-separated corpus sizes in chunks")
+    parser.add_argument("--url", help="drive a running server over HTTP instead of the app in-process")
+    parser.add_argument("--embedder", default="hash", choices=("hash", "torch", "onnx"))
+    parser.add_argument("--model", help="EMBEDDING_MODEL for torch/onnx (a small one keeps runs short)")
+    parser.add_argument("--index-type", help="INDEX_TYPE for the run")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="extra setting for the app, repeatable")
+    parser.add_argument("--chunk-chars", type=int, default=max(1, settings.CHUNK_SIZE_CHARS - settings.CHUNK_OVERLAP_CHARS))
+    parser.add_argument("--chunks-per-doc", type=int, default=10)
+    parser.add_argument("--ingest-samples", type=int, default=20, help="documents timed one by one through /ingest/text")
+    parser.add_argument("--endpoints", default="search,qa")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=500, help="timed requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--query-pool", type=int, default=0, help="repeat queries from a pool of this size (0 = all distinct)")
+    parser.add_argument("--k", type=int, default=settings.TOP_K_DEFAULT)
+    parser.add_argument("--mode", choices=("vector", "lexical", "hybrid"))
+    parser.add_argument("--recall-queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="parent directory for per-scale data (default: system temp)")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported by --baseline")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
+    if args.fail_on_regression and report.get("comparison", {}).get("regressions"):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Chunk persistence cost: per-row ORM inserts vs. the bulk path, with and without SQLite tuning.
+
+    python -m benchmarks.persist_report --chunks 5000
+    python -m benchmarks.persist_report --chunks 5000 --documents 20 --chunk-chars 800
+    python -m benchmarks.persist_report --database-url postgresql+psycopg://kb:kb@localhost:5432/kb_bench
+
+With --database-url the tables are created in (and benchmark rows left in) that database,
+so point it at a scratch database. SQLite pragmas do not apply there.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.db import Base, _configure_sqlite
+from app.infrastructure.persistence.fts import ensure_chunk_fts
+from app.infrastructure.persistence.models import Chunk, Document
+from app.infrastructure.text.chunking import TextChunk
+from app.application.services.ingestion_service import _persist_chunks, _persist_document
+
+
+def _row_by_row(session: Session, sha256: str, chunks: List[TextChunk]) -> None:
+    # The write path before the bulk insert: commit + refresh for the document and every chunk.
+    doc = Document(uri=None, source_type="bench", sha256=sha256, num_chunks=len(chunks))
+    session.add(doc)
+    session.commit()
+    session.refresh(doc)
+    rows = []
+    for idx, chunk in enumerate(chunks):
+        row = Chunk(document_id=doc.id, chunk_index=idx, content=chunk.text, token_count=chunk.token_count)
+        session.add(row)
+        rows.append(row)
+    session.commit()
+    for row in rows:
+        session.refresh(row)
+
+
+def _bulk(session: Session, sha256: str, chunks: List[TextChunk]) -> None:
+    doc = _persist_document(session, uri=None, source_type="bench", sha256=sha256, num_chunks=len(chunks))
+    _persist_chunks(session, doc.id, chunks)
+    session.commit()
+
+
+def _measure(
+    write: Callable[[Session, str, List[TextChunk]], None],
+    tuned: bool,
+    documents: List[List[TextChunk]],
+    database_url: Optional[str] = None,
+) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(database_url or f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}")
+        if tuned and engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _configure_sqlite)
+        Base.metadata.create_all(bind=engine)
+        ensure_chunk_fts(engine)
+        statements = [0]
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _count(*_args) -> None:
+            statements[0] += 1
+
+        factory = sessionmaker(bind=engine)
+        started = time.perf_counter()
+        for i, chunks in enumerate(documents):
+            with factory() as session:
+                write(session, f"doc-{i}", chunks)
+        seconds = time.perf_counter() - started
+        engine.dispose()
+    total = sum(len(chunks) for chunks in documents)
+    return {
+        "seconds": round(seconds, 4),
+        "chunks_per_second": round(total / seconds, 1) if seconds else None,
+        "statements": statements[0],
+    }
+
+
+def run(num_chunks: int, num_documents: int, chunk_chars: int, database_url: Optional[str] = None) -> Dict:
+    per_doc = max(1, num_chunks // max(1, num_documents))
+    text = ("lorem ipsum dolor sit amet " * (chunk_chars // 27 + 1))[:chunk_chars]
+    documents = [[TextChunk(f"{d}:{i} {text}", len(text.split())) for i in range(per_doc)] for d in range(num_documents)]
+    report: Dict = {"documents": num_documents, "chunks_per_document": per_doc, "chunk_chars": chunk_chars, "paths": {}}
+    for name, write in (("row_by_row", _row_by_row), ("bulk", _bulk)):
+        if database_url:
+            report["paths"][name] = _measure(write, False, documents, database_url)
+            continue
+        for tuned in (False, True):
+            report["paths"][f"{name}{'_tuned' if tuned else '_default'}"] = _measure(write, tuned, documents)
+    return report
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="total chunks across all documents")
+    parser.add_argument("--documents", type=int, default=1)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--database-url", help="benchmark against this database instead of a temporary SQLite file")
+    args = parser.parse_args(argv)
+
+    json.dump(run(args.chunks, args.documents, args.chunk_chars, args.database_url), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Memory per vector and recall@k of the reduced-precision index types, with and without
+exact rescoring from the memory-mapped full-precision store.
+
+    python -m benchmarks.precision_report --synthetic 200000 --dim 384
+    python -m benchmarks.precision_report --from-index data/index.faiss --modes sq_int8,binary --factors 4,8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.infrastructure.vectorstore.exact_store import ExactVectors
+from app.infrastructure.vectorstore.index_factory import build_index, needs_rescore, requires_training
+from app.infrastructure.vectorstore.snapshot import IndexSnapshot
+from benchmarks.ann_report import _from_index, _recall, _synthetic
+
+PRECISION_TYPES = ("flat", "sq_fp16", "sq_int8", "binary")
+
+
+def _rescorer(exact: ExactVectors) -> Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]:
+    # Same scoring as the service: exact inner products for every candidate with a stored vector.
+    def rescore(queries: np.ndarray, ids: np.ndarray, approximate: np.ndarray) -> np.ndarray:
+        scores = np.empty(ids.shape, dtype=np.float32)
+        for row in range(len(ids)):
+            vectors, present = exact.read(ids[row])
+            scores[row] = np.where(present, vectors @ queries[row], -np.inf)
+        return scores
+
+    return rescore
+
+
+def _timed(search: Callable[[np.ndarray], np.ndarray], queries: np.ndarray, k: int) -> Tuple[np.ndarray, List[float]]:
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies: List[float] = []
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        row = search(queries[i:i + 1])
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        ids[i] = row[0]
+    return ids, latencies
+
+
+def _summary(found: np.ndarray, truth: np.ndarray, latencies: List[float]) -> Dict:
+    return {
+        "recall_at_k": round(_recall(found, truth), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+    }
+
+
+def run(vectors: np.ndarray, modes: List[str], factors: List[int], k: int, num_queries: int, seed: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    n, dim = vectors.shape
+    query_rows = rng.choice(n, size=min(num_queries, n), replace=False)
+    # Perturbed copies, so the stored vector itself is not a trivially exact hit.
+    queries = vectors[query_rows] + 0.1 * rng.standard_normal((len(query_rows), dim)).astype(np.float32)
+    queries = np.ascontiguousarray(queries / np.linalg.norm(queries, axis=1, keepdims=True), dtype=np.float32)
+    ids = np.arange(n, dtype=np.int64)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    report: Dict = {"n": int(n), "dim": int(dim), "k": k, "queries": int(len(queries)), "modes": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        exact = ExactVectors(os.path.join(directory, "exact.f32"), dim)
+        exact.put(ids, vectors)
+        rescore = _rescorer(exact)
+        for mode in ["flat"] + [m for m in modes if m != "flat"]:
+            index = build_index(dim, mode)
+            started = time.perf_counter()
+            if requires_training(mode):
+                index.train(vectors[rng.choice(n, size=min(settings.INDEX_TRAIN_SAMPLE, n), replace=False)])
+            index.add_with_ids(vectors, ids)
+            build_seconds = time.perf_counter() - started
+            snapshot = IndexSnapshot(index, mode, (), frozenset(), 0)
+            entry: Dict = {
+                "index_bytes_per_vector": round(faiss.serialize_index(index).size / float(n), 2),
+                "build_seconds": round(build_seconds, 3),
+            }
+            # Binary codes rank by Hamming distance; their raw order is what rescoring starts from.
+            found, latencies = _timed(lambda q: index.search(q, k)[1], queries, k)
+            entry["approximate"] = _summary(found, truth, latencies)
+            if mode != "flat":
+                entry["rescored"] = {}
+                for factor in factors:
+                    found, latencies = _timed(lambda q: snapshot.search(q, k, None, rescore, k * factor)[1], queries, k)
+                    entry["rescored"][str(factor)] = _summary(found, truth, latencies)
+                entry["always_rescored"] = needs_rescore(mode)
+            report["modes"][mode] = entry
+        exact.close()
+    report["exact_bytes_per_vector"] = 4 * dim
+    return report
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, help="number of synthetic clustered vectors")
+    source.add_argument("--from-index", help="path of an existing (uncompressed) index.faiss to read vectors from")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--modes", default=",".join(PRECISION_TYPES))
+    parser.add_argument("--factors", default="1,4,8,16", help="candidates fetched per result before rescoring")
+    parser.add_argument("--k", type=int, default=settings.TOP_K_DEFAULT)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    vectors = _synthetic(args.synthetic, args.dim, args.seed) if args.synthetic else _from_index(args.from_index)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    factors = [int(f) for f in args.factors.split(",") if f.strip()]
+    json.dump(run(vectors, modes, factors, args.k, args.queries, args.seed), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read from the environment at import time, so the test configuration has to
+# be in place before anything under app/ is imported: a throwaway data directory, the
+# deterministic hash embedder and a blocking startup.
+_DATA_DIR = tempfile.mkdtemp(prefix="kb-tests-")
+os.environ.update(
+    {
+        "DATA_DIR": _DATA_DIR,
+        "EMBEDDING_BACKEND": "hash",
+        "EMBEDDING_DIM": "64",
+        "STARTUP_BACKGROUND": "false",
+        "WARMUP_SAMPLE_QUERIES": "0",
+        "OPENAI_API_KEY": "test-key",
+    }
+)
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("INDEX_SHARDS", None)
+os.environ.pop("INDEX_SHARD_ADDRESSES", None)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,114 @@
+import json
+import uuid
+from typing import List
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.application.services import qa_service
+
+
+class FakeOpenAI:
+    # Chat completions answered by an httpx.MockTransport; every answer is numbered so a
+    # test can tell a fresh completion from a cached one.
+    def __init__(self) -> None:
+        self.prompts: List[str] = []
+        self.failing = False
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if self.failing:
+            return httpx.Response(500, json={"error": {"message": "upstream down"}})
+        body = json.loads(request.content)
+        self.prompts.append(body["messages"][-1]["content"])
+        answer = f"answer #{len(self.prompts)}"
+        if body.get("stream"):
+            events = [
+                {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                 "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                for piece in (answer[:3], answer[3:])
+            ]
+            stream = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=stream, headers={"content-type": "text/event-stream"})
+        return httpx.Response(
+            200,
+            json={
+                "id": "c",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            },
+        )
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    fake = FakeOpenAI()
+    client = AsyncOpenAI(
+        api_key="test-key",
+        base_url="http://fake-openai.test/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)),
+    )
+    monkeypatch.setattr(qa_service, "_llm_client", client)
+    return fake
+
+
+@pytest.fixture
+def uri(client):
+    uri = f"cache-{uuid.uuid4().hex[:8]}"
+    response = client.post("/ingest/text", json={"text": "Zebras sleep standing up in the savanna.", "uri": uri})
+    assert response.status_code == 200
+    return uri
+
+
+def _ask(client, question: str, uri: str, **extra) -> httpx.Response:
+    payload = {"question": question, "k": 3, "use_openai": True, "filters": {"uri_prefix": uri}, **extra}
+    return client.post("/qa", json=payload)
+
+
+def test_repeated_question_is_answered_from_the_cache(client, fake_openai, uri):
+    first = _ask(client, "How do zebras sleep?", uri).json()
+    second = _ask(client, "  How do   zebras sleep? ", uri).json()
+
+    assert first["answer"] == "answer #1" and first["cached"] is False
+    assert second["answer"] == "answer #1" and second["cached"] is True
+    assert len(fake_openai.prompts) == 1
+
+
+def test_changed_chunk_content_misses(client, fake_openai, uri):
+    _ask(client, "Where do zebras sleep?", uri)
+    client.post("/ingest/text", json={"text": "Zebras sleep lying down when the herd keeps watch.", "uri": uri})
+
+    again = _ask(client, "Where do zebras sleep?", uri).json()
+
+    assert again["cached"] is False and again["answer"] == "answer #2"
+    assert "lying down" in fake_openai.prompts[-1]
+
+
+def test_streamed_answer_fills_the_cache(client, fake_openai, uri):
+    streamed = _ask(client, "Do zebras stand while sleeping?", uri, stream=True)
+    assert streamed.status_code == 200
+    tokens = [
+        json.loads(line[len("data: "):])["text"]
+        for line in streamed.text.splitlines()
+        if line.startswith("data: ") and '"text"' in line
+    ]
+    assert "".join(tokens) == "answer #1"
+
+    cached = _ask(client, "Do zebras stand while sleeping?", uri).json()
+
+    assert cached["cached"] is True and cached["answer"] == "answer #1"
+    assert len(fake_openai.prompts) == 1
+
+
+def test_llm_failure_is_not_cached(client, fake_openai, uri):
+    fake_openai.failing = True
+    failed = _ask(client, "Are zebras nocturnal?", uri).json()
+    fake_openai.failing = False
+
+    retried = _ask(client, "Are zebras nocturnal?", uri).json()
+
+    assert failed["answer"].startswith("Retrieval-only fallback") and failed["cached"] is False
+    assert retried["cached"] is False and retried["answer"] == "answer #1"
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.infrastructure.embeddings.batcher import EmbeddingBatcher
+
+
+class Encoder:
+    # Records every encode() batch; `gate` holds a call until the test releases it.
+    def __init__(self) -> None:
+        self.batches: List[List[str]] = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        self.batches.append(list(texts))
+        self.entered.set()
+        assert self.gate.wait(5)
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def encoder():
+    return Encoder()
+
+
+def test_concurrent_calls_share_one_encode(encoder):
+    batcher = EmbeddingBatcher(encoder, max_batch_size=64, max_wait_ms=200)
+    futures = [batcher.submit(["x" * n]) for n in range(1, 6)]
+
+    results = [future.result(timeout=5) for future in futures]
+
+    assert [r[0][0] for r in results] == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert encoder.batches == [["x", "xx", "xxx", "xxxx", "xxxxx"]]
+
+
+def test_full_batch_runs_without_waiting(encoder):
+    batcher = EmbeddingBatcher(encoder, max_batch_size=2, max_wait_ms=10_000)
+
+    assert batcher.embed(["ab", "c"]).shape == (2, 2)
+
+
+def test_encode_errors_reach_every_caller():
+    def failing(texts: List[str]) -> np.ndarray:
+        raise RuntimeError("model unavailable")
+
+    batcher = EmbeddingBatcher(failing, max_batch_size=8, max_wait_ms=0)
+
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.embed(["a"])
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        batcher.embed(["b"])
+
+
+def _cancel_embed_async(batcher: EmbeddingBatcher, encoder: Encoder) -> None:
+    async def scenario() -> None:
+        task = asyncio.ensure_future(batcher.embed_async(["cancelled"]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_request_while_queued_does_not_stop_the_worker(encoder):
+    batcher = EmbeddingBatcher(encoder, max_batch_size=8, max_wait_ms=0)
+    encoder.gate.clear()
+    busy = batcher.submit(["busy"])
+    assert encoder.entered.wait(5)
+
+    _cancel_embed_async(batcher, encoder)
+    encoder.gate.set()
+
+    assert busy.result(timeout=5)[0][0] == 4.0
+    assert batcher.embed(["after"])[0][0] == 5.0
+    assert ["cancelled"] not in encoder.batches
+
+
+def test_cancelled_request_while_encoding_does_not_stop_the_worker(encoder):
+    batcher = EmbeddingBatcher(encoder, max_batch_size=8, max_wait_ms=0)
+    encoder.gate.clear()
+
+    _cancel_embed_async(batcher, encoder)
+    encoder.gate.set()
+
+    assert batcher.embed(["after"])[0][0] == 5.0
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_dead_worker_is_restarted():
+    class Crash(BaseException):
+        pass
+
+    calls = []
+
+    def crash_once(texts: List[str]) -> np.ndarray:
+        calls.append(texts)
+        if len(calls) == 1:
+            raise Crash()
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(crash_once, max_batch_size=8, max_wait_ms=0)
+    batcher.submit(["lost"])
+    batcher._thread.join(5)
+    assert not batcher._thread.is_alive()
+
+    assert batcher.embed(["again"]).shape == (1, 2)
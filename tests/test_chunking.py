@@ -0,0 +1,42 @@
+import hashlib
+
+import pytest
+
+from app.infrastructure.text.chunking import CharChunker
+from app.infrastructure.text.text_utils import chunk_text, clean_text
+
+TEXTS = [
+    "",
+    "short",
+    "The quick brown fox jumps over the lazy dog. " * 40,
+    "First paragraph\twith  tabs.\n\n\n  Second paragraph\nwrapped over lines.\n\n" * 15,
+    "ünïcödé tëxt — with em dashes and “quotes”. " * 25 + "\x00 trailing nul",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("size, overlap", [(50, 0), (64, 16), (200, 199), (1000, 100), (0, 0)])
+def test_char_chunker_matches_chunk_text(text, size, overlap):
+    chunks = [c.text for c in CharChunker(size, overlap).chunks([text])]
+
+    assert chunks == chunk_text(text, size, overlap)
+
+
+@pytest.mark.parametrize("text", TEXTS[2:])
+def test_streamed_pieces_chunk_like_the_whole_text(text):
+    # Pages of a PDF arrive as separate pieces; chunking must not depend on where they split.
+    pieces = [text[i:i + 97] for i in range(0, len(text), 97)]
+    split_paragraphs = [piece + "\n\n" for piece in pieces]
+
+    whole = [c.text for c in CharChunker(80, 20).chunks(["\n\n".join(split_paragraphs)])]
+    streamed = [c.text for c in CharChunker(80, 20).chunks(split_paragraphs)]
+
+    assert streamed == whole
+
+
+@pytest.mark.parametrize("text", TEXTS[1:])
+def test_hasher_sees_the_cleaned_text(text):
+    hasher = hashlib.sha256()
+    list(CharChunker(64, 8).chunks([text], hasher))
+
+    assert hasher.hexdigest() == hashlib.sha256(clean_text(text).encode("utf-8")).hexdigest()
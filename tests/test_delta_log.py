@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+
+from app.infrastructure.vectorstore.delta_log import OP_ADD, OP_REMOVE, DeltaLog
+
+
+def _vectors(count: int, dim: int = 4, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((count, dim), dtype=np.float32)
+
+
+def _opened(tmp_path) -> DeltaLog:
+    log = DeltaLog(str(tmp_path / "wal" / "index.wal"))
+    log.open()
+    return log
+
+
+def test_replay_returns_records_in_order(tmp_path):
+    log = _opened(tmp_path)
+    vectors = _vectors(3)
+    log.append_add(np.array([1, 2, 3]), vectors)
+    log.append_remove(np.array([2]))
+    log.close()
+
+    ops = list(DeltaLog(str(tmp_path / "wal" / "index.wal")).replay())
+
+    assert [op for op, _, _ in ops] == [OP_ADD, OP_REMOVE]
+    assert ops[0][1].tolist() == [1, 2, 3]
+    np.testing.assert_array_equal(ops[0][2], vectors)
+    assert ops[1][1].tolist() == [2] and ops[1][2] is None
+
+
+def test_torn_tail_is_dropped_and_the_next_open_starts_a_new_segment(tmp_path):
+    log = _opened(tmp_path)
+    log.append_add(np.array([1]), _vectors(1))
+    log.append_add(np.array([2]), _vectors(1, seed=1))
+    log.close()
+    (_, path), = log.segments()
+    # A crash halfway through the second record.
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    reopened = _opened(tmp_path)
+    reopened.append_add(np.array([3]), _vectors(1, seed=2))
+
+    assert [ids.tolist() for _, ids, _ in reopened.replay()] == [[1], [3]]
+    assert len(reopened.segments()) == 2
+
+
+def test_corrupt_record_ends_its_segment(tmp_path):
+    log = _opened(tmp_path)
+    log.append_add(np.array([1]), _vectors(1))
+    log.append_add(np.array([2]), _vectors(1, seed=1))
+    log.append_add(np.array([3]), _vectors(1, seed=2))
+    log.close()
+    (_, path), = log.segments()
+    record = os.path.getsize(path) // 3
+    with open(path, "r+b") as f:
+        f.seek(record + record - 1)
+        f.write(b"\xff")
+
+    assert [ids.tolist() for _, ids, _ in log.replay()] == [[1]]
+
+
+def test_drop_before_keeps_segments_written_after_rotate(tmp_path):
+    log = _opened(tmp_path)
+    log.append_remove(np.array([1]))
+    boundary = log.rotate()
+    log.append_remove(np.array([2]))
+
+    log.drop_before(boundary)
+
+    assert [ids.tolist() for _, ids, _ in log.replay()] == [[2]]
+    assert log.size_bytes() > 0
@@ -0,0 +1,152 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+onnx = pytest.importorskip("onnx")
+
+from onnx import TensorProto, helper  # noqa: E402
+from transformers import BertTokenizerFast  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.infrastructure.embeddings import onnx_provider  # noqa: E402
+
+_SCALE = [1.0, 2.0, 3.0]
+_VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "alpha", "beta", "gamma"]
+
+
+def _fake_export(directory: str) -> None:
+    # Stands in for the torch export: token embedding = token id * _SCALE, mean pooling.
+    os.makedirs(directory, exist_ok=True)
+    ids = helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"])
+    mask = helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])
+    out = helper.make_tensor_value_info("token_embeddings", TensorProto.FLOAT, ["batch", "sequence", len(_SCALE)])
+    graph = helper.make_graph(
+        [
+            helper.make_node("Unsqueeze", ["input_ids", "axis"], ["ids3"]),
+            helper.make_node("Cast", ["ids3"], ["ids3f"], to=TensorProto.FLOAT),
+            helper.make_node("Mul", ["ids3f", "scale"], ["token_embeddings"]),
+        ],
+        "fake",
+        [ids, mask],
+        [out],
+        initializer=[
+            helper.make_tensor("axis", TensorProto.INT64, [1], [2]),
+            helper.make_tensor("scale", TensorProto.FLOAT, [len(_SCALE)], _SCALE),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    onnx.save(model, os.path.join(directory, "model.onnx"))
+    with open(os.path.join(directory, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(_VOCAB) + "\n")
+    BertTokenizerFast(os.path.join(directory, "vocab.txt")).save_pretrained(directory)
+    meta = {
+        "model": settings.MODEL_NAME,
+        "inputs": ["input_ids", "attention_mask"],
+        "pooling": "mean",
+        "dimension": len(_SCALE),
+        "max_seq_length": 16,
+    }
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ONNX_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "MODEL_NAME", "org/model")
+    monkeypatch.setattr(settings, "ONNX_QUANTIZE", False)
+    monkeypatch.setattr(onnx_provider, "_session", None)
+    monkeypatch.setattr(onnx_provider, "_tokenizer", None)
+    monkeypatch.setattr(onnx_provider, "_meta", None)
+    exports = []
+
+    def _export(directory: str) -> None:
+        exports.append(directory)
+        _fake_export(directory)
+
+    monkeypatch.setattr(onnx_provider, "_export", _export)
+    return exports
+
+
+@pytest.mark.parametrize(
+    "config, mode",
+    [
+        ({"pooling_mode_cls_token": True, "pooling_mode_mean_tokens": False}, "cls"),
+        ({"pooling_mode_mean_tokens": True, "pooling_mode_max_tokens": False}, "mean"),
+        ({"pooling_mode_max_tokens": True, "word_embedding_dimension": 384}, "max"),
+    ],
+)
+def test_pooling_mode(config, mode):
+    assert onnx_provider._pooling_mode(config) == mode
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"pooling_mode_mean_tokens": True, "pooling_mode_max_tokens": True},
+        {"pooling_mode_mean_sqrt_len_tokens": True},
+        {"pooling_mode_weightedmean_tokens": True},
+    ],
+)
+def test_unsupported_pooling_mode(config):
+    with pytest.raises(ValueError):
+        onnx_provider._pooling_mode(config)
+
+
+def test_pool_ignores_padding():
+    tokens = np.array(
+        [
+            [[1.0, -1.0], [3.0, 5.0], [100.0, 100.0]],
+            [[2.0, 4.0], [-50.0, 50.0], [-50.0, 50.0]],
+        ],
+        dtype=np.float32,
+    )
+    mask = np.array([[1, 1, 0], [1, 0, 0]])
+
+    np.testing.assert_allclose(onnx_provider._pool(tokens, mask, "cls"), [[1.0, -1.0], [2.0, 4.0]])
+    np.testing.assert_allclose(onnx_provider._pool(tokens, mask, "mean"), [[2.0, 2.0], [2.0, 4.0]])
+    np.testing.assert_allclose(onnx_provider._pool(tokens, mask, "max"), [[3.0, 5.0], [2.0, 4.0]])
+
+
+def test_pool_max_of_negative_embeddings():
+    tokens = np.array([[[-3.0], [-1.0], [0.0]]], dtype=np.float32)
+
+    np.testing.assert_allclose(onnx_provider._pool(tokens, np.array([[1, 1, 0]]), "max"), [[-1.0]])
+
+
+def test_export_of_another_model_is_replaced(provider):
+    # "org:model" and "org/model" share an export directory.
+    directory = onnx_provider._export_dir()
+    _fake_export(directory)
+    with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+        stale = {**json.load(f), "model": "org:model", "dimension": 99}
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(stale, f)
+
+    assert onnx_provider.exported_meta() is None
+    assert onnx_provider.get_embedding_dimension() == len(_SCALE)
+    assert provider == [directory]
+    assert onnx_provider.exported_meta()["model"] == "org/model"
+
+
+def test_matching_export_is_reused(provider):
+    _fake_export(onnx_provider._export_dir())
+
+    assert onnx_provider.get_embedding_dimension() == len(_SCALE)
+    onnx_provider.encode(["alpha"])
+    assert provider == []
+
+
+def test_encode_mean_pools_in_input_order(provider):
+    vectors = onnx_provider.encode(["alpha beta gamma", "beta", "gamma alpha"], batch_size=2)
+
+    # [CLS]=2, alpha=4, beta=5, gamma=6, [SEP]=3; padding is masked out of the mean.
+    expected = np.array([(2 + 4 + 5 + 6 + 3) / 5, (2 + 5 + 3) / 3, (2 + 6 + 4 + 3) / 4])[:, None] * _SCALE
+    np.testing.assert_allclose(vectors, expected, rtol=1e-6)
+    assert provider == [onnx_provider._export_dir()]
@@ -0,0 +1,67 @@
+import uuid
+
+import pytest
+
+
+def _pdf(text: str) -> bytes:
+    # Smallest single-page PDF pypdf extracts text from; xref offsets are computed so it parses cleanly.
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def _ingest_file(client, name: str, data: bytes) -> dict:
+    response = client.post("/ingest/file", files={"file": (name, data, "application/pdf")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _ingest_bulk(client, name: str, data: bytes) -> dict:
+    response = client.post("/ingest/bulk", files=[("files", (name, data, "application/pdf"))])
+    assert response.status_code == 200, response.text
+    [document] = response.json()["documents"]
+    return document
+
+
+@pytest.fixture
+def pdf():
+    tag = uuid.uuid4().hex[:8]
+    return f"{tag}.pdf", _pdf(f"Quarterly report {tag} covers revenue and churn")
+
+
+def test_file_then_bulk_is_skipped(client, pdf):
+    name, data = pdf
+    first = _ingest_file(client, name, data)
+    assert first["status"] == "ingested"
+
+    second = _ingest_bulk(client, name, data)
+
+    assert second["status"] == "skipped"
+    assert second["document_id"] == first["document_id"]
+
+
+def test_bulk_then_file_is_skipped(client, pdf):
+    name, data = pdf
+    first = _ingest_bulk(client, name, data)
+    assert first["status"] == "ingested"
+
+    second = _ingest_file(client, name, data)
+
+    assert second["status"] == "skipped"
+    assert second["document_id"] == first["document_id"]
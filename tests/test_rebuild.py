@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+import uuid
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.infrastructure.embeddings.provider import embed_texts
+from app.infrastructure.persistence.models import Chunk, Document
+from app.infrastructure.vectorstore import rebuild
+from app.infrastructure.vectorstore.faiss_index import VectorIndex
+from app.application.services.search_service import _normalize_mode
+
+
+def _add_chunks(texts: List[str]) -> List[int]:
+    with SessionLocal() as session:
+        doc = Document(uri=f"rebuild-{uuid.uuid4().hex[:8]}", source_type="api", sha256=uuid.uuid4().hex, num_chunks=len(texts))
+        session.add(doc)
+        session.flush()
+        chunks = [Chunk(document_id=doc.id, chunk_index=i, content=text, token_count=2) for i, text in enumerate(texts)]
+        session.add_all(chunks)
+        session.commit()
+        return [int(c.id) for c in chunks]
+
+
+def _switch_model() -> None:
+    # The index on disk was written by another model of the same width.
+    VectorIndex.close()
+    with open(settings.INDEX_META_PATH, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["model"] = "old-model"
+    with open(settings.INDEX_META_PATH, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _wait_for(state: str) -> None:
+    for _ in range(200):
+        if VectorIndex.rebuild_status()["state"] == state:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"rebuild did not reach {state!r}: {VectorIndex.rebuild_status()}")
+
+
+@pytest.fixture
+def index(client, tmp_path, monkeypatch):
+    # Swap the session's index for a throwaway one; the session index is reopened afterwards.
+    dimension = VectorIndex._dim
+    VectorIndex.close()
+    path = str(tmp_path / "index.faiss")
+    monkeypatch.setattr(settings, "INDEX_PATH", path)
+    monkeypatch.setattr(settings, "INDEX_META_PATH", str(tmp_path / "index_meta.json"))
+    monkeypatch.setattr(settings, "INDEX_WAL_PATH", path + ".wal")
+    monkeypatch.setattr(settings, "INDEX_EXACT_PATH", path + ".exact")
+    monkeypatch.setattr(settings, "INDEX_REBUILD_DIR", path + ".rebuild")
+    monkeypatch.setattr(settings, "INDEX_REBUILD_BATCH", 8)
+    VectorIndex.initialize(dimension)
+    yield dimension
+    if VectorIndex._rebuild_job is not None and VectorIndex._rebuild_job.active:
+        _wait_for("failed")
+    VectorIndex.close()
+    VectorIndex._rebuild_job = None
+    monkeypatch.undo()
+    VectorIndex.initialize(dimension)
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # Holds every rebuild page until released.
+    released = threading.Event()
+    embed = rebuild.IndexRebuild._embed
+
+    def _embed(self, texts):
+        assert released.wait(10)
+        return embed(self, texts)
+
+    monkeypatch.setattr(rebuild.IndexRebuild, "_embed", _embed)
+    return released
+
+
+def test_stale_model_serves_lexical_until_the_swap(client, index, gate):
+    tag = uuid.uuid4().hex[:8]
+    _add_chunks([f"{tag} page {i} common" for i in range(20)])
+    _switch_model()
+    VectorIndex.initialize(index)
+
+    assert not VectorIndex.serves_current_model()
+    assert _normalize_mode("hybrid") == "lexical"
+    assert client.get("/ready").json().get("degraded")
+    stale = client.post("/completeness", json={"query": f"{tag} page", "k": 3}).json()
+    assert stale["available"] is False and stale["mode"] == "lexical" and stale["coverage"] is None
+
+    # A write for the new model stays out of the old vectors but reaches the rebuilt index.
+    text = f"{tag} fresh zebra"
+    [new_id] = _add_chunks([text])
+    vector = embed_texts([text])
+    generation = VectorIndex.generation()
+    VectorIndex.add(vector, [new_id])
+    assert new_id not in set(VectorIndex.ids().tolist())
+    assert VectorIndex.generation() > generation
+
+    gate.set()
+    _wait_for("done")
+
+    assert VectorIndex.serves_current_model()
+    assert _normalize_mode("hybrid") == "hybrid"
+    assert VectorIndex.search_ids(vector, 1)[0] == [new_id]
+    fresh = client.post("/completeness", json={"query": text, "k": 3}).json()
+    assert fresh["available"] is True and fresh["mode"] == "vector"
+
+
+def test_interrupted_rebuild_resumes_after_restart(index, monkeypatch):
+    tag = uuid.uuid4().hex[:8]
+    ids = _add_chunks([f"{tag} page {i} common" for i in range(40)])
+    _switch_model()
+    calls = {"n": 0}
+    embed = rebuild.IndexRebuild._embed
+
+    def _embed(self, texts):
+        calls["n"] += 1
+        if calls["n"] > 2:
+            raise RuntimeError("interrupted")
+        return embed(self, texts)
+
+    monkeypatch.setattr(rebuild.IndexRebuild, "_embed", _embed)
+    VectorIndex.initialize(index)
+    _wait_for("failed")
+    # Writes made while the rebuild is down are logged for it.
+    text = f"{tag} fresh zebra"
+    [new_id] = _add_chunks([text])
+    vector = embed_texts([text])
+    VectorIndex.add(vector, [new_id])
+    VectorIndex.remove_ids([ids[0]])
+
+    VectorIndex.close()
+    VectorIndex._rebuild_job = None
+    monkeypatch.setattr(rebuild.IndexRebuild, "_embed", embed)
+    VectorIndex.initialize(index)
+    assert not VectorIndex.serves_current_model()
+    _wait_for("done")
+
+    present = set(VectorIndex.ids().tolist())
+    assert VectorIndex.serves_current_model()
+    assert new_id in present and ids[0] not in present and set(ids[1:]) <= present
+    assert VectorIndex.search_ids(vector, 1)[0] == [new_id]
+
+    # The swapped-in index is the one the next start opens.
+    VectorIndex.close()
+    VectorIndex._rebuild_job = None
+    VectorIndex.initialize(index)
+    assert VectorIndex.serves_current_model()
+    assert VectorIndex.rebuild_status()["state"] == "idle"
+    assert VectorIndex.search_ids(vector, 1)[0] == [new_id]
+    assert np.isin(ids[1:], VectorIndex.ids()).all()
@@ -0,0 +1,32 @@
+import pytest
+
+from app.application.services.search_service import reciprocal_rank_fusion
+
+
+def test_ids_ranked_by_both_lists_come_first():
+    ids, scores = reciprocal_rank_fusion([([1, 2, 3], 1.0), ([3, 4, 1], 1.0)], top_k=4, rrf_k=60)
+
+    assert ids[:2] == [1, 3]
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == pytest.approx(1 / 61 + 1 / 63)
+
+
+def test_weights_scale_each_ranking():
+    vector, lexical = [10, 11], [20, 21]
+
+    ids, _ = reciprocal_rank_fusion([(vector, 1.0), (lexical, 3.0)], top_k=4, rrf_k=60)
+
+    assert ids == [20, 21, 10, 11]
+
+
+def test_top_k_truncates_and_ties_keep_first_seen_order():
+    ids, scores = reciprocal_rank_fusion([([5, 6, 7], 1.0), ([8, 9], 1.0)], top_k=3, rrf_k=10)
+
+    # 5 and 8 tie at rank 1; sorting is stable, so the first ranking wins the tie.
+    assert ids == [5, 8, 6]
+    assert scores[0] == scores[1]
+
+
+def test_empty_rankings_fuse_to_nothing():
+    assert reciprocal_rank_fusion([([], 1.0), ([], 1.0)], top_k=5, rrf_k=60) == ([], [])
+    assert reciprocal_rank_fusion([([4], 1.0), ([], 1.0)], top_k=5, rrf_k=60)[0] == [4]
@@ -0,0 +1,49 @@
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+from app.infrastructure.vectorstore.shard_server import ShardServer, parse_address
+
+AUTHKEY = b"test-shard-key"
+
+
+@pytest.fixture
+def server(client):
+    # A shard server over the test process's own index.
+    shard = ShardServer(("127.0.0.1", 0), AUTHKEY)
+    threading.Thread(target=shard.serve_forever, name="test-shard", daemon=True).start()
+    return shard
+
+
+def _call(address, method, *args, authkey=AUTHKEY):
+    with Client(address, authkey=authkey) as conn:
+        conn.send((method, args))
+        return conn.recv()
+
+
+def test_wrong_authkey_is_rejected_and_the_shard_keeps_serving(server):
+    with pytest.raises(AuthenticationError):
+        _call(server.address, "ids", authkey=b"wrong")
+
+    status, ids = _call(server.address, "ids")
+
+    assert status == "ok" and isinstance(ids, np.ndarray)
+
+
+def test_unknown_method_and_failures_come_back_as_errors(server):
+    assert _call(server.address, "drop_everything")[:2] == ("error", "ValueError")
+    # A query of the wrong width fails inside FAISS; the connection survives it.
+    status, kind, _ = _call(server.address, "search", np.zeros((1, 3), dtype=np.float32), 5, None)
+    assert status == "error" and kind
+
+    assert _call(server.address, "rebuild_status")[0] == "ok"
+
+
+def test_parse_address():
+    assert parse_address(" 10.0.0.5:7701 ") == ("10.0.0.5", 7701)
+    assert parse_address("[::1]:80") == ("[::1]", 80)
+    with pytest.raises(ValueError):
+        parse_address("no-port")
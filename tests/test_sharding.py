@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.infrastructure.embeddings.provider import embed_texts
+from app.infrastructure.persistence.models import Chunk, Document
+from app.infrastructure.vectorstore.partition import ShardLayout
+from app.infrastructure.vectorstore.sharded_index import ShardedIndex, _merge_rankings
+
+
+def _add_chunks(texts: List[str]) -> List[int]:
+    with SessionLocal() as session:
+        doc = Document(uri=f"shards-{uuid.uuid4().hex[:8]}", source_type="api", sha256=uuid.uuid4().hex, num_chunks=len(texts))
+        session.add(doc)
+        session.flush()
+        chunks = [Chunk(document_id=doc.id, chunk_index=i, content=text, token_count=2) for i, text in enumerate(texts)]
+        session.add_all(chunks)
+        session.commit()
+        return [int(c.id) for c in chunks]
+
+
+def _all_chunk_ids() -> np.ndarray:
+    with SessionLocal() as session:
+        return np.array(sorted(int(r[0]) for r in session.query(Chunk.id).all()), dtype=np.int64)
+
+
+def _wait_for_rebalance() -> None:
+    for _ in range(600):
+        if ShardedIndex._rebalance["state"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert ShardedIndex._rebalance["state"] == "done", ShardedIndex._rebalance
+
+
+def _assert_partitioned(layout: ShardLayout) -> None:
+    held = ShardedIndex._held_ids()
+    assert len(held) == layout.shards
+    for shard, ids in enumerate(held):
+        assert (layout.owners(ids) == shard).all()
+    assert np.array_equal(np.sort(np.concatenate(held)), _all_chunk_ids())
+
+
+def test_merge_keeps_the_best_score_of_duplicates():
+    parts = [
+        [([1, 2, 3], [0.9, 0.5, 0.1]), ([7], [0.3])],
+        [([4, 2], [0.8, 0.7]), ([8, 9], [0.6, 0.2])],
+    ]
+
+    merged = _merge_rankings(parts, rows=2, top_k=3)
+
+    assert merged == [([1, 4, 2], [0.9, 0.8, 0.7]), ([8, 7, 9], [0.6, 0.3, 0.2])]
+
+
+@pytest.mark.parametrize("layout", [ShardLayout(3, "mod"), ShardLayout(2, "range", 4)])
+def test_sql_clause_matches_owners(client, layout):
+    _add_chunks([f"clause {i}" for i in range(12)])
+    ids = _all_chunk_ids()
+
+    with SessionLocal() as session:
+        for shard in range(layout.shards):
+            rows = session.query(Chunk.id).filter(layout.clause(Chunk.id, shard)).all()
+            assert sorted(int(r[0]) for r in rows) == ids[layout.owners(ids) == shard].tolist()
+
+
+def test_layout_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        ShardLayout(0)
+    with pytest.raises(ValueError):
+        ShardLayout(2, "hash")
+    assert ShardLayout.from_json(ShardLayout(4, "range", 16).to_json()) == ShardLayout(4, "range", 16)
+
+
+@pytest.fixture
+def sharded(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INDEX_SHARD_DIR", str(tmp_path / "shards"))
+    monkeypatch.setattr(settings, "INDEX_SHARD_PARTITION", "mod")
+    monkeypatch.setattr(settings, "INDEX_REBUILD_BATCH", 16)
+
+    def start(shards: int) -> ShardLayout:
+        ShardedIndex.close()
+        monkeypatch.setattr(settings, "INDEX_SHARDS", shards)
+        ShardedIndex.initialize(settings.EMBEDDING_DIM)
+        _wait_for_rebalance()
+        return ShardLayout(shards, "mod")
+
+    yield start
+    ShardedIndex.close()
+
+
+def test_rebalance_fills_grows_and_drains(sharded):
+    tag = uuid.uuid4().hex[:8]
+    texts = [f"{tag} shard page {i}" for i in range(50)]
+    ids = _add_chunks(texts)
+    probe = embed_texts([texts[7]])
+
+    # First start in sharded mode: every chunk is routed from the chunks table to its owner.
+    layout = sharded(2)
+    _assert_partitioned(layout)
+    assert ShardedIndex.search_ids(probe, 1)[0] == [ids[7]]
+
+    # Growing moves only the chunks whose owner changed.
+    layout = sharded(3)
+    _assert_partitioned(layout)
+    assert ShardedIndex._rebalance["total"] == int((ShardLayout(2).owners(_all_chunk_ids()) != layout.owners(_all_chunk_ids())).sum())
+    assert ShardedIndex.search_ids(probe, 1)[0] == [ids[7]]
+
+    # Shrinking empties the shard that left the layout, then stops it and removes its files.
+    layout = sharded(2)
+    _assert_partitioned(layout)
+    assert len(ShardedIndex._clients) == 2
+    assert not os.path.exists(os.path.join(settings.INDEX_SHARD_DIR, "shard-2"))
+    assert ShardedIndex.search_ids(probe, 1)[0] == [ids[7]]
+
+    # Writes follow the layout, and a restart with an unchanged layout moves nothing.
+    [new_id] = _add_chunks([f"{tag} written later"])
+    ShardedIndex.add(embed_texts([f"{tag} written later"]), [new_id])
+    ShardedIndex.remove_ids([ids[0]])
+    ShardedIndex.close()
+    ShardedIndex.initialize(settings.EMBEDDING_DIM)
+    assert not ShardedIndex._rebalancing
+    held = ShardedIndex._held_ids()
+    assert new_id in held[new_id % 2] and ids[0] not in held[ids[0] % 2]
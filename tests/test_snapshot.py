@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from app.infrastructure.vectorstore.index_factory import build_index
+from app.infrastructure.vectorstore.snapshot import AllowedIds, SnapshotDraft
+
+DIM = 8
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def vectors():
+    return _unit(np.random.default_rng(7).standard_normal((40, DIM)))
+
+
+def _draft(vectors: np.ndarray, base_type: str = "flat") -> SnapshotDraft:
+    # Ids 0-29 in the base, 30-39 added afterwards as two delta segments.
+    base = build_index(DIM, base_type)
+    base.add_with_ids(vectors[:30], np.arange(30, dtype=np.int64))
+    draft = SnapshotDraft(DIM, base, base_type)
+    draft.add(vectors[30:35], np.arange(30, 35, dtype=np.int64))
+    draft.add(vectors[35:], np.arange(35, 40, dtype=np.int64))
+    return draft
+
+
+def _brute_force(vectors: np.ndarray, query: np.ndarray, live: set, k: int) -> list:
+    scores = vectors @ query
+    return [int(i) for i in np.argsort(-scores) if int(i) in live][:k]
+
+
+def test_search_merges_base_and_delta_segments(vectors):
+    snapshot = _draft(vectors).freeze(1, max_segments=4)
+    assert len(snapshot.deltas) == 2 and snapshot.ntotal == 40
+
+    _, ids = snapshot.search(vectors[[3, 33, 38]], 5)
+
+    for row, query in zip(ids.tolist(), vectors[[3, 33, 38]]):
+        assert row == _brute_force(vectors, query, set(range(40)), 5)
+
+
+@pytest.mark.parametrize("base_type", ["flat", "hnsw"])
+def test_removed_ids_never_come_back(vectors, base_type):
+    draft = _draft(vectors, base_type)
+    # One id from the base (tombstoned) and one from a delta segment (dropped from it).
+    draft.remove(np.array([3, 33], dtype=np.int64))
+    snapshot = draft.freeze(2, max_segments=4)
+
+    _, ids = snapshot.search(vectors[[3, 33]], 10)
+
+    assert 3 not in ids and 33 not in ids
+    assert 3 in snapshot.deleted
+    assert all(33 not in segment.ids for segment in snapshot.deltas)
+
+
+def test_published_snapshot_is_unaffected_by_later_writes(vectors):
+    draft = _draft(vectors)
+    published = draft.freeze(1, max_segments=4)
+    _, before = published.search(vectors[[33]], 3)
+
+    later = SnapshotDraft.of(DIM, published)
+    later.remove(np.array([33], dtype=np.int64))
+    later.add(vectors[:1] * -1, np.array([99], dtype=np.int64))
+    later.freeze(2, max_segments=4)
+
+    _, after = published.search(vectors[[33]], 3)
+    assert after.tolist() == before.tolist() and after[0][0] == 33
+
+
+def test_segments_beyond_the_limit_are_coalesced(vectors):
+    snapshot = _draft(vectors).freeze(1, max_segments=1)
+
+    assert len(snapshot.deltas) == 1 and snapshot.deltas[0].ids == frozenset(range(30, 40))
+    _, ids = snapshot.search(vectors[[36]], 1)
+    assert ids[0][0] == 36
+
+
+def test_filter_applies_to_base_and_deltas(vectors):
+    draft = _draft(vectors)
+    draft.remove(np.array([4], dtype=np.int64))
+    snapshot = draft.freeze(1, max_segments=4)
+    allowed = AllowedIds(np.array([2, 4, 31, 37], dtype=np.int64))
+
+    _, ids = snapshot.search(vectors[[4]], 4, allowed)
+
+    found = [i for i in ids[0].tolist() if i != -1]
+    assert sorted(found) == [2, 31, 37]
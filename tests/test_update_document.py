@@ -0,0 +1,109 @@
+import uuid
+from typing import Dict, List
+
+import pytest
+
+from app.core.db import SessionLocal
+from app.infrastructure.persistence.models import Chunk, Document
+from app.infrastructure.text.chunking import TextChunk
+from app.infrastructure.vectorstore.sharded_index import vector_index
+from app.application.services.ingestion_service import (
+    _index_chunks,
+    _persist_chunks,
+    _persist_document,
+    _update_document,
+)
+
+
+def _parts(*texts: str) -> List[TextChunk]:
+    return [TextChunk(text, len(text.split())) for text in texts]
+
+
+def _ingest(uri: str, parts: List[TextChunk]) -> int:
+    with SessionLocal() as session:
+        doc = _persist_document(session, uri=uri, source_type="api", sha256=uuid.uuid4().hex, num_chunks=len(parts))
+        ids = _persist_chunks(session, doc.id, parts)
+        session.commit()
+        _index_chunks(doc, ids, parts)
+        return int(doc.id)
+
+
+def _update(doc_id: int, parts: List[TextChunk]) -> dict:
+    with SessionLocal() as session:
+        doc = session.get(Document, doc_id)
+        return _update_document(session, doc, parts, uuid.uuid4().hex)
+
+
+def _rows(doc_id: int) -> Dict[str, tuple]:
+    # content -> (chunk id, chunk_index)
+    with SessionLocal() as session:
+        rows = session.query(Chunk.content, Chunk.id, Chunk.chunk_index).filter(Chunk.document_id == doc_id).all()
+    return {content: (int(cid), int(index)) for content, cid, index in rows}
+
+
+@pytest.fixture
+def doc(client):
+    tag = uuid.uuid4().hex[:8]
+    texts = [f"{tag} {name} chunk" for name in ("alpha", "beta", "gamma", "delta")]
+    return _ingest(f"doc-{tag}", _parts(*texts)), texts
+
+
+def test_identical_chunks_are_unchanged(doc):
+    doc_id, texts = doc
+    before = _rows(doc_id)
+
+    result = _update(doc_id, _parts(*texts))
+
+    assert result["changes"] == {"unchanged": 4, "moved": 0, "inserted": 0, "removed": 0}
+    assert _rows(doc_id) == before
+
+
+def test_insert_at_the_front_moves_the_rest_without_new_rows(doc):
+    doc_id, texts = doc
+    before = _rows(doc_id)
+
+    result = _update(doc_id, _parts("brand new opening", *texts))
+
+    assert result["changes"] == {"unchanged": 0, "moved": 4, "inserted": 1, "removed": 0}
+    after = _rows(doc_id)
+    for position, text in enumerate(texts, start=1):
+        assert after[text] == (before[text][0], position)
+    assert after["brand new opening"][1] == 0
+
+
+def test_replaced_chunk_is_removed_from_the_index(doc):
+    doc_id, texts = doc
+    before = _rows(doc_id)
+    index = vector_index()
+
+    result = _update(doc_id, _parts(texts[0], "rewritten second chunk", texts[2], texts[3]))
+
+    assert result["changes"] == {"unchanged": 3, "moved": 0, "inserted": 1, "removed": 1}
+    after = _rows(doc_id)
+    live = set(index.ids().tolist())
+    assert before[texts[1]][0] not in live
+    assert after["rewritten second chunk"][0] in live
+    assert {after[t][0] for t in (texts[0], texts[2], texts[3])} <= live
+
+
+def test_reordered_chunks_keep_one_match_and_replace_the_rest(doc):
+    doc_id, texts = doc
+    before = _rows(doc_id)
+
+    # The longest match is "alpha": it moves behind a re-inserted "gamma"; the tail goes.
+    result = _update(doc_id, _parts(texts[2], texts[0]))
+
+    assert result["changes"] == {"unchanged": 0, "moved": 1, "inserted": 1, "removed": 3}
+    after = _rows(doc_id)
+    assert set(after) == {texts[0], texts[2]}
+    assert after[texts[0]] == (before[texts[0]][0], 1)
+    assert after[texts[2]][1] == 0
+
+
+def test_moving_chunks_moves_the_index_generation(doc):
+    doc_id, texts = doc
+    generation = vector_index().generation()
+
+    _update(doc_id, _parts("new head", *texts))
+
+    assert vector_index().generation() > generation
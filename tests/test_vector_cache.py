@@ -0,0 +1,97 @@
+import hashlib
+import multiprocessing
+import os
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.infrastructure.embeddings.vector_cache import MmapVectorStore
+
+_DIM = 8
+
+
+def _key(n: int) -> bytes:
+    return hashlib.sha256(str(n).encode()).digest()
+
+
+def _vector(key: bytes) -> np.ndarray:
+    return np.frombuffer(hashlib.sha512(key).digest(), dtype=np.uint8)[:_DIM].astype(np.float32)
+
+
+def _vectors(keys: List[bytes]) -> np.ndarray:
+    return np.stack([_vector(k) for k in keys])
+
+
+def _writer(prefix: str, seed: int) -> None:
+    # Overlapping random key sets, so writers race on the same keys.
+    store = MmapVectorStore(prefix, 32)
+    rng = np.random.default_rng(seed)
+    for _ in range(100):
+        keys = [_key(int(n)) for n in rng.integers(0, 1000, 16)]
+        store.put(keys, _vectors(keys))
+        rows = store.lookup(keys)
+        assert (rows >= 0).all()
+        assert np.array_equal(store.read(rows), _vectors(keys))
+
+
+@pytest.fixture
+def prefix(tmp_path):
+    return str(tmp_path / "cache" / "model")
+
+
+def test_processes_share_one_store(prefix):
+    workers = [multiprocessing.Process(target=_writer, args=(prefix, seed)) for seed in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+
+    assert [worker.exitcode for worker in workers] == [0, 0, 0, 0]
+    store = MmapVectorStore(prefix, 32)
+    keys = list(store._rows)
+    # Every key is stored once, next to its own vector.
+    assert len(store) == len(keys) == os.path.getsize(prefix + ".keys") // 32
+    assert np.array_equal(store.read(store.lookup(keys)), _vectors(keys))
+
+
+def test_put_picks_up_rows_of_other_writers(prefix):
+    first, second = MmapVectorStore(prefix, 32), MmapVectorStore(prefix, 32)
+    keys = [_key(n) for n in range(4)]
+    first.put(keys[:3], _vectors(keys[:3]))
+    assert (second.lookup(keys) < 0).all()
+
+    second.put(keys[2:], _vectors(keys[2:]))
+
+    # Only the key neither had was appended, and the other writer's rows are now visible.
+    assert len(second) == 4 and os.path.getsize(prefix + ".keys") == 4 * 32
+    assert np.array_equal(second.read(second.lookup(keys)), _vectors(keys))
+
+
+def test_torn_append_is_cut_back_on_open(prefix):
+    keys = [_key(n) for n in range(3)]
+    MmapVectorStore(prefix, 32).put(keys, _vectors(keys))
+    # A writer died after its vectors were synced but before (all of) its keys were.
+    with open(prefix + ".f32", "ab") as f:
+        f.write(_vectors([_key(3), _key(4)]).tobytes() + b"\x00\x01")
+    with open(prefix + ".keys", "ab") as f:
+        f.write(_key(3)[:10])
+
+    store = MmapVectorStore(prefix, 32)
+
+    assert len(store) == 3
+    assert os.path.getsize(prefix + ".f32") == 3 * _DIM * 4
+    assert os.path.getsize(prefix + ".keys") == 3 * 32
+    more = [_key(n) for n in range(3, 6)]
+    store.put(more, _vectors(more))
+    reopened = MmapVectorStore(prefix, 32)
+    assert np.array_equal(reopened.read(reopened.lookup(keys + more)), _vectors(keys + more))
+
+
+def test_vectors_of_another_width_are_not_stored(prefix):
+    store = MmapVectorStore(prefix, 32)
+    store.put([_key(0)], _vectors([_key(0)]))
+
+    store.put([_key(1)], np.ones((1, _DIM + 1), dtype=np.float32))
+
+    assert len(store) == 1 and store.lookup([_key(1)])[0] == -1